@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Custom metric ingest benchmark.
+
+    Starts a stand-in for the Grok Custom Metric endpoint (a TCP server in a
+    separate process that counts the lines it receives), sends it a synthetic
+    stream of samples through each of the client's sending paths, and reports
+    lines/sec, send latency, and client CPU time and peak memory:
+
+      python benchmarks/ingest.py --samples=100000 --cardinality=1000
+
+    Modes:
+
+      connect    GrokSession.connect() per sample, as sample_collect_data.py
+      socket     one GrokSession.connect() socket, sendall() per sample
+      writer     GrokSession.writer(), i.e. a buffered CustomMetricWriter
+      aggregate  Aggregator in front of a CustomMetricWriter
+      sharded    ShardedWriter over two servers (two names for the stand-in)
+
+    Send latency is the time taken by each sendall(): one per sample for the
+    socket modes, one per buffer flush for the writers.  Each mode runs in its
+    own process, so that its peak memory isn't that of an earlier mode.
+"""
+import json
+from multiprocessing import Event, Pipe, Process, Value
+from optparse import OptionParser
+import os
+import resource
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from prettytable import PrettyTable
+
+from grokcli.aggregate import Aggregator
+from grokcli.api import GrokSession
+from grokcli.backfill import RateLimiter
+from grokcli.shard import ShardedWriter
+from grokcli.timings import Histogram
+
+
+
+MODES = ("connect", "socket", "writer", "aggregate", "sharded")
+
+parser = OptionParser(usage="%prog [options]", description=__doc__.strip())
+parser.add_option(
+  "--samples",
+  dest="samples",
+  default=100000,
+  type="int",
+  help="Samples to send per mode [default: %default]")
+parser.add_option(
+  "--cardinality",
+  dest="cardinality",
+  default=1000,
+  type="int",
+  help="Number of distinct metric names [default: %default]")
+parser.add_option(
+  "--rate",
+  dest="rate",
+  type="int",
+  help="Maximum samples per second [default: unlimited]")
+parser.add_option(
+  "--modes",
+  dest="modes",
+  default=",".join(mode for mode in MODES if mode != "connect"),
+  help="Comma-separated modes to run, from %s [default: %%default]"
+       % ", ".join(MODES))
+parser.add_option(
+  "--json",
+  dest="json",
+  action="store_true",
+  default=False,
+  help="Print results as JSON")
+
+
+
+def _serve(port, ready, lines):
+  """ Line-protocol server: count lines received on any connection """
+  server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+  server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+  server.bind(("127.0.0.1", 0))
+  server.listen(128)
+  port.value = server.getsockname()[1]
+  ready.set()
+
+  def receive(conn):
+    while True:
+      data = conn.recv(256 * 1024)
+      if not data:
+        break
+      count = data.count("\n")
+      with lines.get_lock():
+        lines.value += count
+    conn.close()
+
+  while True:
+    (conn, _) = server.accept()
+    thread = threading.Thread(target=receive, args=(conn,))
+    thread.daemon = True
+    thread.start()
+
+
+
+class LineServer(object):
+  """ Stand-in Custom Metric endpoint, run in a child process so that its CPU
+      time isn't counted against the client
+  """
+
+  def __init__(self):
+    self.port = Value("i", 0)
+    self.lines = Value("L", 0)
+    ready = Event()
+    self.process = Process(target=_serve, args=(self.port, ready, self.lines))
+    self.process.daemon = True
+    self.process.start()
+    ready.wait()
+
+
+  def waitFor(self, lines, timeout=60):
+    """ Wait until `lines` lines in total have been received """
+    deadline = time.time() + timeout
+    while self.lines.value < lines and time.time() < deadline:
+      time.sleep(0.001)
+    return self.lines.value
+
+
+  def stop(self):
+    self.process.terminate()
+
+
+
+def samples(count, cardinality, rate=None):
+  """ Yield `count` synthetic (name, value, timestamp) samples over
+      `cardinality` metric names, one second apart per name
+  """
+  names = ["bench.metric.%d" % i for i in xrange(cardinality)]
+  limiter = RateLimiter(rate) if rate else None
+  start = int(time.time()) - count // cardinality - 1
+
+  for i in xrange(count):
+    if limiter is not None and not i % 100:
+      limiter.acquire(100)
+    yield (names[i % cardinality], i % 97 * 1.5, start + i // cardinality)
+
+
+
+# Senders send a stream of samples, returning the number of lines sent and a
+# Histogram of the time taken by each send
+
+def sendConnect(grok, stream):
+  latency = Histogram()
+  lines = 0
+  for (name, value, timestamp) in stream:
+    start = time.time()
+    with grok.connect() as sock:
+      sock.sendall("%s %s %d\n" % (name, value, timestamp))
+    latency.add(time.time() - start)
+    lines += 1
+  return (lines, latency)
+
+
+def sendSocket(grok, stream):
+  latency = Histogram()
+  lines = 0
+  with grok.connect() as sock:
+    for (name, value, timestamp) in stream:
+      start = time.time()
+      sock.sendall("%s %s %d\n" % (name, value, timestamp))
+      latency.add(time.time() - start)
+      lines += 1
+  return (lines, latency)
+
+
+def _sendWriter(writer, stream, customMetricWriters):
+  """ Write stream to writer, returning the lines sent and the flush latency
+      of the CustomMetricWriters it sends through.  Write calls only append
+      to a buffer, so their latency says little about sending.
+  """
+  try:
+    for (name, value, timestamp) in stream:
+      writer.write(name, value, timestamp)
+  finally:
+    writer.close()
+
+  latency = Histogram()
+  for customMetricWriter in customMetricWriters:
+    latency.merge(customMetricWriter.flushLatency)
+
+  return (writer.stats()["linesSent"], latency)
+
+
+def sendWriter(grok, stream):
+  writer = grok.writer(spool=None)
+  return _sendWriter(writer, stream, [writer])
+
+
+def sendAggregate(grok, stream):
+  writer = grok.writer(spool=None)
+  return _sendWriter(Aggregator(writer, bucket=60), stream, [writer])
+
+
+def sendSharded(grok, stream):
+  writer = ShardedWriter(["http://127.0.0.1", "http://localhost"])
+  return _sendWriter(writer, stream, writer.writers.values())
+
+
+SENDERS = {
+  "connect": sendConnect,
+  "socket": sendSocket,
+  "writer": sendWriter,
+  "aggregate": sendAggregate,
+  "sharded": sendSharded}
+
+
+def run(server, mode, count, cardinality, rate=None):
+  """ Send `count` samples to server with `mode`, returning a dict of results
+  """
+  grok = GrokSession(server="http://127.0.0.1")
+
+  received = server.lines.value
+  usage = resource.getrusage(resource.RUSAGE_SELF)
+  start = time.time()
+
+  (sent, latency) = SENDERS[mode](grok, samples(count, cardinality, rate))
+  lines = server.waitFor(received + sent) - received
+
+  elapsed = time.time() - start
+  end = resource.getrusage(resource.RUSAGE_SELF)
+
+  return {
+    "mode": mode,
+    "samples": count,
+    "lines": lines,
+    "seconds": elapsed,
+    "samplesPerSecond": count / elapsed,
+    "p50": latency.percentile(50),
+    "p99": latency.percentile(99),
+    "cpuSeconds": ((end.ru_utime - usage.ru_utime) +
+                   (end.ru_stime - usage.ru_stime)),
+    "maxRSS": end.ru_maxrss}
+
+
+def _runChild(conn, *args):
+  try:
+    conn.send(run(*args))
+  finally:
+    conn.close()
+
+
+def runInProcess(*args):
+  """ run(*args) in a child process, so that the peak memory use it reports
+      is that of one mode alone
+  """
+  (receiver, sender) = Pipe(False)
+  process = Process(target=_runChild, args=(sender,) + args)
+  process.start()
+  sender.close()
+
+  try:
+    return receiver.recv()
+  except EOFError:
+    raise SystemExit("Mode %s failed" % args[1])
+  finally:
+    process.join()
+
+
+def main():
+  (options, args) = parser.parse_args()
+
+  modes = options.modes.split(",")
+  for mode in modes:
+    if mode not in SENDERS:
+      parser.error("Unknown mode: %s" % mode)
+
+  server = LineServer()
+  GrokSession.customMetricPort = server.port.value
+
+  try:
+    results = [runInProcess(server, mode, options.samples,
+                            options.cardinality, options.rate)
+               for mode in modes]
+  finally:
+    server.stop()
+
+  if options.json:
+    print json.dumps(results, indent=2)
+    return
+
+  table = PrettyTable(["mode", "samples/s", "lines received",
+                       "send p50 (us)", "send p99 (us)", "CPU (s)",
+                       "max RSS (KB)"])
+  for result in results:
+    table.add_row([result["mode"],
+                   "%.0f" % result["samplesPerSecond"],
+                   result["lines"],
+                   "%.1f" % (result["p50"] * 1e6),
+                   "%.1f" % (result["p99"] * 1e6),
+                   "%.2f" % result["cpuSeconds"],
+                   result["maxRSS"]])
+  table.align = "r"
+  table.align["mode"] = "l"
+  print table
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Serialization backend benchmark.
+
+    Encodes and decodes a synthetic export of model definitions with each
+    installed backend, as `grok export` and `grok import` do, and reports
+    the time taken and throughput:
+
+      python benchmarks/serialization.py --models=50000
+
+    Codecs:
+
+      json, simplejson, ujson  JSON backends (see grokcli.serialization)
+      yaml                     PyYAML's pure Python SafeLoader/SafeDumper
+      libyaml                  PyYAML's CSafeLoader/CSafeDumper
+"""
+import json
+from optparse import OptionParser
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from prettytable import PrettyTable
+
+from grokcli import serialization
+
+
+
+parser = OptionParser(usage="%prog [options]", description=__doc__.strip())
+parser.add_option(
+  "--models",
+  dest="models",
+  default=50000,
+  type="int",
+  help="Number of model definitions in the export [default: %default]")
+parser.add_option(
+  "--codecs",
+  dest="codecs",
+  help="Comma-separated codecs to run [default: all installed]")
+parser.add_option(
+  "--json",
+  dest="json",
+  action="store_true",
+  default=False,
+  help="Print results as JSON")
+
+
+
+def codecs():
+  """ Return a dict of installed codec name -> (loads, dumps) """
+  installed = {}
+
+  for name in serialization.availableJSONBackends():
+    (loads, dumps) = serialization.getJSONBackend(name)
+    # As written by `grok export`
+    installed[name] = (loads, lambda value, dumps=dumps: dumps(value, indent=2))
+
+  yaml = serialization.importYAML()
+  if yaml is not None:
+    installed["yaml"] = (
+      lambda text: yaml.load(text, Loader=yaml.SafeLoader),
+      lambda value: yaml.dump(value, Dumper=yaml.SafeDumper,
+                              default_flow_style=False))
+    if hasattr(yaml, "CSafeLoader"):
+      installed["libyaml"] = (
+        lambda text: yaml.load(text, Loader=yaml.CSafeLoader),
+        lambda value: yaml.dump(value, Dumper=yaml.CSafeDumper,
+                                default_flow_style=False))
+
+  return installed
+
+
+def models(count):
+  """ Return `count` synthetic model definitions, in the export format """
+  return [
+    {"datasource": "cloudwatch" if i % 2 else "custom",
+     "metricSpec": {
+       "region": "us-west-2",
+       "namespace": "AWS/EC2",
+       "metric": "CPUUtilization",
+       "dimensions": {"InstanceId": "i-%08x" % i}},
+     "modelParams": {
+       "min": 0.0,
+       "max": 100.0 + i % 7 * 0.5,
+       "resolution": 300},
+     "tags": ["bench", "model-%d" % i]}
+    for i in xrange(count)]
+
+
+def run(name, loads, dumps, data):
+  """ Encode and decode data with a codec, returning a dict of results """
+  start = time.time()
+  encoded = dumps(data)
+  encodeSeconds = time.time() - start
+
+  start = time.time()
+  decoded = loads(encoded)
+  decodeSeconds = time.time() - start
+
+  if len(decoded) != len(data):
+    raise AssertionError("%s decoded %d of %d models"
+                         % (name, len(decoded), len(data)))
+
+  megabytes = len(encoded) / 1e6
+  return {
+    "codec": name,
+    "models": len(data),
+    "bytes": len(encoded),
+    "encodeSeconds": encodeSeconds,
+    "decodeSeconds": decodeSeconds,
+    "encodeMBps": megabytes / encodeSeconds,
+    "decodeMBps": megabytes / decodeSeconds}
+
+
+def main():
+  (options, args) = parser.parse_args()
+
+  installed = codecs()
+  if options.codecs:
+    names = options.codecs.split(",")
+    for name in names:
+      if name not in installed:
+        parser.error("Codec not installed: %s" % name)
+  else:
+    names = sorted(installed)
+
+  data = models(options.models)
+  results = [run(name, installed[name][0], installed[name][1], data)
+             for name in names]
+
+  if options.json:
+    print json.dumps(results, indent=2)
+    return
+
+  table = PrettyTable(["codec", "size (MB)", "encode (s)", "encode MB/s",
+                       "decode (s)", "decode MB/s"])
+  for result in results:
+    table.add_row([result["codec"],
+                   "%.1f" % (result["bytes"] / 1e6),
+                   "%.2f" % result["encodeSeconds"],
+                   "%.1f" % result["encodeMBps"],
+                   "%.2f" % result["decodeSeconds"],
+                   "%.1f" % result["decodeMBps"]])
+  table.align = "r"
+  table.align["codec"] = "l"
+  print table
+
+
+if __name__ == "__main__":
+  main()
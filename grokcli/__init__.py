@@ -14,33 +14,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
 import os
-try:
-  import yaml
-except ImportError:
-  pass
 import sys
-from functools import partial
 from optparse import OptionParser
 
-import commands
+from commands import COMMANDS, loadCommand
 from exceptions import GrokCLIError
 import __version__
 
-
-availableCommands = __import__("grokcli.commands", globals(), locals(), ['*'])
-
-commands = dict([
-    (cmd, getattr(availableCommands, cmd))
-    for cmd in availableCommands.__all__
-  ])
+# Only the invoked command's module is imported, by main(); keep imports here
+# to the standard library so that `grok` starts quickly.
 
 usage = "%prog [command] [options]\n\n" \
         "Available commands:\n"
 
-for command in sorted(commands):
-  usage += "\n    " + command
+for command in sorted(COMMANDS):
+  usage += "\n    %-13s%s" % (command, COMMANDS[command])
 
 parser = OptionParser(usage=usage, version=__version__.__version__)
 
@@ -60,7 +49,39 @@ def main():
     print(__version__.__version__)
     sys.exit()
 
-  submodule = commands.get(subcommand, sys.modules[__name__])
+  if "GROK_CACHE_DIR" in os.environ:
+    from grokcli.api import GrokSession
+    from grokcli.cache import ResponseCache
+    GrokSession.cache = ResponseCache(os.environ["GROK_CACHE_DIR"])
+
+  if "GROK_MODEL_INDEX" in os.environ:
+    from grokcli.api import GrokSession
+    GrokSession.modelIndexPath = os.environ["GROK_MODEL_INDEX"]
+
+  if "GROK_SPOOL_DIR" in os.environ:
+    from grokcli.api import GrokSession
+    GrokSession.spoolDirectory = os.environ["GROK_SPOOL_DIR"]
+
+  if "GROK_JSON_BACKEND" in os.environ:
+    from grokcli import serialization
+    try:
+      serialization.setJSONBackend(os.environ["GROK_JSON_BACKEND"])
+    except (ImportError, ValueError) as e:
+      print >> sys.stderr, "ERROR: GROK_JSON_BACKEND:", e
+      sys.exit(1)
+
+  # --timings is accepted by every command
+  timings = None
+  if "--timings" in sys.argv:
+    from grokcli.api import GrokSession
+    from grokcli.timings import Timings
+    timings = GrokSession.timings = Timings()
+    sys.argv = [arg for arg in sys.argv if arg != "--timings"]
+
+  try:
+    submodule = loadCommand(subcommand)
+  except KeyError:
+    submodule = sys.modules[__name__]
 
   (options, args) = submodule.parser.parse_args(sys.argv[1:])
 
@@ -69,15 +90,21 @@ def main():
   except GrokCLIError as e:
     print >> sys.stderr, "ERROR:", e.message
     sys.exit(1)
+  finally:
+    if timings is not None:
+      timings.report(sys.stderr)
+
+
+def load(text):
+  """ Decode a JSON or YAML document, see grokcli.serialization.load() """
+  from grokcli.serialization import load
+  return load(text)
 
 
-# Use yaml by default, if it's available
-if "yaml" in sys.modules:
-  load = yaml.safe_load
-  dump = partial(yaml.safe_dump, default_flow_style=False)
-else:
-  load = json.loads
-  dump = partial(json.dumps, indent=2)
+def dump(value):
+  """ Encode value as YAML or JSON, see grokcli.serialization.dump() """
+  from grokcli.serialization import dump
+  return dump(value)
 
 
 def getCommonArgs(parser, args):
@@ -0,0 +1,189 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Client-side aggregation of custom metric samples.  See Aggregator. """
+
+
+
+class _Accumulator(object):
+  """ State of one metric's current bucket.  `value` is the running total for
+      mean and sum, and the min, max or last value otherwise.  A count of 0
+      means the bucket starting at `start` has already been emitted.
+  """
+  __slots__ = ("start", "count", "value")
+
+  def __init__(self, start, value):
+    self.start = start
+    self.count = 1
+    self.value = value
+
+
+
+def _add(acc, value):
+  acc.value += value
+
+def _min(acc, value):
+  if value < acc.value:
+    acc.value = value
+
+def _max(acc, value):
+  if value > acc.value:
+    acc.value = value
+
+def _last(acc, value):
+  acc.value = value
+
+
+# method: (update accumulator with a sample, accumulator's output value)
+METHODS = {
+  "mean": (_add, lambda acc: float(acc.value) / acc.count),
+  "sum": (_add, lambda acc: acc.value),
+  "min": (_min, lambda acc: acc.value),
+  "max": (_max, lambda acc: acc.value),
+  "last": (_last, lambda acc: acc.value)}
+
+
+
+class Aggregator(object):
+  """ Groups samples per metric into `bucket`-second time buckets and writes
+      one sample per bucket to `downstream` (e.g. a CustomMetricWriter), at
+      the bucket's start time:
+
+        with Aggregator(grok.writer(), bucket=300, method="mean") as writer:
+          writer.write("{metric name}", value, timestamp)
+
+      Only one small accumulator per metric is kept in memory.  A metric's
+      bucket is written when a sample for a later bucket of that metric
+      arrives, once samples a full bucket later have arrived for any metric,
+      or on flush()/close().  Samples for a bucket that has already been
+      written are dropped and counted in `samplesLate`.
+
+      Not thread-safe; write from a single thread.
+  """
+
+  bucket = 300
+  method = "mean"
+
+
+  def __init__(self, downstream, bucket=None, method=None):
+    self.downstream = downstream
+
+    if bucket is not None:
+      self.bucket = bucket
+    if method is not None:
+      self.method = method
+
+    if self.method not in METHODS:
+      raise ValueError("Invalid aggregation method: %r" % self.method)
+
+    (self._update, self._output) = METHODS[self.method]
+
+    self.samplesIn = 0
+    self.samplesOut = 0
+    self.samplesLate = 0
+
+    self._series = {}
+    self._watermark = None
+    self._nextSweep = None
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+  def _emit(self, name, acc):
+    self.downstream.write(name, self._output(acc), acc.start)
+    self.samplesOut += 1
+    acc.count = 0
+
+
+  def _sweep(self, before):
+    """ Write buckets starting before `before`, and forget metrics whose last
+        bucket was written over a bucket ago
+    """
+    expired = before - self.bucket
+    for name, acc in self._series.items():
+      if acc.start < before:
+        if acc.count:
+          self._emit(name, acc)
+        elif acc.start < expired:
+          del self._series[name]
+
+
+  def write(self, name, value, timestamp):
+    """ Add a sample """
+    self.samplesIn += 1
+    start = timestamp - timestamp % self.bucket
+
+    acc = self._series.get(name)
+    if acc is None:
+      self._series[name] = _Accumulator(start, value)
+    elif acc.start == start:
+      if acc.count:
+        acc.count += 1
+        self._update(acc, value)
+      else:
+        self.samplesLate += 1
+    elif acc.start < start:
+      if acc.count:
+        self._emit(name, acc)
+      acc.start = start
+      acc.count = 1
+      acc.value = value
+    else:
+      self.samplesLate += 1
+
+    if self._watermark is None or start > self._watermark:
+      self._watermark = start
+      if self._nextSweep is None:
+        self._nextSweep = start + self.bucket
+      elif start >= self._nextSweep:
+        # Allow a bucket's grace for samples of other metrics that lag behind
+        self._sweep(start - self.bucket)
+        self._nextSweep = start + self.bucket
+
+
+  def flush(self):
+    """ Write all buckets that have ended, then flush downstream """
+    if self._watermark is not None:
+      self._sweep(self._watermark)
+    self.downstream.flush()
+
+
+  def close(self):
+    """ Write all pending buckets, including incomplete ones, and close
+        downstream
+    """
+    try:
+      for name, acc in self._series.iteritems():
+        if acc.count:
+          self._emit(name, acc)
+      self._series.clear()
+    finally:
+      self.downstream.close()
+
+
+  def stats(self):
+    """ Return downstream's stats, plus the aggregation counters """
+    stats = dict(self.downstream.stats())
+    stats.update({
+      "samplesIn": self.samplesIn,
+      "samplesOut": self.samplesOut,
+      "samplesLate": self.samplesLate})
+    return stats
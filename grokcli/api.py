@@ -13,7 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
+from multiprocessing.pool import ThreadPool
+import Queue
 from requests.sessions import Session
 from requests.models import Request, Response
 from requests.exceptions import (
@@ -25,7 +26,14 @@ from urlparse import urlparse
 from grokcli.exceptions import (
   GrokCLIError,
   InvalidGrokHostError,
-  InvalidCredentialsError)
+  InvalidCredentialsError,
+  ModelNotFoundError)
+from grokcli.index import ModelIndex
+from grokcli.jsonstream import iterJSONArray
+from grokcli.serialization import dumpJSON, loadJSON
+from grokcli.spool import Spool
+from grokcli.timings import TimedHTTPAdapter
+from grokcli.writer import CustomMetricWriter
 
 
 
@@ -57,6 +65,30 @@ class GrokCustomContextManager(socket.socket):
 class GrokSession(Session):
   server = "https://localhost"
 
+  # Optional grokcli.cache.ResponseCache for list endpoint responses
+  cache = None
+
+  # Optional grokcli.timings.Timings to record request timings in
+  timings = None
+
+  # Optional path at which to persist modelIndex between processes
+  modelIndexPath = None
+
+  # TCP port of the Custom Metric endpoint
+  customMetricPort = 2003
+
+  # Optional directory of a grokcli.spool.Spool that writer() falls back to
+  # while the Custom Metric endpoint is unreachable
+  spoolDirectory = None
+
+  # Size of the blocks in which streamed responses are read and decoded
+  streamChunkSize = 64 * 1024
+
+  # Optional requests HTTPAdapter shared by all sessions, so that sessions
+  # created by successive commands in one process reuse the same keep-alive
+  # connections.  See `grok shell`.
+  adapter = None
+
 
   @property
   def apikey(self):
@@ -69,7 +101,8 @@ class GrokSession(Session):
     self.auth = (value, None)
 
 
-  def __init__(self, server=None, apikey=None, *args, **kwargs):
+  def __init__(self, server=None, apikey=None, cache=None, timings=None,
+               *args, **kwargs):
     super(GrokSession, self).__init__(*args, **kwargs)
 
     if server is not None:
@@ -78,21 +111,117 @@ class GrokSession(Session):
     if apikey is not None:
       self.apikey = apikey
 
+    if cache is not None:
+      self.cache = cache
+
+    if timings is not None:
+      self.timings = timings
+
+    adapter = self.adapter or TimedHTTPAdapter()
+    self.mount("https://", adapter)
+    self.mount("http://", adapter)
+
+    self._modelIndex = None
+
     self.verify = False
 
 
+  def _send(self, *args, **kwargs):
+    if self.cache is not None:
+      return self.cache.request(self, *args, **kwargs)
+    return self.request(*args, **kwargs)
+
+
+  def _json(self, response):
+    if self.timings is not None:
+      return self.timings.timeDecode(response, loadJSON)
+    return loadJSON(response.text)
+
+
+  def _iterJSON(self, response):
+    """ Decode a streamed JSON array response one item at a time """
+    items = iterJSONArray(response.iter_content(self.streamChunkSize))
+    if self.timings is not None:
+      return self.timings.timeStreamDecode(response, items)
+    return items
+
+
   def _request(self, *args, **kwargs):
     try:
-      return self.request(*args, **kwargs)
+      if self.timings is not None:
+        return self.timings.timeRequest(self._send, *args, **kwargs)
+      return self._send(*args, **kwargs)
     except ConnectionError as e:
       if hasattr(e.args[0], "reason"):
         if isinstance(e.args[0].reason, socket.gaierror):
           if e.args[0].reason.args[0] == socket.EAI_NONAME:
             raise InvalidGrokHostError("Invalid hostname")
+      raise GrokCLIError("Unable to connect to {0}: {1}".format(self.server, e))
     except (InvalidURL, MissingSchema) as e:
       raise InvalidGrokHostError("Invalid hostname")
 
 
+  def call(self, method, url, **kwargs):
+    """ Request any url of the server, e.g. for `grok GET`, with the same
+        response cache, timings and error handling as the API methods
+    """
+    return self._request(method=method, url=url, **kwargs)
+
+
+  @property
+  def modelIndex(self):
+    """ grokcli.index.ModelIndex of the server's models.  Built from
+        listModels() on first use, or loaded from the snapshot at
+        modelIndexPath if there is one, and kept up to date by this session's
+        createModel(s)/deleteModel() calls.
+    """
+    if self._modelIndex is None:
+      self._modelIndex = ModelIndex.build(self, self.modelIndexPath)
+    return self._modelIndex
+
+
+  def _invalidateModelIndex(self):
+    """ Discard the model index after a change that creates or deletes models
+        as a side effect
+    """
+    if self.modelIndexPath is not None:
+      ModelIndex(path=self.modelIndexPath).delete()
+    self._modelIndex = None
+
+
+  def findModels(self, datasource, name=None, server=None):
+    """ Find models by datasource and name and/or server using modelIndex.  If
+        nothing matches in a persisted index, it is rebuilt from the server in
+        case the model was created by another client.
+    """
+    models = self.modelIndex.find(datasource, name=name, server=server)
+
+    if not models and not self.modelIndex.fresh:
+      self._invalidateModelIndex()
+      models = self.modelIndex.find(datasource, name=name, server=server)
+
+    return models
+
+
+  def deleteFoundModel(self, datasource, name=None, server=None):
+    """ Delete the first model found by findModels(), returning it, or None if
+        no model matches.  If a persisted index still lists a model that was
+        deleted by another client, the index is rebuilt and the lookup retried.
+    """
+    while True:
+      models = self.findModels(datasource, name=name, server=server)
+      if not models:
+        return None
+
+      try:
+        self.deleteModel(models[0]["uid"])
+        return models[0]
+      except ModelNotFoundError:
+        if self.modelIndex.fresh:
+          raise
+        self._invalidateModelIndex()
+
+
   def connect(self):
     """ Helper function for establishing a socket connection to Grok Custom
         Metric endpoint given a GrokSession instance.  Use as a Context Manager
@@ -104,7 +233,27 @@ class GrokSession(Session):
             sock.sendall("{metric name} {metric value} {unix timestamp}\n")
     """
     parseResult = urlparse(self.server)
-    return GrokCustomContextManager(parseResult.netloc, 2003)
+    return GrokCustomContextManager(parseResult.hostname,
+                                    self.customMetricPort)
+
+
+  def writer(self, **kwargs):
+    """ Return a grokcli.writer.CustomMetricWriter for the Grok Custom Metric
+        endpoint of this server, for sending large numbers of samples over
+        one persistent, buffered connection:
+
+          with grok.writer() as writer:
+            writer.write("{metric name}", value, timestamp)
+
+        kwargs are passed through to CustomMetricWriter.  Unless a spool is
+        given, one in spoolDirectory is used if set.
+    """
+    if "spool" not in kwargs and self.spoolDirectory:
+      kwargs["spool"] = Spool(self.spoolDirectory)
+
+    parseResult = urlparse(self.server)
+    return CustomMetricWriter(parseResult.hostname, self.customMetricPort,
+                              **kwargs)
 
 
   def verifyCredentials(self, aws_access_key_id, aws_secret_access_key, **kwargs):
@@ -116,12 +265,12 @@ class GrokSession(Session):
     response = self._request(
       method="POST",
       url=self.server + "/_auth",
-      data=json.dumps(data),
+      data=dumpJSON(data),
       allow_redirects=False,
       **kwargs)
 
     if response.status_code == 200:
-      result = json.loads(response.text)
+      result = self._json(response)
       if result["result"] == "success":
         return result["apikey"]
     elif 300 <= response.status_code < 400:
@@ -142,7 +291,7 @@ class GrokSession(Session):
     response = self._request(
       method="POST",
       url=url,
-      data=json.dumps(settings),
+      data=dumpJSON(settings),
       auth=self.auth,
       **kwargs)
 
@@ -161,7 +310,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list metric datasources.", response)
 
@@ -175,7 +324,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list metrics.", response)
 
@@ -200,7 +349,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list metrics.", response)
 
@@ -214,21 +363,26 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list metrics.", response)
 
 
-  def listModels(self, **kwargs):
-
+  def listModels(self, stream=False, **kwargs):
+    """ List models.  With stream=True, returns an iterator that decodes and
+        yields one model at a time as the response is received.
+    """
     response = self._request(
       method="GET",
       url=self.server + "/_models",
       auth=self.auth,
+      stream=stream,
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      if stream:
+        return self._iterJSON(response)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list models.", response)
 
@@ -242,7 +396,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list instances.", response)
 
@@ -256,7 +410,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list instances.", response)
 
@@ -270,21 +424,26 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to list autostacks.", response)
 
 
-  def exportModels(self, **kwargs):
-
+  def exportModels(self, stream=False, **kwargs):
+    """ Export model definitions.  With stream=True, returns an iterator that
+        decodes and yields one model at a time as the response is received.
+    """
     response = self._request(
       method="GET",
       url=self.server + "/_models/export",
       auth=self.auth,
+      stream=stream,
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      if stream:
+        return self._iterJSON(response)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to export models.", response)
 
@@ -298,7 +457,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to export model.", response)
 
@@ -310,12 +469,16 @@ class GrokSession(Session):
     response = self._request(
       method="POST",
       url=url,
-      data=json.dumps(nativeMetric),
+      data=dumpJSON(nativeMetric),
       auth=self.auth,
       **kwargs)
 
     if response.status_code == 201:
-      return json.loads(response.text)
+      models = self._json(response)
+      if self._modelIndex is not None:
+        for model in models:
+          self._modelIndex.add(model)
+      return models
 
     raiseError(GrokCLIError, "Unable to create models.", response)
 
@@ -326,12 +489,16 @@ class GrokSession(Session):
     response = self._request(
       method="POST",
       url=url,
-      data=json.dumps(nativeMetric),
+      data=dumpJSON(nativeMetric),
       auth=self.auth,
       **kwargs)
 
     if response.status_code == 201:
-      return json.loads(response.text)
+      models = self._json(response)
+      if self._modelIndex is not None:
+        for model in models:
+          self._modelIndex.add(model)
+      return models
 
     raiseError(GrokCLIError, "Unable to create model.", response)
 
@@ -347,13 +514,14 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      self._invalidateModelIndex()
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to create instance.", response)
 
 
   def previewAutostack(self, region, filters, **kwargs):
-    params = "?region={0}&filters={1}".format(region, json.dumps(filters))
+    params = "?region={0}&filters={1}".format(region, dumpJSON(filters))
     url = self.server + "/_autostacks/preview_instances" + params
 
     response = self._request(
@@ -363,7 +531,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to preview autostack.", response)
 
@@ -379,19 +547,19 @@ class GrokSession(Session):
     response = self._request(
       method="POST",
       url=url,
-      data=json.dumps(stack),
+      data=dumpJSON(stack),
       auth=self.auth,
       **kwargs)
 
     if response.status_code == 201:
-      return json.loads(response.text)
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to create autostack.", response)
 
 
   def addMetricToAutostack(self, stackID, metricNamespace, metricName, **kwargs):
     url = self.server + "/_autostacks/" + stackID + "/metrics"
-    data = json.dumps([{ "namespace": metricNamespace, "metric": metricName }])
+    data = dumpJSON([{ "namespace": metricNamespace, "metric": metricName }])
 
     response = self._request(
       method="POST",
@@ -401,6 +569,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 201:
+      self._invalidateModelIndex()
       return
 
     raiseError(GrokCLIError, "Unable to add metric to autostack.", response)
@@ -415,8 +584,18 @@ class GrokSession(Session):
       auth=self.auth,
       **kwargs)
 
+    if response.status_code in (200, 404):
+      # Either way, the model no longer exists
+      if self._modelIndex is not None:
+        self._modelIndex.remove(metricID)
+      elif self.modelIndexPath is not None:
+        ModelIndex.recordRemoval(self.modelIndexPath, metricID)
+
     if response.status_code == 200:
-      return json.loads(response.text)
+      return self._json(response)
+
+    if response.status_code == 404:
+      raiseError(ModelNotFoundError, "Model not found.", response)
 
     raiseError(GrokCLIError, "Unable to delete model.", response)
 
@@ -427,12 +606,13 @@ class GrokSession(Session):
     response = self._request(
       method="DELETE",
       url=url,
-      data=json.dumps([serverName]),
+      data=dumpJSON([serverName]),
       auth=self.auth,
       **kwargs)
 
     if response.status_code == 200:
-      return json.loads(response.text)
+      self._invalidateModelIndex()
+      return self._json(response)
 
     raiseError(GrokCLIError, "Unable to delete instance.", response)
 
@@ -447,6 +627,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 204:
+      self._invalidateModelIndex()
       return
 
     raiseError(GrokCLIError, "Unable to delete autostack.", response)
@@ -462,6 +643,7 @@ class GrokSession(Session):
       **kwargs)
 
     if response.status_code == 204:
+      self._invalidateModelIndex()
       return
 
     raiseError(GrokCLIError, "Unable to remove metric from autostack.",
@@ -470,12 +652,178 @@ class GrokSession(Session):
 
 
 def raiseError(error, message, response):
-  raise error("{0}\nMessage: {1}".format(message, response.text))
+  """ Raise `error` for an unexpected response, which is kept as its
+      `response` attribute
+  """
+  exception = error("{0}\nMessage: {1}".format(message, response.text))
+  exception.response = response
+  raise exception
+
+
+
+def _applyToItem(func, item):
+  """ Worker side of AsyncGrokSession.imapUnordered().  Exceptions are
+      returned rather than raised so that one failure doesn't abort the batch.
+  """
+  try:
+    return (item, func(item), None)
+  except Exception as e:
+    return (item, None, e)
+
+
+
+class AsyncGrokSession(object):
+  """ Concurrent counterpart to GrokSession.  Every GrokSession API method is
+      available with the same signature, but is dispatched to a pool of worker
+      threads sharing one GrokSession (and therefore one connection pool) and
+      returns a multiprocessing.pool.AsyncResult.  Call .get() on the result to
+      wait for the response, or to re-raise the GrokCLIError that the
+      synchronous call would have raised:
+
+        with AsyncGrokSession(server="...", apikey="...") as grok:
+          pending = [grok.deleteModel(uid) for uid in uids]
+          for result in pending:
+            result.get()
+  """
+
+  concurrency = 8
+
+  # Upper bound on the time to wait for a single result.  Queue.get() without
+  # a timeout can't be interrupted by Ctrl-C under Python 2.
+  _WAIT_TIMEOUT = 60 * 60 * 24
+
+
+  def __init__(self, server=None, apikey=None, concurrency=None,
+               session=None):
+    if concurrency is not None:
+      self.concurrency = concurrency
+
+    if session is None:
+      session = GrokSession(server=server, apikey=apikey)
+
+    self.session = session
+
+    # Size the connection pool so that every worker can keep its own
+    # keep-alive connection to the server
+    adapter = TimedHTTPAdapter(pool_connections=self.concurrency,
+                               pool_maxsize=self.concurrency)
+    self.session.mount("https://", adapter)
+    self.session.mount("http://", adapter)
+
+    self._pool = ThreadPool(self.concurrency)
+
+
+  @property
+  def server(self):
+    return self.session.server
+
+
+  @property
+  def apikey(self):
+    return self.session.apikey
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+  def close(self):
+    """ Wait for outstanding requests, then release the worker threads """
+    self._pool.close()
+    self._pool.join()
+
+
+  def apply(self, func, *args, **kwargs):
+    """ Run func(*args, **kwargs) on the worker pool, returning an AsyncResult
+    """
+    return self._pool.apply_async(func, args, kwargs)
+
+
+  def imapUnordered(self, func, iterable):
+    """ Call func(item) for each item on the worker pool, yielding
+        (item, result, error) tuples in completion order.  At most
+        `concurrency` items are read ahead of the caller, so iterable may be an
+        arbitrarily large generator:
+
+          deleteModel = grok.session.deleteModel
+          for (uid, _, error) in grok.imapUnordered(deleteModel, uids):
+            ...
+    """
+    results = Queue.Queue()
+    items = iter(iterable)
+    pending = 0
+    exhausted = False
+
+    while True:
+      while not exhausted and pending < self.concurrency:
+        try:
+          item = next(items)
+        except StopIteration:
+          exhausted = True
+        else:
+          self._pool.apply_async(_applyToItem, (func, item),
+                                 callback=results.put)
+          pending += 1
+
+      if not pending:
+        return
+
+      yield results.get(True, self._WAIT_TIMEOUT)
+      pending -= 1
+
+
+  def connect(self):
+    """ See GrokSession.connect() """
+    return self.session.connect()
+
+
+
+def _asyncMethod(name):
+  def method(self, *args, **kwargs):
+    return self.apply(getattr(self.session, name), *args, **kwargs)
+
+  method.__name__ = name
+  method.__doc__ = (" Asynchronous GrokSession.%s(), returns an AsyncResult "
+                    % name)
+  return method
+
+
+for _name in (
+    "verifyCredentials",
+    "updateSettings",
+    "listMetricDatasources",
+    "listMetrics",
+    "listCloudwatchMetrics",
+    "listAutostackMetrics",
+    "listModels",
+    "listInstances",
+    "listAutostackInstances",
+    "listAutostacks",
+    "exportModels",
+    "exportModel",
+    "createModels",
+    "createModel",
+    "createInstance",
+    "previewAutostack",
+    "createAutostack",
+    "addMetricToAutostack",
+    "deleteModel",
+    "deleteInstance",
+    "deleteAutostack",
+    "removeMetricFromAutostack"):
+  setattr(AsyncGrokSession, _name, _asyncMethod(_name))
+del _name
 
 
 
 __all__ = [
+  "AsyncGrokSession",
   "GrokCLIError",
   "GrokSession",
   "InvalidGrokHostError",
-  "InvalidCredentialsError"]
+  "InvalidCredentialsError",
+  "ModelNotFoundError"]
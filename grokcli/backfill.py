@@ -0,0 +1,198 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Backfill of historical custom metric data from CSV and NumPy files.  Data
+    is read and encoded in column batches; see backfill().
+"""
+import csv
+import math
+import time
+
+try:
+  import numpy
+except ImportError:
+  numpy = None # .npy/.npz input not available
+
+
+
+def readCSV(fp, counters, batchSize):
+  """ Yield (timestamps, values) batches of timestamp,value CSV rows.  A
+      header row is skipped; other rows that can't be parsed, or whose value
+      is NaN, are skipped and counted.
+  """
+  timestamps = []
+  values = []
+
+  for (lineno, row) in enumerate(csv.reader(fp)):
+    if not row:
+      continue
+
+    counters.read += 1
+    try:
+      if len(row) != 2:
+        raise ValueError(row)
+      timestamp = int(float(row[0]))
+      value = float(row[1])
+      if math.isnan(value):
+        raise ValueError(row)
+    except ValueError:
+      if lineno == 0:
+        counters.read -= 1 # Header
+      else:
+        counters.skipped += 1
+      continue
+
+    timestamps.append(timestamp)
+    values.append(value)
+
+    if len(timestamps) >= batchSize:
+      yield (timestamps, values)
+      timestamps = []
+      values = []
+
+  if timestamps:
+    yield (timestamps, values)
+
+
+def _numpyColumns(path):
+  """ Return (timestamps, values) arrays from a .npy file holding a structured
+      array with "timestamp" and "value" fields or an (N, 2) array, or from a
+      .npz file holding "timestamp" and "value" (or "timestamps" and
+      "values") arrays.  Datetime timestamps are converted to seconds.
+  """
+  if path.endswith(".npz"):
+    archive = numpy.load(path)
+    for (timestampKey, valueKey) in (("timestamp", "value"),
+                                     ("timestamps", "values")):
+      if timestampKey in archive.files and valueKey in archive.files:
+        (timestamps, values) = (archive[timestampKey], archive[valueKey])
+        break
+    else:
+      raise ValueError("%s has no timestamp and value arrays" % path)
+  else:
+    array = numpy.load(path, mmap_mode="r")
+    names = set(array.dtype.names or ())
+    if set(["timestamp", "value"]) <= names:
+      (timestamps, values) = (array["timestamp"], array["value"])
+    elif array.ndim == 2 and array.shape[1] == 2:
+      (timestamps, values) = (array[:, 0], array[:, 1])
+    else:
+      raise ValueError("%s is not a timestamp, value array" % path)
+
+  if len(timestamps) != len(values):
+    raise ValueError("%s has %d timestamps but %d values"
+                     % (path, len(timestamps), len(values)))
+
+  if timestamps.dtype.kind == "M":
+    timestamps = timestamps.astype("datetime64[s]")
+
+  return (timestamps.astype(numpy.int64), values.astype(numpy.float64))
+
+
+def readNumpy(path, counters, batchSize):
+  """ Yield (timestamps, values) array batches from a .npy or .npz file (see
+      _numpyColumns).  Samples whose value is NaN are skipped and counted.
+  """
+  if numpy is None:
+    raise ImportError("numpy is required to read %s" % path)
+
+  (timestamps, values) = _numpyColumns(path)
+
+  for start in xrange(0, len(timestamps), batchSize):
+    batchTimestamps = timestamps[start:start + batchSize]
+    batchValues = values[start:start + batchSize]
+    counters.read += len(batchTimestamps)
+
+    valid = ~numpy.isnan(batchValues)
+    if not valid.all():
+      counters.skipped += len(valid) - int(valid.sum())
+      (batchTimestamps, batchValues) = (batchTimestamps[valid],
+                                        batchValues[valid])
+
+    yield (batchTimestamps, batchValues)
+
+
+def encode(name, timestamps, values):
+  """ Return the "{name} {value} {timestamp}" lines for a batch of one
+      metric's samples.  Values and timestamps are converted to strings a
+      column at a time, and the lines formatted with a single % operation for
+      the whole batch.
+  """
+  count = len(timestamps)
+  if not count:
+    return ""
+
+  if numpy is not None:
+    fields = numpy.empty(2 * count, dtype=object)
+    fields[0::2] = numpy.asarray(values, dtype=numpy.float64).astype("S32")
+    fields[1::2] = numpy.asarray(timestamps, dtype=numpy.int64).astype("S20")
+  else:
+    fields = [None] * (2 * count)
+    fields[0::2] = map(repr, values)
+    fields[1::2] = timestamps
+
+  line = name.replace("%", "%%") + " %s %s\n"
+  return (line * count) % tuple(fields)
+
+
+
+class RateLimiter(object):
+  """ Token bucket limiting acquire()d units to `rate` per second, with
+      bursts of up to one second's worth
+  """
+
+  def __init__(self, rate):
+    self.rate = float(rate)
+    self._tokens = self.rate
+    self._last = time.time()
+
+
+  def acquire(self, count):
+    """ Take count tokens, sleeping until they are available """
+    now = time.time()
+    self._tokens = min(self.rate,
+                       self._tokens + (now - self._last) * self.rate)
+    self._last = now
+
+    self._tokens -= count
+    if self._tokens < 0:
+      time.sleep(-self._tokens / self.rate)
+
+
+
+def backfill(writer, name, batches, rate=None, progress=None):
+  """ Encode (timestamps, values) batches of `name` samples and write them to
+      writer (a CustomMetricWriter), at most `rate` samples per second if
+      given.  `progress`, if given, is called with the number of samples
+      written so far after each batch.  Returns the number of samples written.
+  """
+  limiter = RateLimiter(rate) if rate else None
+  written = 0
+
+  for (timestamps, values) in batches:
+    count = len(timestamps)
+    if not count:
+      continue
+
+    if limiter is not None:
+      limiter.acquire(count)
+
+    writer.writeLines(encode(name, timestamps, values), count)
+    written += count
+
+    if progress is not None:
+      progress(written)
+
+  return written
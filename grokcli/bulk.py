@@ -0,0 +1,175 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Bulk model creation.  Splits a (potentially very large) sequence of model
+    definitions into chunks and creates them concurrently, falling back to
+    one request per model for any chunk that fails.
+"""
+from itertools import islice
+import time
+
+from grokcli.api import AsyncGrokSession
+from grokcli.manifest import modelIdentity
+
+
+
+def chunked(iterable, size):
+  """ Yield successive lists of at most `size` items from iterable """
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if not chunk:
+      return
+    yield chunk
+
+
+def isRejection(error):
+  """ Return whether error is a definite rejection by the server, i.e. an HTTP
+      4xx response, or a 5xx response with an error message, after which
+      nothing was created.  Other failures, such as timeouts and reset
+      connections, leave it unknown whether the request took effect.
+  """
+  response = getattr(error, "response", None)
+  if response is None:
+    return False
+  return (400 <= response.status_code < 500 or
+          (response.status_code >= 500 and bool(response.content)))
+
+
+
+class BulkImporter(object):
+  """ Create models in chunks of `chunkSize` with up to `concurrency` chunks in
+      flight over the connection pool of a single GrokSession:
+
+        importer = BulkImporter(grok, chunkSize=500, concurrency=4)
+        for (model, result, error) in importer.run(models):
+          ...
+
+      If a chunk is rejected, each of its models is retried individually (up
+      to `retries` more times, waiting `backoff` seconds before the first
+      retry and twice as long before each one after) so that one bad
+      definition doesn't fail the other models in its chunk.
+
+      A request that fails without a definite rejection (see isRejection())
+      may still have created its models, so before anything is retried after
+      such a failure, the server's models are exported and those with the
+      same identity (see grokcli.manifest.modelIdentity) are treated as
+      created.
+  """
+
+  chunkSize = 500
+  concurrency = 4
+  retries = 2
+  backoff = 1.0
+
+
+  def __init__(self, grok, chunkSize=None, concurrency=None, retries=None,
+               backoff=None):
+    if chunkSize is not None:
+      self.chunkSize = chunkSize
+    if concurrency is not None:
+      self.concurrency = concurrency
+    if retries is not None:
+      self.retries = retries
+    if backoff is not None:
+      self.backoff = backoff
+
+    self.grok = grok
+
+
+  def _wait(self, attempt):
+    """ Back off before retry number `attempt` (from 1) """
+    time.sleep(self.backoff * 2 ** (attempt - 1))
+
+
+  def _existingIdentities(self):
+    """ Return the identities of the server's models """
+    return set(modelIdentity(model)
+               for model in self.grok.exportModels(stream=True))
+
+
+  def _createModel(self, model, existing=frozenset()):
+    """ Create model unless its identity is in `existing`, returning a (model,
+        result, error) tuple
+    """
+    if modelIdentity(model) in existing:
+      return (model, None, None)
+
+    try:
+      return (model, next(iter(self.grok.createModel(model))), None)
+    except Exception as e:
+      return (model, None, e)
+
+
+  def _createChunk(self, chunk):
+    try:
+      created = self.grok.createModels(chunk)
+    except Exception as e:
+      error = e
+    else:
+      if len(created) != len(chunk):
+        # Server didn't return one model per definition; success is all we
+        # know
+        created = [None] * len(chunk)
+
+      return [(model, result, None) for (model, result) in zip(chunk, created)]
+
+    # Retry the models one at a time, in rounds, so that the server's models
+    # are exported at most once per round however many requests failed
+    results = [(model, None, error) for model in chunk]
+    pending = range(len(chunk))
+
+    for attempt in xrange(self.retries + 1):
+      if attempt:
+        self._wait(attempt)
+      elif not isRejection(error):
+        self._wait(1)
+
+      existing = frozenset()
+      if not all(isRejection(results[i][2]) for i in pending):
+        # Some may have been created; don't create them twice
+        try:
+          existing = self._existingIdentities()
+        except Exception:
+          # Retrying could create duplicates, so only retry rejected models
+          pending = [i for i in pending if isRejection(results[i][2])]
+
+      for i in pending:
+        (model, _, lastError) = results[i]
+        results[i] = self._createModel(
+          model, frozenset() if isRejection(lastError) else existing)
+
+      pending = [i for i in pending if results[i][2] is not None]
+      if not pending:
+        break
+
+    return results
+
+
+  def run(self, models):
+    """ Create models, yielding a (model, result, error) tuple for each model
+        definition as its chunk completes.  `result` is the created model as
+        returned by the server (when available), and `error` is the exception
+        raised by the final attempt, or None on success.
+    """
+    grok = AsyncGrokSession(session=self.grok, concurrency=self.concurrency)
+
+    try:
+      chunks = chunked(models, self.chunkSize)
+      for (_, results, _) in grok.imapUnordered(self._createChunk, chunks):
+        for result in results:
+          yield result
+    finally:
+      grok.close()
@@ -0,0 +1,286 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Persistent on-disk cache of GrokSession list responses.  See
+    ResponseCache.
+"""
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import time
+from urlparse import urlparse
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+
+
+class ResponseCache(object):
+  """ Caches successful GET responses from the list endpoints on disk, so that
+      repeated CLI invocations don't re-fetch unchanged data:
+
+        grok = GrokSession(server="...", apikey="...",
+                           cache=ResponseCache("~/.grok/cache"))
+
+      Entries are keyed by server, API key and URL.  A fresh entry is served
+      without contacting the server; once its TTL has passed it is revalidated
+      using the ETag/Last-Modified validators the server returned, if any.  A
+      successful POST or DELETE invalidates every cached endpoint that it may
+      have changed.  When the total size of the cache exceeds `maxSize` bytes,
+      the least recently used entries are evicted.
+  """
+
+  maxSize = 64 * 1024 * 1024
+
+  # (path prefix, time to live in seconds).  Only GET requests whose path
+  # starts with one of these prefixes are cached.
+  ttls = (
+    ("/_models", 30),
+    ("/_metrics/cloudwatch", 300),
+    ("/_autostacks", 60),
+    ("/_instances", 60))
+
+  # (path prefix, cached path prefixes invalidated by a POST/DELETE to it)
+  invalidates = (
+    ("/_models", ("/_models", "/_instances", "/_autostacks")),
+    ("/_instances", ("/_instances", "/_models")),
+    ("/_autostacks", ("/_autostacks", "/_models", "/_instances")))
+
+
+  def __init__(self, directory, maxSize=None, ttls=None):
+    self.directory = os.path.expanduser(directory)
+
+    if maxSize is not None:
+      self.maxSize = maxSize
+
+    if ttls is not None:
+      self.ttls = ttls
+
+    try:
+      os.makedirs(self.directory, 0700)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+
+  @staticmethod
+  def _group(prefix):
+    return prefix.strip("/").replace("/", ".")
+
+
+  @staticmethod
+  def _owner(session):
+    return hashlib.sha1(
+      "{0}\0{1}".format(session.server, session.apikey)).hexdigest()[:16]
+
+
+  def _filename(self, session, prefix, url):
+    return os.path.join(
+      self.directory,
+      "{0}-{1}-{2}".format(self._owner(session),
+                           self._group(prefix),
+                           hashlib.sha1(url).hexdigest()))
+
+
+  def _ttlFor(self, path):
+    for (prefix, ttl) in self.ttls:
+      if path.startswith(prefix):
+        return (prefix, ttl)
+
+    return (None, None)
+
+
+  def _read(self, filename):
+    try:
+      with open(filename, "rb") as fp:
+        meta = json.loads(fp.readline())
+        content = fp.read()
+    except (IOError, ValueError):
+      return None
+
+    # Record the access for LRU eviction
+    try:
+      os.utime(filename, None)
+    except OSError:
+      pass
+
+    return (meta, content)
+
+
+  def _write(self, filename, meta, content):
+    (fd, tmp) = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "wb") as fp:
+        fp.write(json.dumps(meta) + "\n")
+        fp.write(content)
+      os.rename(tmp, filename)
+    except:
+      os.remove(tmp)
+      raise
+
+    self._evict()
+
+
+  def _tee(self, response, filename, meta):
+    """ Cache a streamed response's body as it is read, by wrapping
+        response.iter_content().  The entry is written to a temporary file
+        and only replaces `filename` once the whole body has been read.
+    """
+    iterContent = response.iter_content
+
+    def teeContent(chunk_size=1, decode_unicode=False):
+      (fd, tmp) = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+      complete = False
+      try:
+        with os.fdopen(fd, "wb") as fp:
+          fp.write(json.dumps(meta) + "\n")
+          for chunk in iterContent(chunk_size):
+            fp.write(chunk)
+            if decode_unicode and response.encoding:
+              chunk = chunk.decode(response.encoding, "replace")
+            yield chunk
+        os.rename(tmp, filename)
+        complete = True
+      finally:
+        if not complete:
+          self._remove(tmp)
+
+      self._evict()
+
+    response.iter_content = teeContent
+
+
+  def _remove(self, filename):
+    try:
+      os.remove(filename)
+    except OSError:
+      pass # Already evicted, possibly by another process
+
+
+  def _evict(self):
+    entries = []
+    total = 0
+
+    for name in os.listdir(self.directory):
+      if name.startswith("."):
+        continue
+
+      try:
+        stat = os.stat(os.path.join(self.directory, name))
+      except OSError:
+        continue
+
+      entries.append((stat.st_mtime, stat.st_size, name))
+      total += stat.st_size
+
+    entries.sort()
+
+    for (_, size, name) in entries:
+      if total <= self.maxSize:
+        break
+
+      self._remove(os.path.join(self.directory, name))
+      total -= size
+
+
+  @staticmethod
+  def _response(meta, content, url):
+    response = Response()
+    response.status_code = meta["status"]
+    response.headers = CaseInsensitiveDict(meta["headers"])
+    response.encoding = meta["encoding"]
+    response.url = url
+    response._content = content
+    response._content_consumed = True
+    return response
+
+
+  def invalidate(self, session, path):
+    """ Discard cached responses that a successful POST or DELETE to path may
+        have made stale
+    """
+    for (prefix, stale) in self.invalidates:
+      if path.startswith(prefix):
+        break
+    else:
+      return
+
+    owner = self._owner(session)
+    groups = set(self._group(prefix) for prefix in stale)
+
+    for name in os.listdir(self.directory):
+      (nameOwner, _, rest) = name.partition("-")
+      if nameOwner == owner and rest.rpartition("-")[0] in groups:
+        self._remove(os.path.join(self.directory, name))
+
+
+  def request(self, session, method, url, **kwargs):
+    """ Perform session.request(method, url, **kwargs), serving or
+        revalidating the response from the cache where possible.
+    """
+    path = urlparse(url).path
+
+    if method != "GET":
+      response = session.request(method, url, **kwargs)
+      if response.ok:
+        self.invalidate(session, path)
+      return response
+
+    (prefix, ttl) = self._ttlFor(path)
+
+    if prefix is None:
+      return session.request(method, url, **kwargs)
+
+    filename = self._filename(session, prefix, url)
+    entry = self._read(filename)
+
+    if entry is not None:
+      (meta, content) = entry
+
+      if meta["expires"] > time.time():
+        return self._response(meta, content, url)
+
+      headers = dict(kwargs.pop("headers", None) or {})
+      if meta["etag"]:
+        headers["If-None-Match"] = meta["etag"]
+      if meta["lastModified"]:
+        headers["If-Modified-Since"] = meta["lastModified"]
+      kwargs["headers"] = headers
+
+    response = session.request(method, url, **kwargs)
+
+    if entry is not None and response.status_code == 304:
+      meta["expires"] = time.time() + ttl
+      self._write(filename, meta, content)
+      return self._response(meta, content, url)
+
+    if response.status_code == 200:
+      meta = {
+        "status": response.status_code,
+        "headers": dict(response.headers),
+        "encoding": response.encoding,
+        "etag": response.headers.get("ETag"),
+        "lastModified": response.headers.get("Last-Modified"),
+        "expires": time.time() + ttl
+      }
+      if kwargs.get("stream"):
+        # Cached once the caller has read the whole body
+        self._tee(response, filename, meta)
+      else:
+        self._write(filename, meta, response.content)
+
+    return response
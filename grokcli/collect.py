@@ -0,0 +1,365 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" In-process collection of custom metric samples: collector plugins, the
+    Scheduler that runs them, and a statsd-style StatsdListener.  See
+    `grok collect`.
+"""
+import heapq
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+
+
+def _parseSamples(output, defaultName, timestamp):
+  """ Parse collector output: either a single number, reported as
+      `defaultName`, or "{name} {value} [{timestamp}]" lines
+  """
+  output = output.strip()
+  if not output:
+    return []
+
+  try:
+    value = float(output)
+  except ValueError:
+    pass
+  else:
+    if defaultName is None:
+      raise ValueError("Collector output %r needs a metric name" % output)
+    return [(defaultName, value, timestamp)]
+
+  samples = []
+  for line in output.splitlines():
+    fields = line.split()
+    if len(fields) in (2, 3):
+      samples.append((fields[0],
+                      float(fields[1]),
+                      int(float(fields[2])) if len(fields) == 3
+                      else timestamp))
+  return samples
+
+
+
+class Collector(object):
+  """ Base class of collector plugins.  collect() returns a list of
+      (name, value, timestamp) samples, and is called every `interval`
+      seconds.
+  """
+
+  interval = 60
+
+
+  def __init__(self, name=None, interval=None):
+    self.name = name
+    if interval is not None:
+      self.interval = interval
+
+
+  def collect(self):
+    raise NotImplementedError
+
+
+  def __repr__(self):
+    return "%s(%r)" % (self.__class__.__name__, self.name)
+
+
+
+class CommandCollector(Collector):
+  """ Runs a shell command, whose output is either a single number, reported as
+      metric `name`, or "{name} {value} [{timestamp}]" lines
+  """
+
+  def __init__(self, name=None, interval=None, command=None):
+    super(CommandCollector, self).__init__(name, interval)
+    self.command = command
+
+
+  def collect(self):
+    timestamp = int(time.time())
+    process = subprocess.Popen(self.command, shell=True,
+                               stdout=subprocess.PIPE)
+    (output, _) = process.communicate()
+
+    if process.returncode:
+      raise RuntimeError("%r exited with status %d"
+                         % (self.command, process.returncode))
+
+    return _parseSamples(output, self.name, timestamp)
+
+
+
+class CallableCollector(Collector):
+  """ Calls a Python callable, given as "module:function", in-process.  It may
+      return a number, reported as metric `name`, a {name: value} dict, or a
+      list of (name, value[, timestamp]) tuples.
+  """
+
+  def __init__(self, name=None, interval=None, callable=None, args=()):
+    super(CallableCollector, self).__init__(name, interval)
+    (moduleName, _, attribute) = callable.partition(":")
+    module = __import__(moduleName, fromlist=[attribute])
+    self.function = getattr(module, attribute)
+    self.args = args
+
+
+  def collect(self):
+    timestamp = int(time.time())
+    result = self.function(*self.args)
+
+    if isinstance(result, dict):
+      return [(name, value, timestamp) for (name, value) in result.items()]
+
+    if isinstance(result, (list, tuple)):
+      return [(sample[0], sample[1],
+               sample[2] if len(sample) > 2 else timestamp)
+              for sample in result]
+
+    return [(self.name, result, timestamp)]
+
+
+
+class TailCollector(Collector):
+  """ Reports "{name} {value} [{timestamp}]" lines appended to a file since
+      the last run.  A file that is truncated or replaced, e.g. by log
+      rotation, is read again from the start.  Lines already in the file when
+      the collector starts are skipped.
+  """
+
+  interval = 1
+
+
+  def __init__(self, name=None, interval=None, path=None):
+    super(TailCollector, self).__init__(name or path, interval)
+    self.path = path
+    self._inode = None
+    self._offset = 0
+    self._partial = ""
+
+    if os.path.exists(path):
+      stat = os.stat(path)
+      (self._inode, self._offset) = (stat.st_ino, stat.st_size)
+
+
+  def collect(self):
+    try:
+      stat = os.stat(self.path)
+    except OSError:
+      return []
+
+    if stat.st_ino != self._inode or stat.st_size < self._offset:
+      (self._inode, self._offset, self._partial) = (stat.st_ino, 0, "")
+
+    if stat.st_size == self._offset:
+      return []
+
+    with open(self.path, "rb") as fp:
+      fp.seek(self._offset)
+      data = self._partial + fp.read(stat.st_size - self._offset)
+      self._offset = stat.st_size
+
+    (complete, _, self._partial) = data.rpartition("\n")
+    return _parseSamples(complete, self.name, int(time.time()))
+
+
+
+COLLECTORS = {
+  "command": CommandCollector,
+  "callable": CallableCollector,
+  "tail": TailCollector}
+
+
+def loadCollectors(config):
+  """ Create collectors from a list of config dicts, each with one of the keys
+      of COLLECTORS naming its type, plus optional "name" and "interval"
+  """
+  collectors = []
+
+  for entry in config:
+    entry = dict(entry)
+    kinds = [kind for kind in COLLECTORS if kind in entry]
+    if len(kinds) != 1:
+      raise ValueError("Collector must have exactly one of %s: %r"
+                       % (", ".join(sorted(COLLECTORS)), entry))
+
+    kind = kinds[0]
+    if kind == "tail":
+      entry["path"] = entry.pop("tail")
+
+    collectors.append(COLLECTORS[kind](**entry))
+
+  return collectors
+
+
+
+class Scheduler(object):
+  """ Runs jobs at their own intervals on one thread, ordered by a heap of
+      their next run times.  A job that falls behind skips the runs it missed
+      rather than running repeatedly to catch up.
+  """
+
+  def __init__(self):
+    self._heap = []
+    self._count = 0
+    self._stopped = threading.Event()
+
+
+  def add(self, interval, function, *args):
+    """ Call function(*args) every `interval` seconds, starting now """
+    heapq.heappush(self._heap, (time.time(), self._count, interval, function,
+                                args))
+    self._count += 1
+
+
+  def run(self):
+    """ Run jobs until stop() is called """
+    while self._heap and not self._stopped.is_set():
+      (due, count, interval, function, args) = self._heap[0]
+
+      delay = due - time.time()
+      if delay > 0:
+        self._stopped.wait(delay)
+        continue
+
+      heapq.heappop(self._heap)
+      try:
+        function(*args)
+      except Exception:
+        traceback.print_exc(file=sys.stderr)
+
+      now = time.time()
+      due += interval
+      if due < now:
+        due += ((now - due) // interval + 1) * interval
+      heapq.heappush(self._heap, (due, count, interval, function, args))
+
+
+  def stop(self):
+    self._stopped.set()
+
+
+
+class StatsdListener(object):
+  """ Accepts statsd-style "{name}:{value}|{type}[|@{rate}]" datagrams on UDP
+      and/or Unix datagram sockets, several per datagram separated by
+      newlines, and aggregates them until flush():
+
+        g   gauge: last value, or adjusted by a value with an explicit sign
+        c   counter: sum of values, scaled up by the sample rate
+        ms  timer: mean of values
+
+      flush() writes one sample per metric received since the last flush to
+      a writer.
+  """
+
+  def __init__(self, udp=None, unix=None):
+    self._lock = threading.Lock()
+    self._metrics = {}
+    self._gauges = {}
+    self.received = 0
+    self.invalid = 0
+
+    self.unix = unix
+    self.sockets = []
+    if udp:
+      (host, _, port) = udp.rpartition(":")
+      sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+      sock.bind((host or "127.0.0.1", int(port)))
+      self.sockets.append(sock)
+    if unix:
+      if os.path.exists(unix):
+        os.remove(unix)
+      sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+      sock.bind(unix)
+      self.sockets.append(sock)
+
+    self._threads = []
+
+
+  def start(self):
+    for sock in self.sockets:
+      thread = threading.Thread(target=self._receive, args=(sock,),
+                                name="statsd listener")
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+
+  def _receive(self, sock):
+    while True:
+      try:
+        data = sock.recv(65536)
+      except socket.error:
+        return # Closed
+
+      for line in data.splitlines():
+        if line:
+          self.add(line)
+
+
+  def add(self, line):
+    """ Add one "{name}:{value}|{type}[|@{rate}]" sample """
+    try:
+      (name, _, rest) = line.partition(":")
+      fields = rest.split("|")
+      (value, kind) = (fields[0], fields[1])
+      rate = float(fields[2][1:]) if len(fields) > 2 else 1.0
+      number = float(value)
+      # A name that is empty or contains whitespace would corrupt the
+      # "{name} {value} {timestamp}" line sent for it
+      if name.split() != [name] or kind not in ("g", "c", "ms") or rate <= 0:
+        raise ValueError(line)
+    except (ValueError, IndexError):
+      self.invalid += 1
+      return
+
+    with self._lock:
+      self.received += 1
+
+      if kind == "g":
+        if value[0] in "+-":
+          number += self._gauges.get(name, 0.0)
+        self._gauges[name] = number
+        self._metrics[name] = ("g", number, 1)
+      elif kind == "c":
+        (_, total, count) = self._metrics.get(name, ("c", 0.0, 0))
+        self._metrics[name] = ("c", total + number / rate, count + 1)
+      else:
+        (_, total, count) = self._metrics.get(name, ("ms", 0.0, 0))
+        self._metrics[name] = ("ms", total + number, count + 1)
+
+
+  def flush(self, writer):
+    """ Write the aggregated samples to writer, and start a new interval """
+    with self._lock:
+      (metrics, self._metrics) = (self._metrics, {})
+
+    timestamp = int(time.time())
+    for (name, (kind, value, count)) in metrics.iteritems():
+      if kind == "ms":
+        value /= count
+      writer.write(name, value, timestamp)
+
+
+  def close(self):
+    for sock in self.sockets:
+      sock.close()
+
+    if self.unix and os.path.exists(self.unix):
+      os.remove(self.unix)
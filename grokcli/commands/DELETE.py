@@ -61,7 +61,7 @@ def handle(options, args):
 
   grok = GrokSession(server=server, apikey=apikey)
 
-  delete = partial(grok.delete, endpoint)
+  delete = partial(grok.call, "DELETE", endpoint)
 
   response = None
   if data.strip() == "-" or not data:
@@ -19,6 +19,7 @@ from optparse import OptionParser
 from urlparse import urlparse
 import grokcli
 from grokcli.api import GrokSession, Response
+from grokcli.serialization import dumpYAML, importYAML, loadJSON
 
 
 
@@ -34,8 +35,8 @@ USAGE = """%s GROK_URL GROK_API_KEY [options]
 """.strip() % subCommand
 
 parser = OptionParser(usage=USAGE)
-try:
-  import yaml
+# Hidden from the user if yaml isn't available
+if importYAML() is not None:
   parser.add_option(
     "-y",
     "--yaml",
@@ -43,8 +44,6 @@ try:
     default=False,
     action="store_true",
     help="Display results in YAML format")
-except ImportError:
-  pass # yaml not available, hide from user
 
 # Implementation
 
@@ -56,12 +55,12 @@ def handle(options, args):
 
   grok = GrokSession(server=server, apikey=apikey)
 
-  response = grok.get(endpoint)
+  response = grok.call("GET", endpoint)
 
   if isinstance(response, Response):
     if hasattr(options, "useYaml"):
       if options.useYaml:
-        print yaml.safe_dump(yaml.load(response.text), default_flow_style=False)
+        print dumpYAML(loadJSON(response.text))
       else:
         print response.text
 
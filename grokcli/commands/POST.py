@@ -61,7 +61,7 @@ def handle(options, args):
 
   grok = GrokSession(server=server, apikey=apikey)
 
-  post = partial(grok.post, endpoint)
+  post = partial(grok.call, "POST", endpoint)
 
   response = None
   if data.strip() == "-" or not data:
@@ -13,30 +13,41 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-from . import (
-  cloudwatch,
-  custom,
-  credentials,
-  DELETE,
-  export,
-  GET,
-  metrics,
-  instances,
-  autostacks,
-  POST
-)
-__import__("import", globals(), locals(), ["."]) # "import" is reserverd.
+""" Registry of grok subcommands.  Each command is a module in this package,
+    imported only when the command is run, so that starting `grok` doesn't
+    pay for every command's dependencies.  See loadCommand().
+"""
+from importlib import import_module
 
-__all__ = [
-  "cloudwatch",
-  "custom",
-  "credentials",
-  "DELETE",
-  "export",
-  "GET",
-  "import",
-  "metrics",
-  "instances",
-  "autostacks",
-  "POST"
-]
+
+
+# Command name: one-line summary, for usage text
+COMMANDS = {
+  "autostacks": "Manage autostacks",
+  "cloudwatch": "Monitor cloudwatch metrics and instances",
+  "collect": "Run custom metric collectors",
+  "credentials": "Add AWS credentials to a Grok server",
+  "custom": "Manage and send custom metrics",
+  "DELETE": "Send a DELETE request to the Grok API",
+  "export": "Export model definitions",
+  "GET": "Send a GET request to the Grok API",
+  "import": "Import model definitions",
+  "instances": "Browse and unmonitor instances",
+  "metrics": "Manage monitored metrics",
+  "POST": "Send a POST request to the Grok API",
+  "run": "Run a script of grok commands",
+  "shell": "Interactive shell"
+}
+
+__all__ = sorted(COMMANDS)
+
+
+def loadCommand(name):
+  """ Import and return the module of command `name`.  Raises KeyError for
+      unknown commands.
+  """
+  if name not in COMMANDS:
+    raise KeyError(name)
+
+  # import_module, since "import" is reserved
+  return import_module("%s.%s" % (__name__, name))
@@ -14,7 +14,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
 from optparse import OptionParser
 import sys
 
@@ -23,6 +22,7 @@ from prettytable import PrettyTable
 import grokcli
 from grokcli.api import GrokSession
 from grokcli.exceptions import GrokCLIError
+from grokcli.serialization import dumpJSON, loadJSON
 
 
 if __name__ == "__main__":
@@ -103,7 +103,7 @@ def handleListRequest(grok, fmt):
   stacks = grok.listAutostacks()
 
   if fmt == "json":
-    print(json.dumps(stacks))
+    print(dumpJSON(stacks))
   else:
     table = PrettyTable()
 
@@ -120,7 +120,7 @@ def handlePreviewRequest(grok, fmt, region, filters):
   instances = grok.previewAutostack(region, filters)
 
   if fmt == "json":
-    print(json.dumps(instances))
+    print(dumpJSON(instances))
   else:
     table = PrettyTable()
 
@@ -153,7 +153,7 @@ def handleMetricsListRequest(grok, stackID, stackName, region, fmt):
   metrics = grok.listAutostackMetrics(stackID)
 
   if fmt == "json":
-    print(json.dumps(metrics))
+    print(dumpJSON(metrics))
   else:
     table = PrettyTable()
 
@@ -188,7 +188,7 @@ def handleInstancesListRequest(grok, stackID, stackName, region, fmt):
   instances = grok.listAutostackInstances(stackID)
 
   if fmt == "json":
-    print(json.dumps(instances))
+    print(dumpJSON(instances))
   else:
     table = PrettyTable()
 
@@ -222,7 +222,7 @@ def handle(options, args):
       if not (options.region and options.filters):
         printHelpAndExit()
 
-      filters = json.loads(options.filters)
+      filters = loadJSON(options.filters)
 
       if options.preview:
         handlePreviewRequest(grok, options.format,
@@ -14,15 +14,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
 from optparse import OptionParser
 import sys
 
 from prettytable import PrettyTable
 
 import grokcli
-from grokcli.api import GrokSession
+from grokcli.api import AsyncGrokSession, GrokSession
 from grokcli.exceptions import GrokCLIError
+from grokcli.jsonstream import writeJSONArray
 
 
 
@@ -42,9 +42,9 @@ Create Grok cloudwatch model
 
 
 def dimensions_callback(option, opt, value, parser):
-  if not hasattr(dimensions_callback, "dimensions"):
-    dimensions_callback.dimensions = {}
-  dimensions_callback.dimensions[value[0]]=value[1]
+  if parser.values.dimensions is None:
+    parser.values.dimensions = {}
+  parser.values.dimensions[value[0]]=value[1]
 
 parser = OptionParser(usage=USAGE)
 parser.add_option(
@@ -80,13 +80,24 @@ parser.add_option(
   dest="format",
   default="text",
   help='Output format (text|json)')
+parser.add_option(
+  "--concurrency",
+  dest="concurrency",
+  type="int",
+  default=AsyncGrokSession.concurrency,
+  metavar="N",
+  help="Number of regions to query at a time for metrics list " \
+       "(default: %default)")
 
 # Implementation
 
-def getCloudwatchMetrics(grok, region=None, namespace=None,
-                         instance=None, metricName=None):
+def iterCloudwatchMetrics(grok, region=None, namespace=None, instance=None,
+                          metricName=None, concurrency=None):
   """ Request available metric data for specified region,
-      namespace, instance, metric name where provided in CLI context
+      namespace, instance, metric name where provided in CLI context.
+
+      Regions are queried concurrently; yields a (region, metrics, error)
+      tuple for each region as its request completes.
   """
   # Query Grok regions API for available cloudwatch metrics
   if region:
@@ -94,14 +105,30 @@ def getCloudwatchMetrics(grok, region=None, namespace=None,
   else:
     regions = grok.listMetrics("cloudwatch")["regions"]
 
+  def listRegion(region):
+    return grok.listCloudwatchMetrics(region,
+                                      namespace=namespace,
+                                      instance=instance,
+                                      metric=metricName)
+
+  with AsyncGrokSession(session=grok, concurrency=concurrency) as pool:
+    for result in pool.imapUnordered(listRegion, regions):
+      yield result
+
+
+def getCloudwatchMetrics(grok, region=None, namespace=None,
+                         instance=None, metricName=None, concurrency=None):
+  """ Request available metric data for specified region,
+      namespace, instance, metric name where provided in CLI context
+  """
   metrics = []
 
-  for region in regions:
-    for metric in grok.listCloudwatchMetrics(region,
-                                             namespace=namespace,
-                                             instance=instance,
-                                             metric=metricName):
-      metrics.append(metric)
+  for (_, regionMetrics, error) in iterCloudwatchMetrics(
+      grok, region=region, namespace=namespace, instance=instance,
+      metricName=metricName, concurrency=concurrency):
+    if error is not None:
+      raise error
+    metrics.extend(regionMetrics)
 
   return metrics
 
@@ -116,17 +143,10 @@ def handleMetricsUnmonitorRequest(grok, region, namespace, instance, metric):
   metricName = "{0}/{1}".format(namespace, metric)
   server = "{0}/{1}/{2}".format(region, namespace, instance)
 
-  models = grok.listModels()
-
-  metrics = [m for m in models if (m["datasource"] == "cloudwatch" and
-                                   m["name"] == metricName and
-                                   m["server"] == server)]
-
-  if not len(metrics):
+  if grok.deleteFoundModel("cloudwatch", name=metricName,
+                           server=server) is None:
     raise GrokCLIError("Metric not found")
 
-  grok.deleteModel(metrics[0]["uid"])
-
 
 def handleInstanceMonitorRequest(grok, region, namespace, instance):
   grok.createInstance(region, namespace, instance)
@@ -156,32 +176,58 @@ def tableAddMetricDimensionColumn(table, metrics, column):
   table.add_column(column, values)
 
 
+def printMetricsTable(metrics):
+  table = PrettyTable()
+
+  table.add_column("Region", [x['region'] for x in metrics])
+  table.add_column("Namespace", [x['namespace'] for x in metrics])
+  table.add_column("Name", [x['name'] if 'name' in x else ''
+                   for x in metrics])
+  table.add_column("Metric", [x['metric'] for x in metrics])
+
+  tableAddMetricDimensionColumn(table, metrics, 'VolumeId')
+  tableAddMetricDimensionColumn(table, metrics, 'InstanceId')
+  tableAddMetricDimensionColumn(table, metrics, 'DBInstanceIdentifier')
+  tableAddMetricDimensionColumn(table, metrics, 'LoadBalancerName')
+  tableAddMetricDimensionColumn(table, metrics, 'AutoScalingGroupName')
+  tableAddMetricDimensionColumn(table, metrics, 'AvailabilityZone')
+
+  table.align = "l"  # left align
+  print(table)
+
+
 def handleMetricsListRequest(grok, fmt, region=None, namespace=None,
-                             metricName=None, instance=None):
-  metrics = getCloudwatchMetrics(grok, region=region,
-                                 namespace=namespace, instance=instance,
-                                 metricName=metricName)
+                             metricName=None, instance=None,
+                             concurrency=None):
+  """ List available metrics, printing each region's metrics as soon as its
+      request completes (one table per region in text format).  Regions that
+      fail are reported on stderr without aborting the others.
+  """
+  failed = []
+
+  def completedRegions():
+    for (name, metrics, error) in iterCloudwatchMetrics(
+        grok, region=region, namespace=namespace, instance=instance,
+        metricName=metricName, concurrency=concurrency):
+      if error is not None:
+        print >> sys.stderr, "ERROR: Region {0}: {1}".format(name, error)
+        failed.append(name)
+      elif metrics:
+        yield metrics
 
   if fmt == "json":
-    print(json.dumps(metrics))
+    writeJSONArray(sys.stdout,
+                   (metric for metrics in completedRegions()
+                           for metric in metrics))
+    print
   else:
-    table = PrettyTable()
-
-    table.add_column("Region", [x['region'] for x in metrics])
-    table.add_column("Namespace", [x['namespace'] for x in metrics])
-    table.add_column("Name", [x['name'] if 'name' in x else ''
-                     for x in metrics])
-    table.add_column("Metric", [x['metric'] for x in metrics])
-
-    tableAddMetricDimensionColumn(table, metrics, 'VolumeId')
-    tableAddMetricDimensionColumn(table, metrics, 'InstanceId')
-    tableAddMetricDimensionColumn(table, metrics, 'DBInstanceIdentifier')
-    tableAddMetricDimensionColumn(table, metrics, 'LoadBalancerName')
-    tableAddMetricDimensionColumn(table, metrics, 'AutoScalingGroupName')
-    tableAddMetricDimensionColumn(table, metrics, 'AvailabilityZone')
+    for metrics in completedRegions():
+      printMetricsTable(metrics)
+      sys.stdout.flush()
 
-    table.align = "l"  # left align
-    print(table)
+  if failed:
+    raise GrokCLIError("Unable to list metrics in {0} region(s): {1}".format(
+      len(failed), ", ".join(sorted(failed))))
 
 
 def handle(options, args):
@@ -206,8 +252,8 @@ def handle(options, args):
           "region": options.region
         }
 
-      if hasattr(dimensions_callback, "dimensions"):
-        nativeMetric["dimensions"] = dimensions_callback.dimensions
+      if options.dimensions:
+        nativeMetric["dimensions"] = options.dimensions
       else:
         printHelpAndExit()
 
@@ -229,7 +275,8 @@ def handle(options, args):
         region=options.region,
         namespace=options.namespace,
         metricName=options.metric,
-        instance=options.instance)
+        instance=options.instance,
+        concurrency=options.concurrency)
 
     else:
       printHelpAndExit()
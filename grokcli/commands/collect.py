@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+from optparse import OptionParser
+import signal
+import socket
+import sys
+
+import grokcli
+from grokcli.api import GrokSession
+from grokcli.collect import loadCollectors, Scheduler, StatsdListener
+from grokcli.exceptions import GrokCLIError
+from grokcli.shard import ShardedWriter
+from grokcli.spool import Spool
+
+
+
+# Subcommand CLI Options
+
+if __name__ == "__main__":
+  subCommand = "%prog"
+else:
+  subCommand = "%%prog %s" % __name__.rpartition('.')[2]
+
+USAGE = """%s CONFIG [GROK_SERVER_URL GROK_API_KEY] [options]
+
+Run custom metric collectors in a long-running process, sending their samples
+over one persistent connection to the Custom Metric endpoint.  CONFIG is a
+YAML or JSON file such as:
+
+  collectors:
+    - command: "/usr/sbin/lsof | /usr/bin/wc -l"
+      name: open.file.descriptors
+      interval: 60
+    - callable: mymodule:collect
+      interval: 10
+    - tail: /var/log/app/metrics.log
+  statsd:
+    udp: 127.0.0.1:8125
+    unix: /var/run/grok-statsd.sock
+    interval: 10
+
+`command` runs a shell command and `callable` calls a Python "module:function";
+either may produce a single number, reported as `name`, or several samples.
+`tail` reports "{name} {value} [{timestamp}]" lines appended to a file.
+`statsd` accepts "{name}:{value}|g|c|ms" datagrams and sends their aggregates
+every `interval` seconds.
+
+Without --spool, samples are held in memory while the server is unreachable,
+up to 16MB, after which the oldest are dropped and the number dropped is
+reported every minute.
+""".strip() % subCommand
+
+parser = OptionParser(usage=USAGE)
+parser.add_option(
+  "--spool",
+  dest="spool",
+  metavar="DIR",
+  help="Spool samples in DIR while the server is unreachable "
+       "[default: $GROK_SPOOL_DIR]")
+parser.add_option(
+  "--shard",
+  dest="shards",
+  action="append",
+  metavar="GROK_SERVER_URL",
+  help="Server to send a share of metrics to, instead of GROK_SERVER_URL; "
+       "repeat for each server")
+parser.add_option(
+  "--once",
+  dest="once",
+  action="store_true",
+  default=False,
+  help="Run each collector once and exit")
+parser.add_option(
+  "-v",
+  "--verbose",
+  dest="verbose",
+  action="store_true",
+  default=False,
+  help="Print each sample to stderr")
+
+# Implementation
+
+class VerboseWriter(object):
+  """ Prints each sample to stderr before passing it to a writer """
+
+  def __init__(self, writer):
+    self.writer = writer
+
+
+  def write(self, name, value, timestamp):
+    print >> sys.stderr, name, value, timestamp
+    self.writer.write(name, value, timestamp)
+
+
+
+class DropReporter(object):
+  """ Reports samples dropped by a writer since the last call """
+
+  def __init__(self, writer):
+    self.writer = writer
+    self.reported = 0
+
+
+  def __call__(self):
+    dropped = self.writer.stats()["linesDropped"]
+    if dropped > self.reported:
+      print >> sys.stderr, ("Dropped %d samples while the server was "
+                            "unreachable" % (dropped - self.reported))
+      self.reported = dropped
+
+
+
+def runCollector(collector, writer):
+  try:
+    samples = collector.collect()
+  except Exception as e:
+    print >> sys.stderr, "%r failed: %s" % (collector, e)
+    return
+
+  try:
+    for (name, value, timestamp) in samples:
+      writer.write(name, value, timestamp)
+  except socket.error as e:
+    # Samples stay buffered until the server is reachable again
+    print >> sys.stderr, "Unable to send samples: %s" % e
+
+
+def flushStatsd(statsd, writer):
+  try:
+    statsd.flush(writer)
+  except socket.error as e:
+    print >> sys.stderr, "Unable to send samples: %s" % e
+
+
+def handle(options, args):
+  """ `grok collect` handler. """
+  try:
+    configPath = args.pop(0)
+  except IndexError:
+    parser.print_help(sys.stderr)
+    sys.exit(1)
+
+  (server, apikey) = grokcli.getCommonArgs(parser, args)
+
+  with open(configPath, "r") as fp:
+    config = grokcli.load(fp.read()) or {}
+
+  try:
+    collectors = loadCollectors(config.get("collectors") or [])
+  except (ValueError, TypeError, ImportError, AttributeError) as e:
+    raise GrokCLIError("Invalid collector in %s: %s" % (configPath, e))
+
+  statsdConfig = config.get("statsd")
+
+  if not collectors and not statsdConfig:
+    raise GrokCLIError("%s configures no collectors" % configPath)
+
+  grok = GrokSession(server=server, apikey=apikey)
+
+  if options.shards:
+    writer = ShardedWriter(options.shards,
+                           spoolDirectory=(options.spool or
+                                           grok.spoolDirectory))
+  elif options.spool:
+    writer = grok.writer(spool=Spool(options.spool))
+  else:
+    writer = grok.writer()
+
+  sink = VerboseWriter(writer) if options.verbose else writer
+
+  statsd = None
+  scheduler = Scheduler()
+
+  try:
+    if options.once:
+      for collector in collectors:
+        runCollector(collector, sink)
+      return
+
+    for collector in collectors:
+      scheduler.add(collector.interval, runCollector, collector, sink)
+
+    if statsdConfig:
+      statsd = StatsdListener(udp=statsdConfig.get("udp"),
+                              unix=statsdConfig.get("unix"))
+      statsd.start()
+      scheduler.add(statsdConfig.get("interval", 10), flushStatsd, statsd,
+                    sink)
+
+    if not options.spool and not grok.spoolDirectory:
+      scheduler.add(60, DropReporter(writer))
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+
+    try:
+      scheduler.run()
+    except KeyboardInterrupt:
+      pass
+
+  finally:
+    if statsd is not None:
+      statsd.close()
+      flushStatsd(statsd, sink)
+
+    try:
+      writer.close()
+    except socket.error as e:
+      raise GrokCLIError("Unable to send the last samples: %s" % e)
+
+
+if __name__ == "__main__":
+  handle(*parser.parse_args())
@@ -14,15 +14,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
 from optparse import OptionParser
+import socket
 import sys
+import time
 
 from prettytable import PrettyTable
 
 import grokcli
 from grokcli.api import GrokSession
 from grokcli.exceptions import GrokCLIError
+from grokcli import aggregate, ingest
+from grokcli.dedup import Deduplicator
+from grokcli.serialization import dumpJSON
+from grokcli.shard import ShardedWriter
+from grokcli.spool import Spool
 
 
 
@@ -33,10 +39,38 @@ if __name__ == "__main__":
 else:
   subCommand = "%%prog %s" % __name__.rpartition('.')[2]
 
-USAGE = """%s metrics (list|monitor|unmonitor) \
-[GROK_SERVER_URL GROK_API_KEY] [options]
+USAGE = """%s metrics (list|monitor|unmonitor|send|replay|backfill) \
+[GROK_SERVER_URL GROK_API_KEY] [FILE ...] [options]
 
 Manage custom metrics.
+
+`send` streams samples from FILEs (or stdin) to the Custom Metric endpoint
+over a single buffered connection.  Input is one sample per record:
+
+  line    "{name} {value} [{timestamp}]"
+  csv     name,value[,timestamp]
+  ndjson  {"name": ..., "value": ..., "timestamp": ...}
+
+Timestamps default to the current time.  Records that can't be parsed are
+skipped and counted.
+
+With --shard, samples are instead spread over the Custom Metric endpoints of
+the given servers, each metric always going to the same server.
+
+With --dedup, samples that are not newer than the last one sent for the same
+metric are dropped, e.g. when collectors re-send overlapping windows.  Use
+--dedup-state to remember the last timestamps between runs.
+
+With --aggregate, samples are combined per metric into --bucket second buckets
+before sending, one sample per bucket at the bucket's start time.
+
+With --spool (or GROK_SPOOL_DIR), samples that can't be sent because the
+endpoint is unreachable are appended to a spool directory instead of being
+lost, and sent ahead of new samples once it is back.  `replay` sends whatever
+is in the spool.
+
+`backfill` sends historical samples of the --name metric from timestamp,value
+CSV FILEs (or stdin), or from NumPy .npy/.npz FILEs if numpy is installed.
 """.strip() % subCommand
 
 parser = OptionParser(usage=USAGE)
@@ -49,12 +83,90 @@ parser.add_option(
   "--name",
   dest="name",
   metavar="Name",
-  help="Metric Name (required for unmonitor)")
+  help="Metric Name (required for unmonitor and backfill)")
 parser.add_option(
   "--format",
   dest="format",
   default="text",
   help='Output format (text|json)')
+parser.add_option(
+  "--input-format",
+  dest="inputFormat",
+  default="line",
+  type="choice",
+  choices=sorted(ingest.PARSERS),
+  help="Input format for send (line|csv|ndjson) [default: %default]")
+parser.add_option(
+  "--buffer-size",
+  dest="bufferSize",
+  default=64 * 1024,
+  type="int",
+  metavar="BYTES",
+  help="Bytes to buffer before each write for send [default: %default]")
+parser.add_option(
+  "--queue-size",
+  dest="queueSize",
+  default=100000,
+  type="int",
+  metavar="SAMPLES",
+  help="Maximum samples read ahead of the connection for send "
+       "[default: %default]")
+parser.add_option(
+  "--dedup",
+  dest="dedup",
+  action="store_true",
+  default=False,
+  help="Drop duplicate and out-of-order samples in send")
+parser.add_option(
+  "--dedup-state",
+  dest="dedupState",
+  metavar="FILE",
+  help="File to keep --dedup state in between runs (implies --dedup)")
+parser.add_option(
+  "--aggregate",
+  dest="aggregate",
+  type="choice",
+  choices=sorted(aggregate.METHODS),
+  metavar="METHOD",
+  help="Aggregate samples per bucket before send (mean|sum|min|max|last)")
+parser.add_option(
+  "--bucket",
+  dest="bucket",
+  default=aggregate.Aggregator.bucket,
+  type="int",
+  metavar="SECONDS",
+  help="Aggregation bucket size for --aggregate [default: %default]")
+parser.add_option(
+  "--rate",
+  dest="rate",
+  type="int",
+  metavar="SAMPLES",
+  help="Maximum samples per second for backfill")
+parser.add_option(
+  "--batch-size",
+  dest="batchSize",
+  default=10000,
+  type="int",
+  metavar="SAMPLES",
+  help="Samples encoded at a time for backfill [default: %default]")
+parser.add_option(
+  "--shard",
+  dest="shards",
+  action="append",
+  metavar="GROK_SERVER_URL",
+  help="Server to send a share of metrics to; repeat for each server")
+parser.add_option(
+  "--spool",
+  dest="spool",
+  metavar="DIR",
+  help="Spool directory for send and replay [default: $GROK_SPOOL_DIR]")
+parser.add_option(
+  "--fsync",
+  dest="fsync",
+  default=Spool.fsync,
+  type="choice",
+  choices=Spool.FSYNC_POLICIES,
+  help="When to fsync the spool (never|segment|always) [default: %default]")
 
 
 
@@ -67,7 +179,7 @@ def handleListRequest(grok, fmt):
   metrics = grok.listMetrics("custom")
 
   if fmt == "json":
-    print(json.dumps(metrics))
+    print(dumpJSON(metrics))
   else:
     table = PrettyTable()
 
@@ -89,15 +201,184 @@ def handleMonitorRequest(grok, metricID):
 
 
 def handleUnmonitorRequest(grok, metricName):
-  models = grok.listModels()
+  if grok.deleteFoundModel("custom", name=metricName) is None:
+    raise GrokCLIError("Metric not found")
 
-  metrics = [m for m in models if (m["datasource"] == "custom" and
-                                   m["name"] == metricName)]
 
-  if not len(metrics):
-    raise GrokCLIError("Metric not found")
+def iterInputFiles(paths):
+  """ Open each path in turn, "-" or no paths meaning stdin """
+  for path in paths or ["-"]:
+    if path == "-":
+      yield sys.stdin
+    else:
+      with open(path, "rU") as fp:
+        yield fp
+
+
+def getSpool(grok, directory, fsync):
+  """ Return the Spool in directory, or in grok.spoolDirectory, or None """
+  directory = directory or grok.spoolDirectory
+  if directory:
+    return Spool(directory, fsync=fsync)
+
+
+def handleSendRequest(grok, paths, inputFormat, bufferSize, queueSize,
+                      spool, aggregateMethod=None, bucket=None, shards=None,
+                      dedup=False, dedupState=None):
+  parse = ingest.PARSERS[inputFormat]
+  counters = ingest.Counters()
 
-  grok.deleteModel(metrics[0]["uid"])
+  samples = (sample
+             for fp in iterInputFiles(paths)
+             for sample in parse(fp, counters))
+
+  start = time.time()
+
+  if shards:
+    writer = ShardedWriter(shards,
+                           spoolDirectory=spool and spool.directory,
+                           bufferSize=bufferSize)
+  else:
+    writer = grok.writer(bufferSize=bufferSize, spool=spool)
+
+  if aggregateMethod:
+    writer = aggregate.Aggregator(writer, bucket=bucket,
+                                  method=aggregateMethod)
+
+  if dedup or dedupState:
+    writer = Deduplicator(writer, dedupState)
+
+  try:
+    try:
+      written = ingest.pump(samples, writer, queueSize=queueSize)
+    finally:
+      writer.close()
+  except socket.error as e:
+    raise GrokCLIError("Unable to send samples: %s" % e)
+
+  elapsed = max(time.time() - start, 1e-6)
+  stats = writer.stats()
+
+  print >> sys.stderr, ("Read %d samples in %.2fs: %.0f samples/s"
+                        % (written, elapsed, written / elapsed))
+
+  # Counted by the writer, so samples spooled rather than sent, and samples
+  # merged by aggregation or suppressed as duplicates, aren't included
+  print >> sys.stderr, ("Sent %d samples (%d bytes): %.2f MB/s, %d flushes, "
+                        "%d reconnects" %
+                        (stats["linesSent"], stats["bytesSent"],
+                         stats["bytesSent"] / elapsed / 1024 / 1024,
+                         stats["flushes"], stats["reconnects"]))
+
+  if aggregateMethod:
+    print >> sys.stderr, ("Aggregated %d samples into %d buckets, dropped %d "
+                          "late samples" % (stats["samplesIn"],
+                                            stats["samplesOut"],
+                                            stats["samplesLate"]))
+
+  if dedup or dedupState:
+    print >> sys.stderr, ("Suppressed %d duplicate and %d out-of-order samples"
+                          % (stats["duplicates"], stats["outOfOrder"]))
+
+  if stats["linesDropped"]:
+    print >> sys.stderr, ("Dropped %d of the oldest unsent samples while the "
+                          "server was unreachable" % stats["linesDropped"])
+
+  if counters.skipped:
+    print >> sys.stderr, ("Skipped %d of %d records that could not be parsed"
+                          % (counters.skipped, counters.read))
+
+  if spool is not None:
+    print >> sys.stderr, ("Replayed %d spooled samples, spooled %d samples"
+                          % (stats["linesReplayed"], stats["linesSpooled"]))
+    if spool.droppedBytes and not shards:
+      print >> sys.stderr, ("Dropped %d bytes of the oldest spooled samples "
+                            "to stay within the spool size limit"
+                            % spool.droppedBytes)
+
+
+def iterBackfillBatches(paths, counters, batchSize):
+  """ Yield (timestamps, values) batches from each path in turn """
+  from grokcli import backfill
+
+  for path in paths or ["-"]:
+    if path.endswith((".npy", ".npz")):
+      if backfill.numpy is None:
+        raise GrokCLIError("numpy is required to read %s" % path)
+
+      for batch in backfill.readNumpy(path, counters, batchSize):
+        yield batch
+
+    else:
+      for fp in iterInputFiles([path]):
+        for batch in backfill.readCSV(fp, counters, batchSize):
+          yield batch
+
+
+def handleBackfillRequest(grok, paths, name, rate, batchSize, spool):
+  # Imported here rather than with the other modules, since importing numpy
+  # would slow down every `grok custom` command
+  from grokcli import backfill
+
+  if rate:
+    # Keep batches small enough for the rate limit to be applied smoothly
+    batchSize = max(1, min(batchSize, rate // 10))
+
+  counters = ingest.Counters()
+  start = time.time()
+  lastProgress = [start]
+
+  def progress(written):
+    now = time.time()
+    if now - lastProgress[0] >= 1:
+      lastProgress[0] = now
+      sys.stderr.write("\r%d samples sent, %.0f samples/s"
+                       % (written, written / (now - start)))
+      sys.stderr.flush()
+
+  writer = grok.writer(spool=spool)
+  try:
+    try:
+      written = backfill.backfill(writer,
+                                  name,
+                                  iterBackfillBatches(paths, counters,
+                                                      batchSize),
+                                  rate=rate,
+                                  progress=progress)
+    finally:
+      writer.close()
+  except ValueError as e:
+    raise GrokCLIError(str(e))
+  except socket.error as e:
+    raise GrokCLIError("Unable to send samples: %s" % e)
+
+  elapsed = max(time.time() - start, 1e-6)
+  stats = writer.stats()
+
+  print >> sys.stderr, ("\rBackfilled %d samples of %s in %.2fs: %.0f "
+                        "samples/s" % (written, name, elapsed,
+                                       written / elapsed))
+
+  if stats["linesDropped"]:
+    print >> sys.stderr, ("Dropped %d of the oldest unsent samples while the "
+                          "server was unreachable" % stats["linesDropped"])
+
+  if counters.skipped:
+    print >> sys.stderr, ("Skipped %d of %d records that could not be parsed"
+                          % (counters.skipped, counters.read))
+
+
+def handleReplayRequest(grok, spool):
+  writer = grok.writer(spool=spool)
+  try:
+    writer.replay()
+  except socket.error as e:
+    raise GrokCLIError("Unable to replay spool: %s" % e)
+  finally:
+    writer.close()
+
+  print >> sys.stderr, ("Replayed %d spooled samples"
+                        % writer.linesReplayed)
 
 
 def handle(options, args):
@@ -129,6 +410,28 @@ def handle(options, args):
 
       handleUnmonitorRequest(grok, options.name)
 
+    elif action == "send":
+      handleSendRequest(grok, args, options.inputFormat, options.bufferSize,
+                        options.queueSize,
+                        getSpool(grok, options.spool, options.fsync),
+                        options.aggregate, options.bucket, options.shards,
+                        options.dedup, options.dedupState)
+
+    elif action == "backfill":
+      if not options.name:
+        printHelpAndExit()
+
+      handleBackfillRequest(grok, args, options.name, options.rate,
+                            options.batchSize,
+                            getSpool(grok, options.spool, options.fsync))
+
+    elif action == "replay":
+      spool = getSpool(grok, options.spool, options.fsync)
+      if spool is None:
+        printHelpAndExit()
+
+      handleReplayRequest(grok, spool)
+
     else:
       printHelpAndExit()
 
@@ -14,11 +14,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
+import errno
+from itertools import chain
+import os
 import sys
-from functools import partial
 from optparse import OptionParser
-from grokcli.api import GrokSession
+from grokcli.api import AsyncGrokSession, GrokSession
+from grokcli.compression import (availableCompressions, detectCompression,
+                                 openOutput, recoverOutput)
+from grokcli.exceptions import GrokCLIError
+from grokcli.jsonstream import writeJSONArray
+from grokcli.manifest import contentHash, definitionHash, ExportManifest
+from grokcli.serialization import dumpJSON, dumpYAML, importYAML
 import grokcli
 
 # Subcommand CLI Options
@@ -28,9 +35,28 @@ if __name__ == "__main__":
 else:
   subCommand = "%%prog %s" % __name__.rpartition('.')[2]
 
-USAGE = """%s [GROK_SERVER_URL GROK_API_KEY]
+USAGE = """%s [GROK_SERVER_URL GROK_API_KEY] [options]
 
 Export Grok model definitions.
+
+With --ndjson, models are exported one at a time, --concurrency at once, and
+each is written as a line of JSON as soon as it arrives.  When writing to a
+file with --output, the uids of exported models are recorded in FILE.done, so
+that an interrupted or partly failed export resumes where it left off when
+run again; FILE.done is removed once every model has been exported.
+
+With --since MANIFEST, only the models added, changed or removed since the
+export that wrote MANIFEST are exported, as lines of JSON:
+
+  {"op": "add", "uid": ..., "model": {...}}
+  {"op": "change", "uid": ..., "model": {...}}
+  {"op": "remove", "uid": ...}
+
+and MANIFEST is updated.  Models whose definition in the model list hasn't
+changed are not fetched.  If MANIFEST doesn't exist, every model is added.
+
+Output is compressed as it is written with --compress, or when FILE ends in
+.gz or .zst.
 """.strip() % subCommand
 
 parser = OptionParser(usage=USAGE)
@@ -40,8 +66,33 @@ parser.add_option(
   dest="output",
   metavar="FILE",
   help="Write output to FILE instead of stdout")
-try:
-  import yaml
+parser.add_option(
+  "--compress",
+  dest="compression",
+  choices=availableCompressions(),
+  help="Compress output with %s [default: from FILE extension]"
+       % " or ".join(availableCompressions()))
+parser.add_option(
+  "--ndjson",
+  dest="ndjson",
+  default=False,
+  action="store_true",
+  help="Export models concurrently, one JSON object per line")
+parser.add_option(
+  "--since",
+  dest="since",
+  metavar="MANIFEST",
+  help="Export only changes since the export that wrote MANIFEST, and update "
+       "it")
+parser.add_option(
+  "--concurrency",
+  dest="concurrency",
+  type="int",
+  default=AsyncGrokSession.concurrency,
+  help="Number of models to export at once with --ndjson or --since "
+       "[default: %default]")
+# Hidden from the user if yaml isn't available
+if importYAML() is not None:
   parser.add_option(
     "-y",
     "--yaml",
@@ -49,38 +100,233 @@ try:
     default=False,
     action="store_true",
     help="Display results in YAML format")
-except ImportError:
-  pass # yaml not available, hide from user
 
 # Implementation
 
+def writeYAMLSequence(outp, models):
+  """ Write models to outp as a YAML sequence, one model at a time.  Returns
+      the number of models written.
+  """
+  count = 0
+  for model in models:
+    outp.write(dumpYAML([model]))
+    count += 1
 
-def handle(options, args):
-  """ `grok export` handler. """
-  (server, apikey) = grokcli.getCommonArgs(parser, args)
+  return count
 
-  dump = partial(json.dumps, indent=2)
 
-  if hasattr(options, "useYaml"):
-    if options.useYaml:
-      dump = partial(yaml.safe_dump, default_flow_style=False)
+def readDone(path):
+  """ Return the set of uids recorded in a .done file """
+  try:
+    with open(path, "r") as fp:
+      return set(line.strip() for line in fp if line.strip())
+  except IOError as e:
+    if e.errno != errno.ENOENT:
+      raise
+    return set()
 
-  grok = GrokSession(server=server, apikey=apikey)
 
-  if options.output is not None:
-    outp = open(options.output, "w")
+def exportNDJSON(grok, outp, concurrency, done=frozenset(), doneFile=None):
+  """ Export every model not in `done` with grok.exportModel(), `concurrency`
+      at a time, writing each to outp as a line of JSON as soon as it arrives.
+      The uid of each exported model is appended to doneFile, if given, once
+      the model has been written.  Returns (exported, failed) counts.
+  """
+  # Read the whole model list (keeping only uids) before exporting, rather
+  # than leaving its response half-read, holding a connection that the pool
+  # doesn't account for, until the last export is submitted
+  uids = [model["uid"] for model in grok.listModels(stream=True)
+          if model["uid"] not in done]
+
+  exported = 0
+  failed = 0
+
+  with AsyncGrokSession(session=grok, concurrency=concurrency) as pool:
+    for (uid, result, error) in pool.imapUnordered(grok.exportModel, uids):
+      if error is not None:
+        failed += 1
+        print >> sys.stderr, "Failed to export %s: %s" % (uid, error)
+        continue
+
+      # The export endpoint returns a list of model specs
+      if not isinstance(result, list):
+        result = [result]
+      for model in result:
+        outp.write(dumpJSON(model) + "\n")
+      outp.flush()
+
+      if doneFile is not None:
+        doneFile.write(uid + "\n")
+        doneFile.flush()
+
+      exported += 1
+
+  return (exported, failed)
+
+
+def closeOutput(outp):
+  """ Close an output opened with openOutput(), or just flush stdout """
+  if outp is sys.stdout:
+    outp.flush()
   else:
-    outp = sys.stdout
+    outp.close()
 
-  models = grok.exportModels()
 
-  if models:
+def handleNDJSONRequest(grok, output, concurrency, compression=None):
+  if output is None:
+    outp = openOutput(None, compression)
     try:
-      print >> outp, dump(models)
+      (exported, failed) = exportNDJSON(grok, outp, concurrency)
     finally:
-      outp.flush()
-      if outp != sys.stdout:
-        outp.close()
+      closeOutput(outp)
+    skipped = 0
+
+  else:
+    donePath = output + ".done"
+    done = readDone(donePath)
+
+    # Append to the output of an interrupted export, otherwise start afresh.
+    # Appending to a compressed file adds a new compressed stream to it, which
+    # decompressors read as a continuation of the previous one, but only if
+    # the previous stream was completed: if the export was killed, its output
+    # is rewritten first.
+    compression = compression or detectCompression(output)
+    if done and compression and os.path.exists(output):
+      recoverOutput(output, compression)
+
+    with openOutput(output, compression, append=bool(done)) as outp:
+      with open(donePath, "a") as doneFile:
+        (exported, failed) = exportNDJSON(grok, outp, concurrency, done,
+                                          doneFile)
+    skipped = len(done)
+
+    if not failed:
+      os.remove(donePath)
+
+  print >> sys.stderr, ("Exported %d model(s)%s" %
+                        (exported,
+                         ", %d already exported" % skipped if skipped else ""))
+
+  if failed:
+    raise GrokCLIError("%d model(s) could not be exported; run the same "
+                       "command again to retry them" % failed)
+
+
+def exportChanges(grok, outp, manifest, concurrency):
+  """ Write add/change/remove operations to outp for the models that differ
+      from those recorded in manifest, an ExportManifest.  Only models whose
+      listModels() definition hash differs from the manifest's are fetched,
+      `concurrency` at a time; of those, models whose exported spec is
+      unchanged are not written.  Returns the updated ExportManifest and a dict
+      of counts.
+  """
+  previous = manifest.models
+  current = {}
+  definitions = {}
+  counts = dict.fromkeys(("add", "change", "remove", "unchanged", "failed"), 0)
+
+  for model in grok.listModels(stream=True):
+    uid = model["uid"]
+    definition = definitionHash(model)
+    entry = previous.get(uid)
+
+    if entry is not None and entry["definition"] == definition:
+      current[uid] = entry
+      counts["unchanged"] += 1
+    else:
+      definitions[uid] = definition
+
+  with AsyncGrokSession(session=grok, concurrency=concurrency) as pool:
+    for (uid, result, error) in pool.imapUnordered(grok.exportModel,
+                                                   definitions):
+      if error is not None:
+        counts["failed"] += 1
+        print >> sys.stderr, "Failed to export %s: %s" % (uid, error)
+        if uid in previous:
+          # Keep the old entry, whose definition hash no longer matches, so
+          # that the model is fetched again next time
+          current[uid] = previous[uid]
+        continue
+
+      content = contentHash(result)
+      current[uid] = {"definition": definitions[uid], "content": content}
+
+      if uid not in previous:
+        op = "add"
+      elif previous[uid]["content"] != content:
+        op = "change"
+      else:
+        counts["unchanged"] += 1
+        continue
+
+      outp.write(dumpJSON({"op": op, "uid": uid, "model": result}) + "\n")
+      counts[op] += 1
+
+  for uid in previous:
+    if uid not in current and uid not in definitions:
+      outp.write(dumpJSON({"op": "remove", "uid": uid}) + "\n")
+      counts["remove"] += 1
+
+  return (ExportManifest(current), counts)
+
+
+def handleSinceRequest(grok, manifestPath, output, concurrency,
+                       compression=None):
+  try:
+    manifest = ExportManifest.load(manifestPath)
+  except ValueError as e:
+    raise GrokCLIError(str(e))
+
+  outp = openOutput(output, compression)
+  try:
+    (manifest, counts) = exportChanges(grok, outp, manifest, concurrency)
+  finally:
+    closeOutput(outp)
+
+  # Only once the changes have been written out
+  manifest.save(manifestPath)
+
+  print >> sys.stderr, ("%(add)d added, %(change)d changed, %(remove)d "
+                        "removed, %(unchanged)d unchanged model(s)" % counts)
+
+  if counts["failed"]:
+    raise GrokCLIError("%d model(s) could not be exported; they will be "
+                       "exported by the next run" % counts["failed"])
+
+
+def handle(options, args):
+  """ `grok export` handler. """
+  (server, apikey) = grokcli.getCommonArgs(parser, args)
+
+  grok = GrokSession(server=server, apikey=apikey)
+
+  if options.since:
+    handleSinceRequest(grok, options.since, options.output,
+                       options.concurrency, options.compression)
+    return
+
+  if options.ndjson:
+    handleNDJSONRequest(grok, options.output, options.concurrency,
+                        options.compression)
+    return
+
+  # Models are decoded from the response and written to the output one at a
+  # time, so memory use doesn't grow with the number of models
+  models = iter(grok.exportModels(stream=True))
+  first = next(models, None)
+
+  outp = openOutput(options.output, options.compression)
+  try:
+    # Nothing is written if there are no models
+    if first is not None:
+      models = chain([first], models)
+      if getattr(options, "useYaml", False):
+        writeYAMLSequence(outp, models)
+      else:
+        writeJSONArray(outp, models, indent=2)
+        print >> outp
+  finally:
+    closeOutput(outp)
 
 
 if __name__ == "__main__":
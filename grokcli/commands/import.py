@@ -14,15 +14,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-try:
-  import yaml
-except ImportError:
-  import json # yaml not available, fall back to json
+from itertools import chain
 import select
 import sys
 
 from functools import partial
 from grokcli.api import GrokSession
+from grokcli.bulk import BulkImporter
+from grokcli.compression import availableCompressions, openInput
+from grokcli.exceptions import GrokCLIError
+from grokcli.jsonstream import (ChunkReader, iterJSONArray, iterJSONValues,
+                                readChunks)
+from grokcli.manifest import contentHash, modelIdentity
+from grokcli import serialization
+from grokcli.serialization import dumpJSON
 import grokcli
 from optparse import OptionParser
 
@@ -33,9 +38,27 @@ if __name__ == "__main__":
 else:
   subCommand = "%%prog %s" % __name__.rpartition('.')[2]
 
-USAGE = """%s [GROK_SERVER_URL GROK_API_KEY] [FILE]
+USAGE = """%s [GROK_SERVER_URL GROK_API_KEY] [FILE] [options]
 
 Import Grok model definitions.
+
+FILE may hold a JSON array of models, JSON objects one per line (as written by
+grok export --ndjson), or, if PyYAML is installed, YAML documents each holding
+a model or a list of models.  Models are created as FILE is parsed, so memory
+use doesn't grow with its size.  If FILE turns out to be invalid part way
+through, the models before the error will have been created; fix FILE and
+import it again with --sync to create the rest.
+
+With --sync, the server's models are exported first, and only models that
+don't exist yet are created.  A model exists if a server model has the same
+datasource and metricSpec (and stackSpec, for autostacks).  An existing model
+whose definition differs in other ways, e.g. its modelParams, is reported as
+a conflict and left unchanged.  Add --dry-run to print the plan, one JSON
+object per model with an "action" of create, skip or conflict, without
+creating anything.
+
+FILE is decompressed as it is read with --compress, or when it ends in .gz or
+.zst.
 """.strip() % subCommand
 
 parser = OptionParser(usage=USAGE)
@@ -46,12 +69,191 @@ parser.add_option(
   metavar="FILE or -",
   help="Path to file containing Grok model definitions, or - if you " \
        "want to read the data from stdin.")
+parser.add_option(
+  "--compress",
+  dest="compression",
+  choices=availableCompressions(),
+  help="Decompress input with %s [default: from FILE extension]"
+       % " or ".join(availableCompressions()))
+parser.add_option(
+  "--chunk-size",
+  dest="chunkSize",
+  type="int",
+  default=BulkImporter.chunkSize,
+  metavar="N",
+  help="Number of models to create per request (default: %default)")
+parser.add_option(
+  "--concurrency",
+  dest="concurrency",
+  type="int",
+  default=BulkImporter.concurrency,
+  metavar="N",
+  help="Number of requests to keep in flight (default: %default)")
+parser.add_option(
+  "--retries",
+  dest="retries",
+  type="int",
+  default=BulkImporter.retries,
+  metavar="N",
+  help="Number of times to retry each model of a failed request " \
+       "(default: %default)")
+parser.add_option(
+  "--sync",
+  dest="sync",
+  default=False,
+  action="store_true",
+  help="Only create models that don't already exist on the server")
+parser.add_option(
+  "--dry-run",
+  dest="dryRun",
+  default=False,
+  action="store_true",
+  help="Print the --sync plan instead of creating models (implies --sync)")
 
 # Implementation
 
-def importMetricsFromFile(grok, fp, **kwargs):
-  models = grokcli.load(fp.read())
-  result = grok.createModels(models)
+if serialization.importYAML() is not None:
+  DECODE_ERRORS = (ValueError, serialization.yaml.YAMLError)
+else:
+  DECODE_ERRORS = (ValueError,)
+
+
+def importModels(grok, models, chunkSize=None, concurrency=None, retries=None,
+                 **kwargs):
+  """ Create models in bulk, printing the uid of each created model to stdout
+      and a description of each failure to stderr.
+  """
+  importer = BulkImporter(grok,
+                          chunkSize=chunkSize,
+                          concurrency=concurrency,
+                          retries=retries)
+  total = 0
+  failed = 0
+
+  for (model, result, error) in importer.run(models):
+    total += 1
+    if error is not None:
+      failed += 1
+      print >> sys.stderr, "Failed to import %s: %s" % (dumpJSON(model),
+                                                        error)
+    elif result is not None:
+      print result["uid"]
+
+  print >> sys.stderr, "Imported %d of %d models" % (total - failed, total)
+
+  if failed:
+    raise GrokCLIError("%d of %d models failed to import" % (failed, total))
+
+
+def planSync(grok, models):
+  """ Compare models with the server's, yielding (action, model) for each
+      model: "create" if no server model has its identity (see
+      grokcli.manifest.modelIdentity), "skip" if one has the same definition,
+      or a model with the same identity appeared earlier in models, and
+      "conflict" if one has a different definition.  The server's models are
+      exported once, and only their hashes kept.
+  """
+  existing = dict((modelIdentity(model), contentHash(model))
+                  for model in grok.exportModels(stream=True))
+  seen = set()
+
+  for model in models:
+    identity = modelIdentity(model)
+
+    if identity in seen:
+      yield ("skip", model)
+    elif identity not in existing:
+      yield ("create", model)
+    elif existing[identity] == contentHash(model):
+      yield ("skip", model)
+    else:
+      yield ("conflict", model)
+
+    seen.add(identity)
+
+
+def syncModels(grok, models, dryRun=False, **kwargs):
+  """ Create the models that planSync() finds missing from the server """
+  counts = dict.fromkeys(("create", "skip", "conflict"), 0)
+
+  def creates():
+    for (action, model) in planSync(grok, models):
+      counts[action] += 1
+
+      if dryRun:
+        print dumpJSON({"action": action, "model": model})
+      elif action == "conflict":
+        print >> sys.stderr, ("Skipping %s: a model with the same metric but "
+                              "a different definition exists"
+                              % dumpJSON(model))
+      elif action == "create":
+        yield model
+
+  if dryRun:
+    for _ in creates():
+      pass
+
+    print >> sys.stderr, ("Would create %d, and skip %d existing and %d "
+                          "conflicting model(s)" % (counts["create"],
+                                                    counts["skip"],
+                                                    counts["conflict"]))
+    return
+
+  try:
+    importModels(grok, creates(), **kwargs)
+  finally:
+    print >> sys.stderr, ("Skipped %d existing and %d conflicting model(s)"
+                          % (counts["skip"], counts["conflict"]))
+
+
+def iterModels(fp, chunkSize=64 * 1024):
+  """ Decode model definitions from fp incrementally, yielding each model as
+      soon as it has been read.  Input starting with "[" is decoded as a JSON
+      array, input starting with "{" as a sequence of JSON objects (e.g.
+      NDJSON), and anything else as YAML documents.  Lists at the top level are
+      flattened.
+  """
+  chunks = readChunks(fp, chunkSize)
+
+  # Look ahead to the first non-whitespace character
+  head = ""
+  for chunk in chunks:
+    head += chunk
+    if head.strip():
+      break
+
+  chunks = chain([head], chunks)
+  first = head.lstrip()[:1]
+
+  try:
+    if not first:
+      values = ()
+    elif first == "[":
+      values = iterJSONArray(chunks)
+    elif first == "{" or serialization.importYAML() is None:
+      values = iterJSONValues(chunks)
+    else:
+      values = serialization.iterYAMLItems(ChunkReader(chunks))
+
+    for value in values:
+      if isinstance(value, list):
+        for model in value:
+          yield model
+      elif value is not None:
+        yield value
+
+  except DECODE_ERRORS as e:
+    raise GrokCLIError("Invalid model definitions: %s" % e)
+
+
+def importMetricsFromFile(grok, fp, sync=False, dryRun=False, compression=None,
+                          **kwargs):
+  models = iterModels(fp)
+
+  if sync or dryRun:
+    syncModels(grok, models, dryRun=dryRun, **kwargs)
+  else:
+    importModels(grok, models, **kwargs)
 
 
 def handle(options, args):
@@ -71,12 +273,13 @@ def handle(options, args):
 
   if data.strip() == "-":
     if select.select([sys.stdin,],[],[],0.0)[0]:
-      importMetricsFromFile(grok, sys.stdin, **vars(options))
+      importMetricsFromFile(grok, openInput("-", options.compression),
+                            **vars(options))
     else:
       parser.print_help()
       sys.exit(1)
   elif data:
-    with open(data, "r") as fp:
+    with openInput(data, options.compression) as fp:
       importMetricsFromFile(grok, fp, **vars(options))
 
 
@@ -14,7 +14,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
 from optparse import OptionParser
 import sys
 
@@ -22,6 +21,7 @@ from prettytable import PrettyTable
 
 import grokcli
 from grokcli.api import GrokSession
+from grokcli.serialization import dumpJSON
 
 
 if __name__ == "__main__":
@@ -58,7 +58,7 @@ def handleListRequest(grok, fmt):
   instances = grok.listInstances()
 
   if fmt == "json":
-    print(json.dumps(instances))
+    print(dumpJSON(instances))
   else:
     table = PrettyTable()
 
@@ -14,14 +14,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #------------------------------------------------------------------------------
-import json
+from fnmatch import fnmatchcase
 from optparse import OptionParser
 import sys
 
 from prettytable import PrettyTable
 
 import grokcli
-from grokcli.api import GrokSession
+from grokcli.api import AsyncGrokSession, GrokSession
+from grokcli.exceptions import GrokCLIError
+from grokcli.jsonstream import writeJSONArray
+from grokcli.serialization import dumpJSON
 
 
 if __name__ == "__main__":
@@ -32,8 +35,18 @@ else:
 USAGE = """%s (list|unmonitor) [GROK_SERVER_URL GROK_API_KEY] [options]
 
 Manage monitored metrics.
+
+Unmonitor one metric with --id, or all metrics matching a selector with
+--match.  A selector is a comma-separated list of FIELD=PATTERN conditions,
+where FIELD is one of datasource, server, name or status and PATTERN may
+contain shell-style wildcards, e.g.:
+
+  --match 'datasource=cloudwatch,server=us-west-2/AWS/EC2/*'
 """.strip() % subCommand
 
+# Model fields that can be used in --match selectors
+SELECTOR_FIELDS = ("datasource", "server", "name", "status")
+
 
 parser = OptionParser(usage=USAGE)
 parser.add_option(
@@ -56,6 +69,26 @@ parser.add_option(
   dest="region",
   metavar="REGION",
   help="AWS Region (cloudwatch only)")
+parser.add_option(
+  "--match",
+  dest="match",
+  metavar="SELECTOR",
+  help="Unmonitor all metrics matching SELECTOR (see above)")
+parser.add_option(
+  "--dry-run",
+  dest="dryRun",
+  action="store_true",
+  default=False,
+  help="List the metrics that --match would unmonitor, without " \
+       "unmonitoring them")
+parser.add_option(
+  "--concurrency",
+  dest="concurrency",
+  type="int",
+  default=AsyncGrokSession.concurrency,
+  metavar="N",
+  help="Number of metrics to unmonitor at a time with --match " \
+       "(default: %default)")
 parser.add_option(
   "--format",
   dest="format",
@@ -69,32 +102,94 @@ def printHelpAndExit():
   sys.exit(1)
 
 
-def handleListRequest(grok, fmt, region=None, namespace=None, instance=None):
-  models = grok.listModels()
+def parseSelector(selector):
+  """ Parse "FIELD=PATTERN,..." into a dict of field -> pattern """
+  conditions = {}
+
+  for condition in selector.split(","):
+    (field, sep, pattern) = condition.partition("=")
+    field = field.strip()
+
+    if not sep or field not in SELECTOR_FIELDS:
+      raise GrokCLIError("Invalid selector condition: {0!r} (expected "
+                         "FIELD=PATTERN, where FIELD is one of {1})".format(
+                           condition, ", ".join(SELECTOR_FIELDS)))
+
+    conditions[field] = pattern.strip()
+
+  return conditions
+
+
+def matchesSelector(model, conditions):
+  return all(fnmatchcase(unicode(model.get(field, "")), pattern)
+             for (field, pattern) in conditions.items())
+
+
+def printModelsTable(models):
+  table = PrettyTable(["ID", "Display Name", "Name", "Status"])
+
+  for x in models:
+    table.add_row([x['uid'], x['display_name'], x['name'], x['status']])
 
+  table.align = "l"  # left align
+  print(table)
+
+
+def handleListRequest(grok, fmt, region=None, namespace=None, instance=None):
   if region and namespace and instance:
     server = "{0}/{1}/{2}".format(region, namespace, instance)
-    models = [m for m in models if (m["datasource"] == "cloudwatch" and
-                                    m["server"] == server)]
+    models = grok.findModels("cloudwatch", server=server)
+  else:
+    # Models are decoded one at a time as the response arrives
+    models = grok.listModels(stream=True)
 
   if fmt == "json":
-    print(json.dumps(models))
+    writeJSONArray(sys.stdout, models)
+    print
   else:
-    table = PrettyTable()
-
-    table.add_column("ID", [x['uid'] for x in models])
-    table.add_column("Display Name", [x['display_name'] for x in models])
-    table.add_column("Name", [x['name'] for x in models])
-    table.add_column("Status", [x['status'] for x in models])
-
-    table.align = "l"  # left align
-    print(table)
+    printModelsTable(models)
 
 
 def handleUnmonitorRequest(grok, metricID):
   grok.deleteModel(metricID)
 
 
+def handleBulkUnmonitorRequest(grok, selector, dryRun=False, concurrency=None,
+                               fmt="text"):
+  """ Unmonitor all metrics matching selector, up to `concurrency` at a time,
+      printing the uid of each unmonitored metric.
+  """
+  conditions = parseSelector(selector)
+
+  models = [m for m in grok.listModels(stream=True)
+            if matchesSelector(m, conditions)]
+
+  if dryRun:
+    if fmt == "json":
+      print(dumpJSON(models))
+    else:
+      printModelsTable(models)
+    print >> sys.stderr, "%d metric(s) would be unmonitored" % len(models)
+    return
+
+  failed = 0
+
+  with AsyncGrokSession(session=grok, concurrency=concurrency) as pool:
+    for (uid, _, error) in pool.imapUnordered(grok.deleteModel,
+                                              [m["uid"] for m in models]):
+      if error is None:
+        print uid
+      else:
+        failed += 1
+        print >> sys.stderr, "Failed to unmonitor %s: %s" % (uid, error)
+
+  print >> sys.stderr, "Unmonitored %d of %d metric(s)" % (
+    len(models) - failed, len(models))
+
+  if failed:
+    raise GrokCLIError("%d metric(s) could not be unmonitored" % failed)
+
+
 def handle(options, args):
   """ `grok metrics` handler. """
   try:
@@ -111,10 +206,15 @@ def handle(options, args):
                       region=options.region, namespace=options.namespace,
                       instance=options.instance)
   elif action == "unmonitor":
-    if not options.id:
+    if options.match:
+      handleBulkUnmonitorRequest(grok, options.match,
+                                 dryRun=options.dryRun,
+                                 concurrency=options.concurrency,
+                                 fmt=options.format)
+    elif options.id:
+      handleUnmonitorRequest(grok, options.id)
+    else:
       printHelpAndExit()
-
-    handleUnmonitorRequest(grok, options.id)
   else:
     printHelpAndExit()
 
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+from optparse import OptionParser
+import sys
+
+from grokcli.commands.shell import execute, startSession
+
+
+if __name__ == "__main__":
+  subCommand = "%prog"
+else:
+  subCommand = "%%prog %s" % __name__.rpartition('.')[2]
+
+USAGE = """%s FILE [GROK_SERVER_URL GROK_API_KEY] [options]
+
+Run a script of grok commands, one per line, in a single process.  See
+`grok shell` for the command syntax.  Use - to read the script from stdin.
+""".strip() % subCommand
+
+parser = OptionParser(usage=USAGE)
+parser.add_option(
+  "-k",
+  "--keep-going",
+  dest="keepGoing",
+  action="store_true",
+  default=False,
+  help="Continue with the next command after a command fails")
+parser.add_option(
+  "-v",
+  "--verbose",
+  dest="verbose",
+  action="store_true",
+  default=False,
+  help="Print each command to stderr before running it")
+
+# Implementation
+
+def runScript(fp, keepGoing=False, verbose=False):
+  """ Execute each line of fp, returning the exit status of the last failed
+      command (0 if all succeeded).
+  """
+  status = 0
+
+  for line in fp:
+    line = line.strip()
+
+    if not line or line.startswith("#"):
+      continue
+
+    if verbose:
+      print >> sys.stderr, "+", line
+
+    result = execute(line)
+
+    if result:
+      status = result
+      if not keepGoing:
+        break
+
+  return status
+
+
+def handle(options, args):
+  """ `grok run` handler. """
+  try:
+    script = args.pop(0)
+  except IndexError:
+    parser.print_help(sys.stderr)
+    sys.exit(1)
+
+  startSession(args)
+
+  if script.strip() == "-":
+    status = runScript(sys.stdin, options.keepGoing, options.verbose)
+  else:
+    with open(script, "r") as fp:
+      status = runScript(fp, options.keepGoing, options.verbose)
+
+  sys.exit(status)
+
+
+if __name__ == "__main__":
+  handle(*parser.parse_args())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+import cmd
+from contextlib import contextmanager
+from optparse import OptionParser
+import os
+import shlex
+import sys
+
+from grokcli.api import GrokSession
+from grokcli.commands import COMMANDS, loadCommand
+from grokcli.exceptions import GrokCLIError
+from grokcli.timings import TimedHTTPAdapter
+
+
+if __name__ == "__main__":
+  subCommand = "%prog"
+else:
+  subCommand = "%%prog %s" % __name__.rpartition('.')[2]
+
+USAGE = """%s [GROK_SERVER_URL GROK_API_KEY]
+
+Interactive shell.  Each line is a grok command without the leading `grok`, for
+example `metrics list`.  All commands run in one process and share keep-alive
+connections to the server.  If GROK_SERVER_URL and GROK_API_KEY are given, they
+are used by every command, and GET, POST and DELETE accept a path relative to
+GROK_SERVER_URL (e.g. `GET /_models`).
+""".strip() % subCommand
+
+parser = OptionParser(usage=USAGE)
+
+# Commands that can't be run from within a shell or script
+NESTED_COMMANDS = ("shell", "run")
+HTTP_COMMANDS = ("DELETE", "GET", "POST")
+
+# Implementation
+
+@contextmanager
+def environ(**values):
+  """ Temporarily override environment variables """
+  saved = dict((key, os.environ.get(key)) for key in values)
+  os.environ.update(values)
+  try:
+    yield
+  finally:
+    for (key, value) in saved.items():
+      if value is None:
+        del os.environ[key]
+      else:
+        os.environ[key] = value
+
+
+def startSession(args):
+  """ Configure the process to run successive commands: all GrokSessions share
+      one connection pool, and if server and API key are given they become the
+      defaults for every command.
+  """
+  GrokSession.adapter = TimedHTTPAdapter()
+
+  if len(args) >= 2:
+    os.environ["GROK_SERVER_URL"] = args.pop(0)
+    os.environ["GROK_API_KEY"] = args.pop(0)
+
+
+def execute(line):
+  """ Run a single grok command line (without the leading `grok`), returning
+      its exit status.  Errors are printed to stderr rather than raised.
+  """
+  try:
+    args = shlex.split(line, comments=True)
+  except ValueError as e:
+    print >> sys.stderr, "ERROR:", e
+    return 1
+
+  if not args:
+    return 0
+
+  subcommand = args.pop(0)
+
+  if subcommand not in COMMANDS or subcommand in NESTED_COMMANDS:
+    print >> sys.stderr, "ERROR: Unknown command:", subcommand
+    return 1
+
+  submodule = loadCommand(subcommand)
+
+  overrides = {}
+  if (subcommand in HTTP_COMMANDS and args and args[0].startswith("/") and
+      "GROK_SERVER_URL" in os.environ):
+    # Relative path, resolve against the shell's server
+    overrides["GROK_SERVER_URL"] = os.environ["GROK_SERVER_URL"] + args.pop(0)
+
+  try:
+    with environ(**overrides):
+      (options, args) = submodule.parser.parse_args(args)
+      submodule.handle(options, args)
+  except GrokCLIError as e:
+    print >> sys.stderr, "ERROR:", e.message
+    return 1
+  except SystemExit as e:
+    if e.code is None or isinstance(e.code, (bool, int)):
+      return int(e.code or 0)
+    print >> sys.stderr, e.code
+    return 1
+  except Exception as e:
+    # Anything else, e.g. an unreadable input file, fails this command rather
+    # than ending the shell or script
+    print >> sys.stderr, "ERROR:", e
+    return 1
+
+  return 0
+
+
+
+class GrokShell(cmd.Cmd):
+  prompt = "grok> "
+
+
+  def default(self, line):
+    execute(line)
+
+
+  def emptyline(self):
+    pass
+
+
+  def do_help(self, arg):
+    if arg:
+      execute(arg + " --help")
+    else:
+      print "Available commands:\n"
+      for command in sorted(COMMANDS):
+        if command not in NESTED_COMMANDS:
+          print "    %-13s%s" % (command, COMMANDS[command])
+      print "\nType `help COMMAND` for command usage, `exit` to quit."
+
+
+  def do_exit(self, arg):
+    return True
+
+
+  do_quit = do_exit
+
+
+  def do_EOF(self, arg):
+    print
+    return True
+
+
+
+def handle(options, args):
+  """ `grok shell` handler. """
+  startSession(args)
+
+  GrokShell().cmdloop()
+
+
+if __name__ == "__main__":
+  handle(*parser.parse_args())
@@ -0,0 +1,296 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Incrementally compressed and decompressed file streams, for export and
+    import.  gzip is always available; zstd requires the zstandard package.
+    See openOutput() and openInput().
+"""
+import os
+import sys
+import tempfile
+import zlib
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None # zstd not available, hide from user
+
+from grokcli.exceptions import GrokCLIError
+
+
+
+# Compression name: file extensions
+EXTENSIONS = {
+  "gzip": (".gz", ".gzip"),
+  "zstd": (".zst", ".zstd")}
+
+
+def availableCompressions():
+  """ Return the names of the compressions that can be used """
+  return sorted(name for name in EXTENSIONS
+                if name != "zstd" or zstandard is not None)
+
+
+def detectCompression(path):
+  """ Return the compression implied by path's extension, or None """
+  if path:
+    for (name, extensions) in EXTENSIONS.iteritems():
+      if path.endswith(extensions):
+        return name
+
+
+def _compressor(compression):
+  if compression == "gzip":
+    # wbits of 16 + MAX_WBITS selects the gzip container
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+  if zstandard is None:
+    raise ValueError("zstd compression requires the zstandard package")
+  return zstandard.ZstdCompressor().compressobj()
+
+
+def _syncFlushMode(compression):
+  if compression == "gzip":
+    return zlib.Z_SYNC_FLUSH
+  return zstandard.COMPRESSOBJ_FLUSH_BLOCK
+
+
+def _decompressor(compression):
+  if compression == "gzip":
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+  if zstandard is None:
+    raise ValueError("zstd decompression requires the zstandard package")
+  return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _finished(decompressor):
+  """ Return whether decompressor has reached the end of its stream """
+  if hasattr(decompressor, "eof"):
+    return decompressor.eof
+
+  if not hasattr(decompressor, "copy"):
+    return True # No way to tell
+
+  # Python 2's zlib has no eof, but leaves input following the end of the
+  # stream in unused_data
+  probe = decompressor.copy()
+  try:
+    probe.decompress("\0")
+  except zlib.error:
+    return False
+  return probe.unused_data == "\0"
+
+
+
+class CompressedWriter(object):
+  """ File-like object compressing everything written to it into fp """
+
+  def __init__(self, fp, compression, closeFile=True):
+    self.fp = fp
+    self.closeFile = closeFile
+    self._compressor = _compressor(compression)
+    self._syncFlushMode = _syncFlushMode(compression)
+
+
+  def write(self, data):
+    compressed = self._compressor.compress(data)
+    if compressed:
+      self.fp.write(compressed)
+
+
+  def flush(self):
+    """ Write out everything written so far, so that it can be decompressed
+        from the file even if the stream is never closed
+    """
+    self.fp.write(self._compressor.flush(self._syncFlushMode))
+    self.fp.flush()
+
+
+  def close(self):
+    if self._compressor is None:
+      return
+    self.fp.write(self._compressor.flush())
+    self._compressor = None
+
+    if self.closeFile:
+      self.fp.close()
+    else:
+      self.fp.flush()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+
+class CompressedReader(object):
+  """ File-like object decompressing fp `chunkSize` bytes at a time, with
+      read(), readline() and line iteration.  Concatenated streams, as
+      produced by appending to a compressed file, are read in turn.
+
+      A GrokCLIError is raised if fp ends part way through a stream, e.g.
+      because it was cut off, unless `strict` is False, in which case whatever
+      could be decompressed is read.
+  """
+
+  chunkSize = 64 * 1024
+
+
+  def __init__(self, fp, compression, closeFile=True, strict=True):
+    self.fp = fp
+    self.compression = compression
+    self.closeFile = closeFile
+    self.strict = strict
+    self._decompressor = _decompressor(compression)
+    self._started = False
+    self._buffer = ""
+    self._eof = False
+
+
+  def _fill(self):
+    """ Decompress more data into the buffer.  Returns False at EOF. """
+    while not self._eof:
+      data = self.fp.read(self.chunkSize)
+      if not data:
+        self._eof = True
+        if (self.strict and self._started and
+            not _finished(self._decompressor)):
+          raise GrokCLIError("Compressed input ends unexpectedly; it may "
+                             "have been cut off")
+        return False
+
+      while data:
+        self._started = True
+        self._buffer += self._decompressor.decompress(data)
+
+        # Bytes following the end of one stream start the next one
+        data = getattr(self._decompressor, "unused_data", "")
+        if data:
+          self._decompressor = _decompressor(self.compression)
+          self._started = False
+
+      if self._buffer:
+        return True
+
+    return False
+
+
+  def read(self, size=-1):
+    if size < 0:
+      while self._fill():
+        pass
+      (data, self._buffer) = (self._buffer, "")
+      return data
+
+    while len(self._buffer) < size and self._fill():
+      pass
+    (data, self._buffer) = (self._buffer[:size], self._buffer[size:])
+    return data
+
+
+  def readline(self):
+    while True:
+      end = self._buffer.find("\n") + 1
+      if end:
+        break
+      if not self._fill():
+        end = len(self._buffer)
+        break
+
+    (line, self._buffer) = (self._buffer[:end], self._buffer[end:])
+    return line
+
+
+  def __iter__(self):
+    return iter(self.readline, "")
+
+
+  def close(self):
+    if self.closeFile:
+      self.fp.close()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+
+def openOutput(path, compression=None, append=False):
+  """ Open path (stdout if None or "-") for writing, compressing with
+      `compression`, or the compression implied by its extension
+  """
+  compression = compression or detectCompression(path)
+  toStdout = path in (None, "-")
+
+  if toStdout:
+    fp = sys.stdout
+  else:
+    fp = open(path, "ab" if append else "wb")
+
+  if compression is None:
+    return fp
+
+  return CompressedWriter(fp, compression, closeFile=not toStdout)
+
+
+def recoverOutput(path, compression):
+  """ Rewrite a compressed file that may have been cut off part way through a
+      stream, e.g. by a crash, so that it holds only the complete lines that
+      can be decompressed from it, in one complete stream, and can be appended
+      to.  Returns the number of decompressed bytes dropped.
+  """
+  directory = os.path.dirname(os.path.abspath(path))
+  (fd, tmpPath) = tempfile.mkstemp(dir=directory, prefix=".recover")
+  dropped = 0
+  try:
+    with open(path, "rb") as inp:
+      reader = CompressedReader(inp, compression, strict=False)
+      with CompressedWriter(os.fdopen(fd, "wb"), compression) as outp:
+        for line in reader:
+          if line.endswith("\n"):
+            outp.write(line)
+          else:
+            dropped += len(line)
+    os.rename(tmpPath, path)
+  except:
+    os.remove(tmpPath)
+    raise
+
+  return dropped
+
+
+def openInput(path, compression=None):
+  """ Open path (stdin if None or "-") for reading, decompressing with
+      `compression`, or the compression implied by its extension
+  """
+  compression = compression or detectCompression(path)
+  fromStdin = path in (None, "-")
+
+  if fromStdin:
+    fp = sys.stdin
+  else:
+    fp = open(path, "rb" if compression else "r")
+
+  if compression is None:
+    return fp
+
+  return CompressedReader(fp, compression, closeFile=not fromStdin)
@@ -0,0 +1,120 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Deduplication of custom metric samples.  See Deduplicator. """
+import errno
+import os
+import tempfile
+
+
+
+class Deduplicator(object):
+  """ Drops samples that are not newer than the last sample accepted for the
+      same metric, before they reach `downstream` (e.g. a CustomMetricWriter),
+      so that re-sent overlapping windows of data reach the server once:
+
+        with Deduplicator(grok.writer(), "~/.grok/dedup.state") as writer:
+          writer.write("{metric name}", value, timestamp)
+
+      Only the last accepted timestamp of each metric is kept.  Dropped
+      samples are counted in `duplicates` (same timestamp) and `outOfOrder`
+      (older timestamp).
+
+      If `stateFile` is given, the timestamps are loaded from it, and saved to
+      it on close() once downstream has been closed, so that deduplication
+      carries across runs.
+
+      Not thread-safe; write from a single thread.
+  """
+
+  def __init__(self, downstream, stateFile=None):
+    self.downstream = downstream
+    self.stateFile = stateFile and os.path.expanduser(stateFile)
+
+    self.duplicates = 0
+    self.outOfOrder = 0
+
+    self._last = {}
+    if self.stateFile:
+      self._load()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+  def _load(self):
+    try:
+      with open(self.stateFile, "r") as fp:
+        for line in fp:
+          (name, _, timestamp) = line.rstrip("\n").rpartition(" ")
+          if name:
+            self._last[name] = int(timestamp)
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+
+  def _save(self):
+    directory = os.path.dirname(os.path.abspath(self.stateFile))
+    (fd, tmpPath) = tempfile.mkstemp(dir=directory, prefix=".dedup")
+    try:
+      with os.fdopen(fd, "w") as fp:
+        fp.writelines("%s %d\n" % item for item in self._last.iteritems())
+      os.rename(tmpPath, self.stateFile)
+    except:
+      os.remove(tmpPath)
+      raise
+
+
+  def write(self, name, value, timestamp):
+    """ Pass the sample downstream, unless it is not newer than the last one
+        accepted for the same metric
+    """
+    last = self._last.get(name)
+
+    if last is not None and timestamp <= last:
+      if timestamp == last:
+        self.duplicates += 1
+      else:
+        self.outOfOrder += 1
+      return
+
+    self._last[name] = timestamp
+    self.downstream.write(name, value, timestamp)
+
+
+  def flush(self):
+    self.downstream.flush()
+
+
+  def close(self):
+    """ Close downstream, then save the state file, if any """
+    self.downstream.close()
+    if self.stateFile:
+      self._save()
+
+
+  def stats(self):
+    """ Return downstream's stats, plus the deduplication counters """
+    stats = dict(self.downstream.stats())
+    stats.update({
+      "duplicates": self.duplicates,
+      "outOfOrder": self.outOfOrder})
+    return stats
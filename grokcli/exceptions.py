@@ -23,3 +23,7 @@ class InvalidGrokHostError(GrokCLIError):
 
 class InvalidCredentialsError(GrokCLIError):
   pass
+
+
+class ModelNotFoundError(GrokCLIError):
+  pass
@@ -0,0 +1,272 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Local index of a Grok server's models.  See ModelIndex.
+"""
+import errno
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+
+def _owner(server, apikey):
+  return hashlib.sha1("{0}\0{1}".format(server, apikey)).hexdigest()
+
+
+
+class ModelIndex(object):
+  """ Index of models by uid, (datasource, name) and (datasource, server), so
+      that name-based lookups don't scan the full model list:
+
+        index = ModelIndex(grok.listModels())
+        index.find("cloudwatch", name="AWS/EC2/CPUUtilization",
+                   server="us-west-2/AWS/EC2/i-abc123")
+
+      An index can be persisted to `path` as a snapshot (one model per line)
+      plus a journal of subsequent additions and removals, so that successive
+      processes can reuse it for up to `maxAge` seconds; see
+      GrokSession.modelIndex.
+  """
+
+  # False if the index was loaded from a persisted snapshot rather than built
+  # from the server's current model list
+  fresh = True
+
+  # Rewrite the snapshot once the journal has this many entries (or as many
+  # entries as there are models, if greater)
+  maxJournal = 1000
+
+  # Rebuild a persisted index from the server once it is this many seconds
+  # old, since models created or deleted by other clients, and the status of
+  # every model, are only picked up when it is rebuilt
+  maxAge = 300
+
+
+  def __init__(self, models=(), path=None, owner=None, built=None):
+    self.path = path
+    self.owner = owner
+    # When the models were listed from the server
+    self.built = time.time() if built is None else built
+    self._byUid = {}
+    self._byName = {}
+    self._byServer = {}
+    self._journalLength = 0
+    self._lock = threading.Lock()
+
+    for model in models:
+      self._add(model)
+
+
+  def __len__(self):
+    return len(self._byUid)
+
+
+  def __iter__(self):
+    return self._byUid.itervalues()
+
+
+  def __contains__(self, uid):
+    return uid in self._byUid
+
+
+  @property
+  def _journalPath(self):
+    return self.path + ".journal"
+
+
+  def _add(self, model):
+    uid = model["uid"]
+
+    if uid in self._byUid:
+      self._remove(uid)
+
+    self._byUid[uid] = model
+    self._byName.setdefault((model["datasource"], model["name"]),
+                            []).append(uid)
+    self._byServer.setdefault((model["datasource"], model["server"]),
+                              []).append(uid)
+
+
+  def _remove(self, uid):
+    model = self._byUid.pop(uid, None)
+
+    if model is None:
+      return
+
+    for (index, key) in (
+        (self._byName, (model["datasource"], model["name"])),
+        (self._byServer, (model["datasource"], model["server"]))):
+      uids = index[key]
+      uids.remove(uid)
+      if not uids:
+        del index[key]
+
+
+  def _journal(self, entry):
+    if self.path is None:
+      return
+
+    with open(self._journalPath, "a") as fp:
+      fp.write(json.dumps(entry) + "\n")
+
+    self._journalLength += 1
+
+    if self._journalLength > max(self.maxJournal, len(self)):
+      self.save()
+
+
+  def get(self, uid):
+    return self._byUid.get(uid)
+
+
+  def find(self, datasource, name=None, server=None):
+    """ Return the models of datasource matching name and/or server """
+    if name is not None:
+      uids = self._byName.get((datasource, name), ())
+    elif server is not None:
+      uids = self._byServer.get((datasource, server), ())
+    else:
+      return [model for model in self if model["datasource"] == datasource]
+
+    models = [self._byUid[uid] for uid in uids]
+
+    if name is not None and server is not None:
+      models = [model for model in models if model["server"] == server]
+
+    return models
+
+
+  def add(self, model):
+    """ Add (or replace) a model, e.g. after creating it """
+    with self._lock:
+      self._add(model)
+      self._journal(["+", model])
+
+
+  def remove(self, uid):
+    """ Remove a model, e.g. after deleting it """
+    with self._lock:
+      if uid in self._byUid:
+        self._remove(uid)
+        self._journal(["-", uid])
+
+
+  @classmethod
+  def recordRemoval(cls, path, uid):
+    """ Journal the removal of a model from the persisted index at path
+        without loading it
+    """
+    if os.path.exists(path):
+      with open(path + ".journal", "a") as fp:
+        fp.write(json.dumps(["-", uid]) + "\n")
+
+
+  def save(self):
+    """ Write a snapshot of the index to `path` and truncate the journal """
+    directory = os.path.dirname(os.path.abspath(self.path))
+    (fd, tmp) = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+      with os.fdopen(fd, "w") as fp:
+        fp.write(json.dumps({"owner": self.owner, "built": self.built}) +
+                 "\n")
+        for model in self:
+          fp.write(json.dumps(model) + "\n")
+      os.rename(tmp, self.path)
+    except:
+      os.remove(tmp)
+      raise
+
+    self.discardJournal()
+
+
+  def discardJournal(self):
+    try:
+      os.remove(self._journalPath)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+    self._journalLength = 0
+
+
+  def delete(self):
+    """ Remove the persisted snapshot, e.g. once it is known to be stale """
+    self.discardJournal()
+
+    try:
+      os.remove(self.path)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        raise
+
+
+  @classmethod
+  def load(cls, path, owner):
+    """ Load a persisted index, returning None if there is none for owner, or
+        it is more than maxAge seconds old
+    """
+    try:
+      with open(path, "r") as fp:
+        header = json.loads(fp.readline())
+        if header.get("owner") != owner:
+          return None
+        built = header.get("built", 0)
+        if not 0 <= time.time() - built <= cls.maxAge:
+          return None
+        index = cls((json.loads(line) for line in fp), path, owner, built)
+    except (IOError, ValueError):
+      return None
+
+    try:
+      with open(index._journalPath, "r") as fp:
+        for line in fp:
+          (op, value) = json.loads(line)
+          if op == "+":
+            index._add(value)
+          else:
+            index._remove(value)
+          index._journalLength += 1
+    except IOError:
+      pass # No journal
+    except ValueError:
+      return None # Truncated journal; rebuild rather than trust it
+
+    index.fresh = False
+    return index
+
+
+  @classmethod
+  def build(cls, grok, path=None):
+    """ Return the index for GrokSession grok, loading it from the snapshot at
+        path if there is one, otherwise building it from listModels() (and
+        saving it to path, if given).
+    """
+    owner = _owner(grok.server, grok.apikey)
+
+    if path is not None:
+      index = cls.load(path, owner)
+      if index is not None:
+        return index
+
+    index = cls(grok.listModels(stream=True), path, owner)
+
+    if path is not None:
+      index.save()
+
+    return index
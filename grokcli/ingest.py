@@ -0,0 +1,179 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Streaming ingest of custom metric samples: parsers for the supported input
+    formats, and pump() to feed parsed samples to a CustomMetricWriter.
+"""
+import csv
+import Queue
+import sys
+import threading
+import time
+
+from grokcli.serialization import loadJSON
+
+
+
+class Counters(object):
+  """ Number of records read, and of records skipped because they couldn't be
+      parsed
+  """
+
+  def __init__(self):
+    self.read = 0
+    self.skipped = 0
+
+
+
+def _sample(name, value, timestamp):
+  """ Validate and normalize one sample, raising ValueError if invalid """
+  name = name.strip()
+  if not name or " " in name:
+    raise ValueError("Invalid metric name: %r" % name)
+
+  value = float(value)
+
+  if timestamp is None or timestamp == "":
+    timestamp = time.time()
+
+  return (name, value, int(float(timestamp)))
+
+
+def parseLines(fp, counters):
+  """ Parse "{name} {value} [{timestamp}]" lines, as accepted by the Custom
+      Metric endpoint.  The timestamp defaults to the current time.
+  """
+  for line in fp:
+    fields = line.split()
+    if not fields:
+      continue
+
+    counters.read += 1
+    try:
+      if len(fields) not in (2, 3):
+        raise ValueError(line)
+      yield _sample(fields[0], fields[1],
+                    fields[2] if len(fields) == 3 else None)
+    except ValueError:
+      counters.skipped += 1
+
+
+def parseCSV(fp, counters):
+  """ Parse name,value[,timestamp] CSV rows.  A header row is skipped. """
+  for (lineno, row) in enumerate(csv.reader(fp)):
+    if not row:
+      continue
+
+    counters.read += 1
+    try:
+      if len(row) not in (2, 3):
+        raise ValueError(row)
+      yield _sample(row[0], row[1], row[2] if len(row) == 3 else None)
+    except ValueError:
+      if lineno == 0:
+        counters.read -= 1 # Header
+      else:
+        counters.skipped += 1
+
+
+def parseNDJSON(fp, counters):
+  """ Parse one {"name": ..., "value": ..., "timestamp": ...} object per line
+  """
+  for line in fp:
+    if not line.strip():
+      continue
+
+    counters.read += 1
+    try:
+      record = loadJSON(line)
+      yield _sample(record["name"], record["value"], record.get("timestamp"))
+    except (ValueError, KeyError, TypeError, AttributeError):
+      counters.skipped += 1
+
+
+PARSERS = {
+  "line": parseLines,
+  "csv": parseCSV,
+  "ndjson": parseNDJSON}
+
+
+
+def _produce(samples, queue, batchSize, stopped):
+  batch = []
+  try:
+    for sample in samples:
+      batch.append(sample)
+      if len(batch) >= batchSize:
+        if stopped.is_set():
+          return
+        queue.put(batch)
+        batch = []
+    queue.put(batch)
+    queue.put(None)
+  except BaseException:
+    queue.put(sys.exc_info())
+
+
+def _stop(reader, queue, stopped):
+  """ Stop the reader thread, emptying the queue so that it isn't left blocked
+      on a full one
+  """
+  stopped.set()
+  while reader.is_alive():
+    try:
+      queue.get(timeout=0.1)
+    except Queue.Empty:
+      pass
+
+
+def pump(samples, writer, queueSize=100000, batchSize=1000):
+  """ Send (name, value, timestamp) samples to writer, reading and parsing
+      them in a separate thread so that input and network I/O overlap.  At
+      most `queueSize` samples are held in memory; once that many are pending
+      the reader blocks until the writer catches up.  Returns the number of
+      samples written.  If writing fails, the reader is stopped before the
+      exception is raised.
+  """
+  queue = Queue.Queue(max(1, queueSize // batchSize))
+  stopped = threading.Event()
+  reader = threading.Thread(target=_produce,
+                            args=(samples, queue, batchSize, stopped),
+                            name="ingest reader")
+  reader.daemon = True
+  reader.start()
+
+  written = 0
+  write = writer.write
+
+  try:
+    while True:
+      batch = queue.get()
+
+      if batch is None:
+        break
+
+      if isinstance(batch, tuple):
+        # Reader failed; re-raise its exception here
+        raise batch[0], batch[1], batch[2]
+
+      for (name, value, timestamp) in batch:
+        write(name, value, timestamp)
+
+      written += len(batch)
+
+  finally:
+    _stop(reader, queue, stopped)
+
+  return written
@@ -0,0 +1,195 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Incremental encoding and decoding of top-level JSON arrays and of
+    sequences of JSON values (e.g. NDJSON), so that large lists of models can
+    be processed one element at a time.
+"""
+import json
+import re
+
+from grokcli.serialization import dumpJSON
+
+
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# Characters that can only end a complete JSON value.  A value ending in
+# anything else (i.e. a number) is only complete once followed by a delimiter,
+# otherwise it may continue in the next chunk.
+_TERMINATORS = '}]"'
+_DELIMITERS = " \t\n\r,]"
+
+
+
+def iterJSONArray(chunks):
+  """ Decode a top-level JSON array from an iterable of string chunks (e.g.
+      response.iter_content() or a file object read in blocks), yielding each
+      element as soon as it has been completely received.  Only the
+      undecoded remainder of the input is held in memory.
+  """
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  buf = ""
+  pos = 0
+  eof = False
+  state = "start"
+
+  while True:
+    pos = WHITESPACE.match(buf, pos).end()
+
+    if state == "end":
+      if pos < len(buf):
+        raise ValueError("Extra data after JSON array")
+    elif pos < len(buf):
+      char = buf[pos]
+
+      if state == "start":
+        if char != "[":
+          raise ValueError("Expected JSON array")
+        pos += 1
+        state = "first"
+        continue
+
+      if state == "separator" or (state == "first" and char == "]"):
+        if char == "]":
+          pos += 1
+          state = "end"
+        elif char == ",":
+          pos += 1
+          state = "value"
+        else:
+          raise ValueError("Expected ',' or ']' in JSON array")
+        continue
+
+      try:
+        (value, end) = decoder.raw_decode(buf, pos)
+      except ValueError:
+        if eof:
+          raise
+      else:
+        if (eof or buf[end - 1] in _TERMINATORS or
+            (end < len(buf) and buf[end] in _DELIMITERS)):
+          yield value
+          pos = end
+          state = "separator"
+          continue
+    elif eof:
+      raise ValueError("Unexpected end of JSON array")
+
+    if eof:
+      return
+
+    # Need more input
+    chunk = next(chunks, None)
+    if chunk is None:
+      eof = True
+    else:
+      buf = buf[pos:] + chunk
+      pos = 0
+
+
+def iterJSONValues(chunks):
+  """ Decode a sequence of whitespace-separated JSON values, such as NDJSON
+      (one value per line), from an iterable of string chunks, yielding each
+      value as soon as it has been completely received.
+  """
+  decoder = json.JSONDecoder()
+  chunks = iter(chunks)
+  buf = ""
+  pos = 0
+  eof = False
+
+  while True:
+    pos = WHITESPACE.match(buf, pos).end()
+
+    if pos < len(buf):
+      try:
+        (value, end) = decoder.raw_decode(buf, pos)
+      except ValueError:
+        if eof:
+          raise
+      else:
+        if (eof or buf[end - 1] in _TERMINATORS or
+            (end < len(buf) and buf[end] in _DELIMITERS)):
+          yield value
+          pos = end
+          continue
+    elif eof:
+      return
+
+    # Need more input
+    chunk = next(chunks, None)
+    if chunk is None:
+      eof = True
+    else:
+      buf = buf[pos:] + chunk
+      pos = 0
+
+
+def readChunks(fp, size=64 * 1024):
+  """ Iterate over a file object in blocks, for use with iterJSONArray() """
+  return iter(lambda: fp.read(size), "")
+
+
+
+class ChunkReader(object):
+  """ File-like object reading from an iterable of string chunks: the inverse
+      of readChunks(), e.g. to hand chunks already read from a file to a
+      parser that reads the file itself.
+  """
+
+  def __init__(self, chunks):
+    self._chunks = iter(chunks)
+    self._buffer = ""
+
+
+  def read(self, size=-1):
+    if size < 0:
+      data = self._buffer + "".join(self._chunks)
+      self._buffer = ""
+      return data
+
+    while len(self._buffer) < size:
+      chunk = next(self._chunks, None)
+      if chunk is None:
+        break
+      self._buffer += chunk
+
+    (data, self._buffer) = (self._buffer[:size], self._buffer[size:])
+    return data
+
+
+def writeJSONArray(fp, items, indent=None):
+  """ Write items to fp as a JSON array, one element at a time.  Output matches
+      json.dumps(list(items), indent=indent) apart from whitespace.  Returns the
+      number of items written.
+  """
+  if indent is None:
+    (start, separator, end) = ("[", ", ", "]")
+  else:
+    prefix = " " * indent
+    (start, separator, end) = ("[\n" + prefix, ",\n" + prefix, "\n]")
+
+  count = 0
+  for item in items:
+    encoded = dumpJSON(item, indent=indent)
+    if indent is not None:
+      encoded = encoded.replace("\n", "\n" + prefix)
+    fp.write((start if not count else separator) + encoded)
+    count += 1
+
+  fp.write(end if count else "[]")
+  return count
@@ -0,0 +1,108 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Content hashes and identities of model definitions, and the manifest of
+    hashes kept by incremental exports.  See ExportManifest.
+"""
+import errno
+import hashlib
+import json
+import os
+import tempfile
+
+
+
+# Fields of listModels() entries that change as a model runs, rather than when
+# its definition changes
+VOLATILE_FIELDS = frozenset([
+  "status",
+  "message",
+  "last_timestamp",
+  "last_rowid"])
+
+
+def contentHash(value, exclude=()):
+  """ Return a stable hash of a JSON-serializable value: the same for equal
+      values regardless of dict ordering.  Top-level dict keys in `exclude` are
+      ignored.
+  """
+  if exclude and isinstance(value, dict):
+    value = dict((key, item) for (key, item) in value.iteritems()
+                 if key not in exclude)
+
+  return hashlib.sha1(json.dumps(value, sort_keys=True,
+                                 separators=(",", ":"))).hexdigest()
+
+
+def definitionHash(model):
+  """ Hash of the definition fields of a listModels() entry """
+  return contentHash(model, exclude=VOLATILE_FIELDS)
+
+
+def modelIdentity(model):
+  """ Hash identifying the metric that a model definition in the export format
+      monitors: its datasource and metricSpec, and stackSpec for autostacks.
+      Two definitions with the same identity would create the same model.
+  """
+  return contentHash([model.get("datasource"),
+                      model.get("metricSpec"),
+                      model.get("stackSpec")])
+
+
+
+class ExportManifest(object):
+  """ Record of the models in an export, by uid: the hash of each model's
+      listModels() definition, used to tell which models may have changed
+      without exporting them, and the hash of its exported spec.
+  """
+
+  version = 1
+
+
+  def __init__(self, models=None):
+    # uid -> {"definition": hash, "content": hash}
+    self.models = models or {}
+
+
+  @classmethod
+  def load(cls, path):
+    """ Load a manifest, or return an empty one if path doesn't exist """
+    try:
+      with open(path, "r") as fp:
+        data = json.load(fp)
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+      return cls()
+
+    if data.get("version") != cls.version:
+      raise ValueError("Unsupported manifest version in %s: %r"
+                       % (path, data.get("version")))
+
+    return cls(data["models"])
+
+
+  def save(self, path):
+    """ Write the manifest atomically """
+    directory = os.path.dirname(os.path.abspath(path))
+    (fd, tmpPath) = tempfile.mkstemp(dir=directory, prefix=".manifest")
+    try:
+      with os.fdopen(fd, "w") as fp:
+        json.dump({"version": self.version, "models": self.models}, fp,
+                  sort_keys=True, separators=(",", ":"))
+      os.rename(tmpPath, path)
+    except:
+      os.remove(tmpPath)
+      raise
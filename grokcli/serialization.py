@@ -0,0 +1,231 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Serialization of request and response payloads, using the fastest codecs
+    installed: ujson (for decoding) or simplejson for JSON, falling back to
+    the standard library's json, and libyaml's CSafeLoader/CSafeDumper for
+    YAML, falling back to PyYAML's pure Python SafeLoader/SafeDumper.
+
+    Use loadJSON()/dumpJSON() and loadYAML()/dumpYAML() rather than the
+    underlying modules.  load()/dump() (also grokcli.load()/grokcli.dump())
+    read and write YAML if PyYAML is installed, and JSON otherwise.  PyYAML is
+    only imported once YAML is needed, by importYAML(), which commands also
+    use to tell whether YAML is available.
+"""
+import json
+
+yaml = None # Imported by importYAML()
+
+
+
+# Names of JSON backends, in order of preference
+JSON_BACKENDS = ("ujson", "simplejson", "json")
+
+
+def _ujsonBackend():
+  """ ujson for decoding only: ujson 1.x, the last to support Python 2,
+      encodes floats with a fixed number of decimal places, which rounds
+      numbers in request bodies and exports (1e-11 becomes 0.0).  Encoding
+      uses the next backend, which round-trips floats exactly.
+  """
+  import ujson
+
+  loads = ujson.loads
+  try:
+    # Older versions only parse floats exactly when asked to
+    ujson.loads("0.1", precise_float=True)
+    loads = lambda text: ujson.loads(text, precise_float=True)
+  except TypeError:
+    pass
+
+  try:
+    (_, dumps) = _simplejsonBackend()
+  except ImportError:
+    (_, dumps) = _jsonBackend()
+
+  return (loads, dumps)
+
+
+def _simplejsonBackend():
+  import simplejson
+  return (simplejson.loads,
+          lambda value, indent=None: simplejson.dumps(value, indent=indent))
+
+
+def _jsonBackend():
+  return (json.loads, lambda value, indent=None: json.dumps(value,
+                                                            indent=indent))
+
+
+_JSON_FACTORIES = {
+  "ujson": _ujsonBackend,
+  "simplejson": _simplejsonBackend,
+  "json": _jsonBackend}
+
+
+def getJSONBackend(name):
+  """ Return (loads, dumps) functions for a JSON backend.  dumps() takes an
+      optional indent.  Raises ImportError if the backend isn't installed.
+  """
+  if name not in _JSON_FACTORIES:
+    raise ValueError("Unknown JSON backend %r, expected one of %s"
+                     % (name, ", ".join(JSON_BACKENDS)))
+  return _JSON_FACTORIES[name]()
+
+
+def availableJSONBackends():
+  """ Return the names of the installed JSON backends, fastest first """
+  available = []
+  for name in JSON_BACKENDS:
+    try:
+      getJSONBackend(name)
+    except ImportError:
+      continue
+    available.append(name)
+  return available
+
+
+def setJSONBackend(name):
+  """ Use the named JSON backend from now on """
+  global jsonBackend, _loadJSON, _dumpJSON
+  (_loadJSON, _dumpJSON) = getJSONBackend(name)
+  jsonBackend = name
+
+
+def loadJSON(text):
+  """ Decode JSON, with the current backend """
+  return _loadJSON(text)
+
+
+def dumpJSON(value, indent=None):
+  """ Encode value as JSON, with the current backend """
+  return _dumpJSON(value, indent)
+
+
+setJSONBackend(availableJSONBackends()[0])
+
+
+
+# PyYAML and the loader and dumper classes to use with it, set by importYAML()
+SafeLoader = None
+SafeDumper = None
+_ItemLoader = None
+_yamlImported = False
+
+
+def importYAML():
+  """ Import PyYAML on first use, since importing it is slow and most commands
+      never need it.  Returns the yaml module, or None if it isn't installed.
+  """
+  global yaml, SafeLoader, SafeDumper, _ItemLoader, _yamlImported
+
+  if _yamlImported:
+    return yaml
+  _yamlImported = True
+
+  try:
+    import yaml
+  except ImportError:
+    yaml = None
+    return None
+
+  SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+  SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+  if hasattr(yaml, "CSafeLoader"):
+    from yaml.composer import Composer
+    from yaml.constructor import SafeConstructor
+    from yaml.cyaml import CParser
+    from yaml.resolver import Resolver
+
+    class ItemLoader(CParser, Composer, SafeConstructor, Resolver):
+      """ CSafeLoader, with the pure Python composer's compose_node(), which
+          CParser doesn't expose, so that nodes can be composed one at a time
+      """
+
+      def __init__(self, stream):
+        CParser.__init__(self, stream)
+        Composer.__init__(self)
+        SafeConstructor.__init__(self)
+        Resolver.__init__(self)
+
+    _ItemLoader = ItemLoader
+  else:
+    _ItemLoader = yaml.SafeLoader
+
+  return yaml
+
+
+def loadYAML(text):
+  """ Decode YAML (or JSON) safely, with libyaml if available """
+  importYAML()
+  return yaml.load(text, Loader=SafeLoader)
+
+
+def dumpYAML(value):
+  """ Encode value as block-style YAML, with libyaml if available """
+  importYAML()
+  return yaml.dump(value, Dumper=SafeDumper, default_flow_style=False)
+
+
+def iterYAMLItems(stream):
+  """ Decode a stream of YAML documents incrementally, yielding each item of
+      documents that are sequences, and other documents whole.  Only the item
+      being decoded is held in memory, so a large sequence of models can be
+      read one model at a time.
+  """
+  importYAML()
+  loader = _ItemLoader(stream)
+  try:
+    loader.get_event() # StreamStart
+
+    while not loader.check_event(yaml.StreamEndEvent):
+      loader.get_event() # DocumentStart
+
+      if loader.check_event(yaml.SequenceStartEvent):
+        loader.get_event()
+        while not loader.check_event(yaml.SequenceEndEvent):
+          yield loader.construct_document(loader.compose_node(None, None))
+        loader.get_event()
+      else:
+        yield loader.construct_document(loader.compose_node(None, None))
+
+      loader.get_event() # DocumentEnd
+      loader.anchors = {}
+  finally:
+    loader.dispose()
+
+
+def load(text):
+  """ Decode a JSON or YAML document.  JSON documents are decoded with the
+      JSON backend, which is much faster than any YAML parser.
+  """
+  if text.lstrip()[:1] in ("{", "["):
+    try:
+      return loadJSON(text)
+    except ValueError:
+      pass # YAML flow collection
+
+  if importYAML() is None:
+    return loadJSON(text)
+
+  return loadYAML(text)
+
+
+def dump(value):
+  """ Encode value as YAML if available, otherwise as indented JSON """
+  if importYAML() is None:
+    return dumpJSON(value, indent=2)
+  return dumpYAML(value)
@@ -0,0 +1,226 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Sharding of custom metrics across several Grok servers.  See
+    ShardedWriter.
+"""
+import bisect
+import hashlib
+import os
+import re
+import threading
+from urlparse import urlparse
+
+from grokcli.api import GrokSession
+from grokcli.spool import Spool
+
+
+
+class ConsistentHashRing(object):
+  """ Maps keys to nodes so that adding or removing a node only moves the keys
+      of that node: each node is hashed to `replicas` points on a ring, and a
+      key belongs to the node of the first point at or after the key's hash.
+  """
+
+  replicas = 100
+
+
+  def __init__(self, nodes=(), replicas=None):
+    if replicas is not None:
+      self.replicas = replicas
+
+    self.nodes = set()
+    self._points = []
+    self._owners = []
+
+    for node in nodes:
+      self.add(node)
+
+
+  @staticmethod
+  def _hash(key):
+    if isinstance(key, unicode):
+      key = key.encode("utf-8")
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+
+  def add(self, node):
+    if node in self.nodes:
+      return
+
+    self.nodes.add(node)
+    for replica in xrange(self.replicas):
+      point = self._hash("%s#%d" % (node, replica))
+      index = bisect.bisect(self._points, point)
+      self._points.insert(index, point)
+      self._owners.insert(index, node)
+
+
+  def remove(self, node):
+    if node not in self.nodes:
+      return
+
+    self.nodes.remove(node)
+    keep = [index for (index, owner) in enumerate(self._owners)
+            if owner != node]
+    self._points = [self._points[index] for index in keep]
+    self._owners = [self._owners[index] for index in keep]
+
+
+  def get(self, key):
+    """ Return the node that key belongs to """
+    if not self._points:
+      raise LookupError("No nodes in ring")
+
+    index = bisect.bisect_left(self._points, self._hash(key))
+    return self._owners[index % len(self._owners)]
+
+
+
+class ShardedWriter(object):
+  """ Routes custom metric samples across several Grok servers, keeping one
+      CustomMetricWriter (and so one persistent connection) per server:
+
+        with ShardedWriter(["https://grok1", "https://grok2"]) as writer:
+          writer.write("{metric name}", value, timestamp)
+
+      Metric names are assigned to servers by a ConsistentHashRing, so each
+      metric always lands on the same server, and addServer()/removeServer()
+      only move the metrics of the server concerned.
+
+      If `spoolDirectory` is given, each server gets its own Spool in a
+      subdirectory of it.  Other kwargs are passed to each
+      CustomMetricWriter, via GrokSession.writer().
+  """
+
+  # Number of metric name to server assignments to remember
+  maxRoutes = 100000
+
+
+  def __init__(self, servers=(), replicas=None, spoolDirectory=None,
+               **kwargs):
+    self.spoolDirectory = spoolDirectory
+    self.writerKwargs = kwargs
+
+    self.writers = {}
+    self._ring = ConsistentHashRing(replicas=replicas)
+    self._routes = {}
+    self._lock = threading.RLock()
+
+    for server in servers:
+      self.addServer(server)
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+  def _createWriter(self, server):
+    kwargs = dict(self.writerKwargs)
+    if self.spoolDirectory:
+      parseResult = urlparse(server)
+      shard = re.sub(r"[^\w.-]", "_", parseResult.netloc or server)
+      kwargs["spool"] = Spool(os.path.join(self.spoolDirectory, shard))
+    else:
+      # Not GrokSession.spoolDirectory, which would be shared by all servers
+      kwargs.setdefault("spool", None)
+
+    return GrokSession(server=server).writer(**kwargs)
+
+
+  def addServer(self, server):
+    """ Start routing a share of metrics to server """
+    with self._lock:
+      if server in self.writers:
+        return
+
+      self.writers[server] = self._createWriter(server)
+      self._ring.add(server)
+      self._routes.clear()
+
+
+  def removeServer(self, server):
+    """ Stop routing metrics to server, flushing and closing its connection
+    """
+    with self._lock:
+      writer = self.writers.pop(server, None)
+      if writer is None:
+        return
+
+      self._ring.remove(server)
+      self._routes.clear()
+
+    writer.close()
+
+
+  def serverFor(self, name):
+    """ Return the server that metric `name` is routed to """
+    with self._lock:
+      server = self._routes.get(name)
+      if server is None:
+        server = self._ring.get(name)
+        if len(self._routes) >= self.maxRoutes:
+          self._routes.clear()
+        self._routes[name] = server
+      return server
+
+
+  def write(self, name, value, timestamp):
+    """ Queue a sample for sending to its metric's server """
+    try:
+      # Fast path for known metrics, without taking the lock
+      writer = self.writers[self._routes[name]]
+    except KeyError:
+      with self._lock:
+        writer = self.writers[self.serverFor(name)]
+
+    writer.write(name, value, timestamp)
+
+
+  def flush(self):
+    for writer in self.writers.values():
+      writer.flush()
+
+
+  def close(self):
+    """ Flush and close every server's connection """
+    errors = []
+    for writer in self.writers.values():
+      try:
+        writer.close()
+      except Exception as e:
+        errors.append(e)
+
+    if errors:
+      raise errors[0]
+
+
+  def stats(self):
+    """ Return the sums of all servers' writer counters, and each server's
+        stats under "shards"
+    """
+    shards = dict((server, writer.stats())
+                  for (server, writer) in self.writers.items())
+
+    stats = dict((key, sum(shard[key] for shard in shards.values()))
+                 for key in ("linesSent", "bytesSent", "flushes",
+                             "reconnects", "linesSpooled", "linesReplayed",
+                             "linesDropped"))
+    stats["shards"] = shards
+    return stats
@@ -0,0 +1,269 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Crash-safe on-disk spool of custom metric lines.  See Spool. """
+from contextlib import contextmanager
+import errno
+import fcntl
+import os
+
+
+
+class Spool(object):
+  """ Append-only store of newline-terminated custom metric lines that
+      couldn't be sent, kept in a directory of numbered segment files:
+
+        spool = Spool("~/.grok/spool")
+        spool.append("{metric name} {metric value} {unix timestamp}\\n")
+        ...
+        spool.drain(sock.sendall)
+
+      Lines are drained in the order they were appended, which preserves the
+      order of samples of each metric.  Progress through the oldest segment
+      is checkpointed after every batch, so an interrupted drain resends at
+      most one batch.  A line torn by a crash mid-append is discarded.
+
+      A new segment is started once the current one reaches `segmentSize`
+      bytes.  Once the spool would exceed `maxSize` bytes, the oldest segments
+      are dropped to make room, and the bytes lost counted in `droppedBytes`.
+
+      `fsync` is one of "never", "segment" (when a segment is completed, and
+      on close()) or "always" (after every append).
+
+      The spool may be shared by several processes; appends and drains are
+      serialized with a lock file in the spool directory.
+  """
+
+  segmentSize = 16 * 1024 * 1024
+  maxSize = 256 * 1024 * 1024
+  fsync = "segment"
+  batchSize = 1024 * 1024
+
+  FSYNC_POLICIES = ("never", "segment", "always")
+
+  _SUFFIX = ".spool"
+  _OFFSET_SUFFIX = ".offset"
+
+
+  def __init__(self, directory, segmentSize=None, maxSize=None, fsync=None):
+    self.directory = os.path.expanduser(directory)
+
+    if segmentSize is not None:
+      self.segmentSize = segmentSize
+    if maxSize is not None:
+      self.maxSize = maxSize
+    if fsync is not None:
+      self.fsync = fsync
+
+    if self.fsync not in self.FSYNC_POLICIES:
+      raise ValueError("Invalid fsync policy: %r" % self.fsync)
+
+    self.droppedBytes = 0
+
+    try:
+      os.makedirs(self.directory, 0700)
+    except OSError as e:
+      if e.errno != errno.EEXIST:
+        raise
+
+
+  @contextmanager
+  def _locked(self):
+    with open(os.path.join(self.directory, "lock"), "a") as lockFile:
+      fcntl.flock(lockFile, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+
+  def _segments(self):
+    """ Return segment paths, oldest first """
+    names = sorted(name for name in os.listdir(self.directory)
+                   if name.endswith(self._SUFFIX))
+    return [os.path.join(self.directory, name) for name in names]
+
+
+  def _segmentPath(self, number):
+    return os.path.join(self.directory, "%020d%s" % (number, self._SUFFIX))
+
+
+  @staticmethod
+  def _segmentNumber(path):
+    return int(os.path.basename(path).partition(".")[0])
+
+
+  @staticmethod
+  def _sync(fp):
+    fp.flush()
+    os.fsync(fp.fileno())
+
+
+  @staticmethod
+  def _repair(fp, size):
+    """ Truncate a segment ending in a partial line, left by a crash mid-append
+    """
+    fp.seek(size - 1)
+    if fp.read(1) == "\n":
+      return
+
+    end = size
+    while end > 0:
+      start = max(0, end - 4096)
+      fp.seek(start)
+      newline = fp.read(end - start).rfind("\n")
+      if newline != -1:
+        fp.truncate(start + newline + 1)
+        return
+      end = start
+
+    fp.truncate(0)
+
+
+  def _readOffset(self, path):
+    try:
+      with open(path + self._OFFSET_SUFFIX, "r") as fp:
+        return int(fp.read() or 0)
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+      return 0
+
+
+  def _writeOffset(self, path, offset):
+    tmpPath = path + self._OFFSET_SUFFIX + ".tmp"
+    with open(tmpPath, "w") as fp:
+      fp.write(str(offset))
+    os.rename(tmpPath, path + self._OFFSET_SUFFIX)
+
+
+  def _remove(self, path):
+    for name in (path, path + self._OFFSET_SUFFIX):
+      try:
+        os.remove(name)
+      except OSError as e:
+        if e.errno != errno.ENOENT:
+          raise
+
+
+  def _makeRoom(self, segments, size):
+    """ Drop the oldest segments until `size` more bytes fit under maxSize """
+    sizes = [os.path.getsize(path) - self._readOffset(path)
+             for path in segments]
+    total = sum(sizes)
+
+    while segments and total + size > self.maxSize:
+      self.droppedBytes += sizes[0]
+      total -= sizes.pop(0)
+      self._remove(segments.pop(0))
+
+    return total + size <= self.maxSize
+
+
+  def append(self, data):
+    """ Append complete, newline-terminated lines.  Returns False if the data
+        was dropped because it doesn't fit in maxSize on its own.
+    """
+    if not data:
+      return True
+
+    with self._locked():
+      segments = self._segments()
+
+      if segments and os.path.getsize(segments[-1]) >= self.segmentSize:
+        if self.fsync == "segment":
+          with open(segments[-1], "ab") as fp:
+            self._sync(fp)
+        segments.append(self._segmentPath(
+          self._segmentNumber(segments[-1]) + 1))
+      elif not segments:
+        segments.append(self._segmentPath(0))
+
+      current = segments[-1]
+
+      if not self._makeRoom([path for path in segments
+                             if os.path.exists(path)], len(data)):
+        self.droppedBytes += len(data)
+        return False
+
+      with open(current, "a+b") as fp:
+        fp.seek(0, os.SEEK_END)
+        size = fp.tell()
+        if size:
+          self._repair(fp, size)
+          fp.seek(0, os.SEEK_END)
+
+        fp.write(data)
+
+        if self.fsync == "always":
+          self._sync(fp)
+
+    return True
+
+
+  def size(self):
+    """ Return the number of bytes waiting to be drained """
+    with self._locked():
+      return sum(os.path.getsize(path) - self._readOffset(path)
+                 for path in self._segments())
+
+
+  def drain(self, send, batchSize=None):
+    """ Pass spooled lines to `send` in order, in batches of up to
+        `batchSize` bytes ending on a line boundary, removing each segment
+        once it has been sent.  If `send` raises, the unsent data stays in the
+        spool and the exception propagates.  Returns the number of bytes sent.
+    """
+    batchSize = batchSize or self.batchSize
+    sent = 0
+
+    with self._locked():
+      for path in self._segments():
+        offset = self._readOffset(path)
+
+        with open(path, "rb") as fp:
+          fp.seek(offset)
+          pending = ""
+
+          while True:
+            chunk = fp.read(batchSize)
+            if not chunk:
+              break # A torn trailing line in `pending` is dropped
+
+            data = pending + chunk
+            end = data.rfind("\n") + 1
+            (data, pending) = (data[:end], data[end:])
+
+            if data:
+              send(data)
+              offset += len(data)
+              sent += len(data)
+              self._writeOffset(path, offset)
+
+        self._remove(path)
+
+    return sent
+
+
+  def close(self):
+    """ Sync the current segment to disk, unless fsync is "never" """
+    if self.fsync == "never":
+      return
+
+    with self._locked():
+      segments = self._segments()
+      if segments:
+        with open(segments[-1], "ab") as fp:
+          self._sync(fp)
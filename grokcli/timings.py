@@ -0,0 +1,413 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Request latency and throughput instrumentation for GrokSession.  See
+    Timings.
+"""
+import math
+import threading
+import time
+from urlparse import urlparse
+
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connectionpool import (
+  HTTPConnectionPool,
+  HTTPSConnectionPool)
+
+
+
+# Path segments kept verbatim in endpoint templates.  Any other segment that
+# doesn't start with "_" is an identifier (model uid, region, etc.) and is
+# replaced with "*".
+TEMPLATE_LITERALS = frozenset([
+  "autostack",
+  "cloudwatch",
+  "custom",
+  "data",
+  "export",
+  "instances",
+  "metrics",
+  "preview_instances",
+  "regions"])
+
+# Phases of a request, in the order they are reported
+PHASES = ("connect", "ttfb", "transfer", "decode", "total")
+
+_local = threading.local()
+
+
+
+def endpointTemplate(method, url):
+  """ Reduce a request to its API endpoint, e.g.
+      ("GET", "https://host/_models/abc123/export") -> "GET /_models/*/export"
+  """
+  segments = [
+    segment if (segment.startswith("_") or segment in TEMPLATE_LITERALS)
+            else "*"
+    for segment in urlparse(url).path.split("/")[1:]]
+
+  return "{0} /{1}".format(method, "/".join(segments))
+
+
+def _seconds(delta):
+  return delta.days * 86400 + delta.seconds + delta.microseconds / 1e6
+
+
+def _takeConnectTime():
+  """ Return and reset the time spent establishing connections in the current
+      thread since the last call.
+  """
+  elapsed = getattr(_local, "connect", 0.0)
+  _local.connect = 0.0
+  return elapsed
+
+
+def _takeTransferTime():
+  """ Return and reset the time spent waiting for streamed response bodies in
+      the current thread since the last call.
+  """
+  elapsed = getattr(_local, "transfer", 0.0)
+  _local.transfer = 0.0
+  return elapsed
+
+
+def _timedConnection(cls):
+  class TimedConnection(cls):
+    def connect(self):
+      start = time.time()
+      try:
+        return cls.connect(self)
+      finally:
+        _local.connect = (getattr(_local, "connect", 0.0) +
+                          time.time() - start)
+
+  TimedConnection.__name__ = "Timed" + cls.__name__
+  return TimedConnection
+
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+  ConnectionCls = _timedConnection(HTTPConnectionPool.ConnectionCls)
+
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+  ConnectionCls = _timedConnection(HTTPSConnectionPool.ConnectionCls)
+
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+  """ HTTPAdapter that measures the time taken to establish each connection
+      (TCP connect and TLS handshake), for Timings.
+  """
+
+  def init_poolmanager(self, *args, **kwargs):
+    super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+    self.poolmanager.pool_classes_by_scheme = {
+      "http": _TimedHTTPConnectionPool,
+      "https": _TimedHTTPSConnectionPool}
+
+
+
+class Histogram(object):
+  """ Log-scale histogram of non-negative values.  Percentiles are accurate to
+      within `growth` (10% by default), and memory use is bounded by the range
+      of the values rather than their number.
+  """
+
+  growth = 1.1
+  resolution = 1e-6
+
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.min = None
+    self.max = None
+    self._buckets = {}
+
+
+  def add(self, value):
+    self.count += 1
+    self.total += value
+    self.min = value if self.min is None else min(self.min, value)
+    self.max = value if self.max is None else max(self.max, value)
+
+    if value > self.resolution:
+      bucket = int(math.log(value / self.resolution, self.growth)) + 1
+    else:
+      bucket = 0
+
+    self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+
+  def merge(self, other):
+    """ Add the values counted by another Histogram with the same growth and
+        resolution
+    """
+    self.count += other.count
+    self.total += other.total
+    for value in (other.min, other.max):
+      if value is not None:
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    for (bucket, count) in other._buckets.items():
+      self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+
+  @property
+  def mean(self):
+    if self.count:
+      return self.total / self.count
+
+
+  def percentile(self, percent):
+    """ Approximate value below which `percent` percent of values fall """
+    if not self.count:
+      return None
+
+    rank = percent / 100.0 * self.count
+    seen = 0
+    for bucket in sorted(self._buckets):
+      seen += self._buckets[bucket]
+      if seen >= rank:
+        break
+
+    upper = self.resolution * self.growth ** bucket
+    return max(self.min, min(self.max, upper))
+
+
+  def summary(self):
+    return {
+      "count": self.count,
+      "mean": self.mean,
+      "min": self.min,
+      "max": self.max,
+      "p50": self.percentile(50),
+      "p90": self.percentile(90),
+      "p99": self.percentile(99)}
+
+
+
+class EndpointStats(object):
+  """ Statistics for all requests to one endpoint template """
+
+  def __init__(self):
+    self.requests = 0
+    self.bytes = 0
+    self.statuses = {}
+    self.phases = dict((phase, Histogram()) for phase in PHASES)
+
+
+  def summary(self):
+    return {
+      "requests": self.requests,
+      "bytes": self.bytes,
+      "statuses": dict(self.statuses),
+      "phases": dict((phase, histogram.summary())
+                     for (phase, histogram) in self.phases.items()
+                     if histogram.count)}
+
+
+
+class Timings(object):
+  """ Records per-endpoint timings of GrokSession requests into in-process
+      histograms:
+
+        connect   time to establish new connections (TCP and TLS)
+        ttfb      time from sending the request to receiving the headers
+        transfer  time to download the response body
+        decode    time to decode the JSON response
+        total     time from sending the request to having the body
+
+      along with response sizes and status codes.  The body of a streamed
+      response is timed as it is read, and its transfer, decode and total
+      times and size are recorded once it has been read in full; its total
+      excludes time spent by the caller between chunks.
+
+      Enable for all sessions by
+      setting GrokSession.timings, or for one session with
+      GrokSession(timings=...).  Callables registered with addObserver() are
+      called with (endpoint, sample) for every measurement, where sample is a
+      dict of the values measured.
+  """
+
+  def __init__(self):
+    self.endpoints = {}
+    self._observers = []
+    self._lock = threading.Lock()
+
+
+  def addObserver(self, callback):
+    self._observers.append(callback)
+
+
+  def removeObserver(self, callback):
+    self._observers.remove(callback)
+
+
+  def record(self, endpoint, sample):
+    """ Add a measurement for endpoint.  Keys of sample are phase names (in
+        seconds), "bytes" and "status"; any of which may be omitted.
+    """
+    with self._lock:
+      stats = self.endpoints.get(endpoint)
+      if stats is None:
+        stats = self.endpoints[endpoint] = EndpointStats()
+
+      if "status" in sample:
+        stats.requests += 1
+        stats.statuses[sample["status"]] = (
+          stats.statuses.get(sample["status"], 0) + 1)
+
+      stats.bytes += sample.get("bytes", 0)
+
+      for phase in PHASES:
+        if sample.get(phase) is not None:
+          stats.phases[phase].add(sample[phase])
+
+    for callback in self._observers:
+      callback(endpoint, sample)
+
+
+  def timeRequest(self, send, method, url, **kwargs):
+    """ Call send(method=method, url=url, **kwargs), recording the timings of
+        the response it returns.
+    """
+    _takeConnectTime()
+    start = time.time()
+
+    response = send(method=method, url=url, **kwargs)
+
+    total = time.time() - start
+    ttfb = min(_seconds(response.elapsed), total)
+    sample = {
+      "status": response.status_code,
+      "connect": _takeConnectTime(),
+      "ttfb": ttfb}
+
+    endpoint = endpointTemplate(method, url)
+
+    if kwargs.get("stream"):
+      # Body hasn't been read yet
+      self._timeTransfer(response, endpoint, ttfb)
+    else:
+      sample["bytes"] = len(response.content or "")
+      sample["transfer"] = total - ttfb
+      sample["total"] = total
+
+    self.record(endpoint, sample)
+
+    return response
+
+
+  def _timeTransfer(self, response, endpoint, ttfb):
+    """ Wrap response.iter_content() to record the time spent waiting for the
+        body, and its size, once it has been read
+    """
+    iterContent = response.iter_content
+
+    def timedContent(*args, **kwargs):
+      chunks = iterContent(*args, **kwargs)
+      transfer = 0.0
+      size = 0
+      try:
+        while True:
+          start = time.time()
+          try:
+            chunk = next(chunks)
+          except StopIteration:
+            break
+          elapsed = time.time() - start
+          _local.transfer = getattr(_local, "transfer", 0.0) + elapsed
+          transfer += elapsed
+          size += len(chunk)
+          yield chunk
+      finally:
+        self.record(endpoint, {"bytes": size,
+                               "transfer": transfer,
+                               "total": ttfb + transfer})
+
+    response.iter_content = timedContent
+
+
+  def timeDecode(self, response, decode):
+    """ Return decode(response.text), recording the time taken """
+    start = time.time()
+    result = decode(response.text)
+
+    method = getattr(response.request, "method", None) or "GET"
+    self.record(endpointTemplate(method, response.url),
+                {"decode": time.time() - start})
+
+    return result
+
+
+  def timeStreamDecode(self, response, items):
+    """ Yield from items, an iterator decoding a streamed response as it is
+        read, recording the time spent decoding once it is exhausted.  Time
+        spent waiting for the body (see timeRequest()) is excluded.
+    """
+    method = getattr(response.request, "method", None) or "GET"
+    endpoint = endpointTemplate(method, response.url)
+    decode = 0.0
+
+    try:
+      while True:
+        _takeTransferTime()
+        start = time.time()
+        try:
+          item = next(items)
+        except StopIteration:
+          break
+        finally:
+          decode += time.time() - start - _takeTransferTime()
+        yield item
+    finally:
+      self.record(endpoint, {"decode": decode})
+
+
+  def summary(self):
+    """ Return a dict of endpoint -> summary statistics, for export """
+    with self._lock:
+      return dict((endpoint, stats.summary())
+                  for (endpoint, stats) in self.endpoints.items())
+
+
+  def report(self, fp):
+    """ Print a table of median and 99th percentile timings per endpoint """
+    from prettytable import PrettyTable
+
+    table = PrettyTable(["Endpoint", "Requests", "Status", "Bytes"] +
+                        ["%s p50/p99 (ms)" % phase for phase in PHASES])
+
+    for (endpoint, stats) in sorted(self.endpoints.items()):
+      statuses = sorted(stats.statuses.items())
+      row = [endpoint,
+             stats.requests,
+             " ".join("%s:%d" % item for item in statuses),
+             stats.bytes]
+      for phase in PHASES:
+        histogram = stats.phases[phase]
+        if histogram.count:
+          row.append("%.1f/%.1f" % (histogram.percentile(50) * 1000,
+                                    histogram.percentile(99) * 1000))
+        else:
+          row.append("")
+      table.add_row(row)
+
+    table.align = "l"  # left align
+    print >> fp, table
@@ -0,0 +1,331 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" Buffered writer for the Grok Custom Metric endpoint.  See
+    CustomMetricWriter.
+"""
+import socket
+import threading
+import time
+
+from grokcli.timings import Histogram
+
+
+
+class CustomMetricWriter(object):
+  """ Persistent, buffered connection to the Grok Custom Metric endpoint.
+      Samples are formatted as "{name} {value} {timestamp}" lines and
+      accumulated in memory, then sent in one sendall() once `bufferSize`
+      bytes are pending or `flushInterval` seconds have passed since the last
+      flush, whichever is first.  If the connection fails it is re-opened and
+      the pending data resent once before the error is raised.  Use as a
+      context manager to flush and gracefully shut down the connection:
+
+        with grok.writer() as writer:
+          writer.write("{metric name}", value, timestamp)
+
+      If a grokcli.spool.Spool is given, data that can't be sent is appended
+      to it instead of raising, and no reconnect is attempted for
+      `retryInterval` seconds.  Once the endpoint is reachable again, the
+      spool is drained ahead of any new data, so each metric's samples still
+      arrive in order.
+
+      Without a spool, data that can't be sent stays in the buffer and flush()
+      raises socket.error.  Writes don't try to flush again for
+      `retryInterval` seconds, and while the endpoint is unreachable the
+      buffer is capped at `maxBufferSize` bytes by dropping its oldest lines.
+
+      Writes never wait for a send in progress on another thread, e.g. the
+      periodic flush, so a slow or unreachable endpoint doesn't hold up the
+      code producing samples.
+
+      Counters (linesSent, bytesSent, flushes, reconnects, linesSpooled,
+      linesReplayed, linesDropped) and a flushLatency histogram are available
+      as attributes, or together from stats().
+  """
+
+  bufferSize = 64 * 1024
+  flushInterval = 1.0
+
+  # Seconds to wait to connect or send, and for the server to close the
+  # connection on close()
+  timeout = 10.0
+
+  # Seconds to keep spooling (or buffering) after a failed send before trying
+  # to reconnect
+  retryInterval = 5.0
+
+  # Most unsent data to keep in memory without a spool
+  maxBufferSize = 16 * 1024 * 1024
+
+
+  def __init__(self, host, port=2003, bufferSize=None, flushInterval=None,
+               timeout=None, spool=None, maxBufferSize=None):
+    self.host = host
+    self.port = port
+    self.spool = spool
+
+    if bufferSize is not None:
+      self.bufferSize = bufferSize
+    if flushInterval is not None:
+      self.flushInterval = flushInterval
+    if timeout is not None:
+      self.timeout = timeout
+    if maxBufferSize is not None:
+      self.maxBufferSize = maxBufferSize
+
+    self.linesSent = 0
+    self.bytesSent = 0
+    self.flushes = 0
+    self.reconnects = 0
+    self.linesSpooled = 0
+    self.linesReplayed = 0
+    self.linesDropped = 0
+    self.flushLatency = Histogram()
+
+    self._sock = None
+    self._buffer = []
+    self._bufferLines = 0
+    self._bufferBytes = 0
+    self._lastFlush = time.time()
+    self._retryAfter = 0
+    # _lock guards the buffer, _sendLock the connection and spool
+    self._lock = threading.RLock()
+    self._sendLock = threading.RLock()
+    self._closed = threading.Event()
+
+    self._flusher = None
+    if self.flushInterval:
+      self._flusher = threading.Thread(target=self._flushPeriodically,
+                                       name="CustomMetricWriter flush")
+      self._flusher.daemon = True
+      self._flusher.start()
+
+
+  def __enter__(self):
+    return self
+
+
+  def __exit__(self, type, value, traceback):
+    self.close()
+
+
+  def _connect(self):
+    if self._sock is None:
+      self._sock = socket.create_connection((self.host, self.port),
+                                            self.timeout)
+    return self._sock
+
+
+  def _disconnect(self):
+    if self._sock is not None:
+      try:
+        self._sock.close()
+      finally:
+        self._sock = None
+
+
+  def _send(self, data):
+    """ Send data, reconnecting and retrying once if the connection fails """
+    try:
+      self._connect().sendall(data)
+    except socket.error:
+      self._disconnect()
+      self.reconnects += 1
+      self._connect().sendall(data)
+
+
+  def _sendOrSpool(self, data):
+    """ Send data, draining the spool first, or spool it if sending fails.
+        Returns True if the data was sent.
+    """
+    if time.time() >= self._retryAfter:
+      try:
+        self._replay()
+        self._send(data)
+        return True
+      except socket.error:
+        self._disconnect()
+        self._retryAfter = time.time() + self.retryInterval
+
+    self.spool.append(data)
+    self.linesSpooled += data.count("\n")
+    return False
+
+
+  def _replay(self):
+    def send(data):
+      self._send(data)
+      self.linesReplayed += data.count("\n")
+
+    self.spool.drain(send)
+
+
+  def replay(self):
+    """ Send everything in the spool now.  Raises socket.error if the
+        endpoint is unreachable, leaving the unsent data in the spool.
+    """
+    with self._sendLock:
+      self._replay()
+
+
+  def _flushPeriodically(self):
+    while not self._closed.is_set():
+      self._closed.wait(self.flushInterval)
+      if (self._buffer and self._canFlush() and
+          time.time() - self._lastFlush >= self.flushInterval):
+        try:
+          self.flush()
+        except socket.error:
+          pass # Data is kept in the buffer, retried on the next flush
+
+
+  def _canFlush(self):
+    """ Return False while buffering, without a spool, after a failed send """
+    return self.spool is not None or time.time() >= self._retryAfter
+
+
+  def _trimBuffer(self):
+    """ Drop the oldest buffered lines beyond maxBufferSize """
+    while len(self._buffer) > 1 and self._bufferBytes > self.maxBufferSize:
+      data = self._buffer.pop(0)
+      lines = data.count("\n")
+      self._bufferLines -= lines
+      self._bufferBytes -= len(data)
+      self.linesDropped += lines
+
+
+  def _buffered(self, data, count):
+    with self._lock:
+      self._buffer.append(data)
+      self._bufferLines += count
+      self._bufferBytes += len(data)
+
+      if self._bufferBytes < self.bufferSize:
+        return
+      if self.spool is None:
+        self._trimBuffer()
+
+    # Leave the data buffered if another thread is already sending
+    if self._canFlush() and self._sendLock.acquire(False):
+      try:
+        self.flush()
+      finally:
+        self._sendLock.release()
+
+
+  def writeLine(self, line):
+    """ Queue a complete, newline-terminated line for sending """
+    self._buffered(line, 1)
+
+
+  def writeLines(self, data, count):
+    """ Queue a block of `count` complete, newline-terminated lines """
+    self._buffered(data, count)
+
+
+  def write(self, name, value, timestamp):
+    """ Queue a sample for sending """
+    self.writeLine("%s %s %d\n" % (name, value, timestamp))
+
+
+  def flush(self):
+    """ Send all pending lines now """
+    with self._sendLock:
+      with self._lock:
+        if not self._buffer:
+          return
+
+        entries = self._buffer
+        data = "".join(entries)
+        lines = self._bufferLines
+        self._buffer = []
+        self._bufferLines = 0
+        self._bufferBytes = 0
+
+      start = time.time()
+
+      if self.spool is None:
+        try:
+          self._send(data)
+        except socket.error:
+          self._disconnect()
+          self._retryAfter = time.time() + self.retryInterval
+
+          # Put the data back ahead of anything written since
+          with self._lock:
+            self._buffer[:0] = entries
+            self._bufferLines += lines
+            self._bufferBytes += len(data)
+            self._trimBuffer()
+          raise
+        sent = True
+      else:
+        sent = self._sendOrSpool(data)
+
+      self._lastFlush = time.time()
+
+      if sent:
+        self.flushLatency.add(self._lastFlush - start)
+        self.flushes += 1
+        self.linesSent += lines
+        self.bytesSent += len(data)
+
+
+  def close(self, timeout=None):
+    """ Flush pending lines and shut down the connection, waiting at most
+        `timeout` seconds (default: self.timeout) for the server to close its
+        end.
+    """
+    self._closed.set()
+
+    if self._flusher is not None:
+      self._flusher.join()
+
+    with self._sendLock:
+      try:
+        self.flush()
+      finally:
+        sock = self._sock
+        self._sock = None
+
+        if self.spool is not None:
+          self.spool.close()
+
+      if sock is None:
+        return
+
+      try:
+        sock.shutdown(socket.SHUT_WR)
+        sock.settimeout(self.timeout if timeout is None else timeout)
+        while sock.recv(4096):
+          pass
+      except (socket.error, socket.timeout):
+        pass # Server didn't acknowledge the shutdown in time
+      finally:
+        sock.close()
+
+
+  def stats(self):
+    """ Return a dict of the writer's counters """
+    return {
+      "linesSent": self.linesSent,
+      "bytesSent": self.bytesSent,
+      "flushes": self.flushes,
+      "reconnects": self.reconnects,
+      "linesSpooled": self.linesSpooled,
+      "linesReplayed": self.linesReplayed,
+      "linesDropped": self.linesDropped,
+      "flushLatency": self.flushLatency.summary()}
@@ -17,6 +17,14 @@
 """ Grok Custom Metrics sample data collector.  Run this periodically using
     a scheduler such as cron to report open file descriptors (the total number
     of files open by all processes).
+
+    To collect samples without starting a process and connection for each,
+    run `grok collect` with a collector for the same command instead:
+
+      collectors:
+        - command: "/usr/sbin/lsof | /usr/bin/wc -l"
+          name: open.file.descriptors
+          interval: 300
 """
 import datetime
 import subprocess
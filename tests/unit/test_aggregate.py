@@ -0,0 +1,137 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.aggregate unit tests.
+"""
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.aggregate import Aggregator
+
+
+
+class RecordingWriter(object):
+  """ Downstream writer recording the samples written to it """
+
+  def __init__(self):
+    self.samples = []
+    self.flushed = 0
+    self.closed = False
+
+
+  def write(self, name, value, timestamp):
+    self.samples.append((name, value, timestamp))
+
+
+  def flush(self):
+    self.flushed += 1
+
+
+  def close(self):
+    self.closed = True
+
+
+  def stats(self):
+    return {"linesSent": len(self.samples)}
+
+
+
+class TestAggregator(unittest.TestCase):
+  """ Test grokcli.aggregate.Aggregator """
+
+  def testMethods(self):
+    """ Each method reduces a bucket's samples to one, at the bucket start """
+    expected = {"mean": 2.0, "sum": 6, "min": 1, "max": 3, "last": 2}
+
+    for (method, value) in expected.items():
+      downstream = RecordingWriter()
+      with Aggregator(downstream, bucket=60, method=method) as aggregator:
+        for (sample, timestamp) in ((1, 600), (3, 610), (2, 659)):
+          aggregator.write("m", sample, timestamp)
+
+      self.assertEqual(downstream.samples, [("m", value, 600)], method)
+      self.assertTrue(downstream.closed)
+
+
+  def testLaterBucketFlushesMetric(self):
+    """ A sample for a later bucket writes the metric's current bucket """
+    downstream = RecordingWriter()
+    aggregator = Aggregator(downstream, bucket=60, method="sum")
+    aggregator.write("m", 1, 600)
+    aggregator.write("m", 2, 630)
+    self.assertEqual(downstream.samples, [])
+
+    aggregator.write("m", 5, 660)
+    self.assertEqual(downstream.samples, [("m", 3, 600)])
+
+    aggregator.close()
+    self.assertEqual(downstream.samples, [("m", 3, 600), ("m", 5, 660)])
+
+
+  def testWatermarkFlushesLaggingMetrics(self):
+    """ Buckets of other metrics are written once samples a full bucket later
+        have arrived for any metric
+    """
+    downstream = RecordingWriter()
+    aggregator = Aggregator(downstream, bucket=60, method="sum")
+    aggregator.write("quiet", 1, 600)
+    aggregator.write("busy", 1, 600)
+    aggregator.write("busy", 1, 660)
+    self.assertNotIn(("quiet", 1, 600), downstream.samples)
+
+    aggregator.write("busy", 1, 720)
+    self.assertIn(("quiet", 1, 600), downstream.samples)
+
+
+  def testFlushWritesEndedBuckets(self):
+    """ flush() writes buckets before the latest, then flushes downstream """
+    downstream = RecordingWriter()
+    aggregator = Aggregator(downstream, bucket=60, method="sum")
+    aggregator.write("a", 1, 600)
+    aggregator.write("b", 2, 660)
+    aggregator.flush()
+
+    self.assertEqual(downstream.samples, [("a", 1, 600)])
+    self.assertEqual(downstream.flushed, 1)
+
+
+  def testLateSamplesDropped(self):
+    """ Samples for a bucket already written are dropped and counted """
+    downstream = RecordingWriter()
+    aggregator = Aggregator(downstream, bucket=60, method="sum")
+    aggregator.write("m", 1, 600)
+    aggregator.write("m", 1, 660)
+    aggregator.write("m", 7, 610) # Bucket 600 was written
+    aggregator.write("m", 7, 500) # Older still
+    aggregator.close()
+
+    self.assertEqual(downstream.samples, [("m", 1, 600), ("m", 1, 660)])
+    self.assertEqual(aggregator.samplesLate, 2)
+    self.assertEqual(aggregator.stats(), {"linesSent": 2,
+                                          "samplesIn": 4,
+                                          "samplesOut": 2,
+                                          "samplesLate": 2})
+
+
+  def testInvalidMethod(self):
+    with self.assertRaises(ValueError):
+      Aggregator(RecordingWriter(), method="median")
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,245 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.backfill unit tests.
+"""
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli import backfill
+from grokcli.api import GrokSession
+from grokcli.commands import loadCommand
+from grokcli.exceptions import GrokCLIError
+from grokcli.ingest import Counters
+
+
+
+class LineServer(object):
+  """ Custom Metric endpoint on localhost recording the data it receives """
+
+  def __init__(self):
+    self.data = []
+    self._listener = socket.socket()
+    self._listener.bind(("127.0.0.1", 0))
+    self._listener.listen(5)
+    self.port = self._listener.getsockname()[1]
+    self._thread = threading.Thread(target=self._serve)
+    self._thread.daemon = True
+    self._thread.start()
+
+
+  def _serve(self):
+    while True:
+      try:
+        (conn, _) = self._listener.accept()
+      except socket.error:
+        return
+
+      while True:
+        data = conn.recv(65536)
+        if not data:
+          break
+        self.data.append(data)
+      conn.close()
+
+
+  def close(self):
+    self._listener.close()
+
+
+  def lines(self):
+    return "".join(self.data).splitlines()
+
+
+
+class RecordingWriter(object):
+  """ Writer recording the blocks of lines written to it """
+
+  def __init__(self):
+    self.data = []
+
+
+  def writeLines(self, data, count):
+    self.data.append((data, count))
+
+
+  def lines(self):
+    return "".join(data for (data, _) in self.data).splitlines()
+
+
+
+class TestReaders(unittest.TestCase):
+  """ Test grokcli.backfill.readCSV() and readNumpy() """
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.tempdir)
+
+
+  def testReadCSV(self):
+    """ Rows are batched; the header, invalid rows and NaN values skipped """
+    counters = Counters()
+    fp = StringIO("timestamp,value\n100,1\n160.0,2.5\n\nx,1\n220,nan\n"
+                  "280,3\n")
+
+    self.assertEqual(list(backfill.readCSV(fp, counters, 2)),
+                     [([100, 160], [1.0, 2.5]), ([280], [3.0])])
+    self.assertEqual((counters.read, counters.skipped), (5, 2))
+
+
+  @unittest.skipIf(backfill.numpy is None, "numpy not installed")
+  def testReadNumpy(self):
+    """ Structured, two-column and .npz arrays are read in batches, skipping
+        NaN values
+    """
+    numpy = backfill.numpy
+    timestamps = numpy.arange(100, 160, 10)
+    values = numpy.array([1, 2, numpy.nan, 4, 5, 6], dtype=float)
+
+    structured = numpy.zeros(6, dtype=[("timestamp", "M8[s]"),
+                                       ("value", "f8")])
+    structured["timestamp"] = timestamps.astype("M8[s]")
+    structured["value"] = values
+
+    paths = [os.path.join(self.tempdir, name)
+             for name in ("structured.npy", "columns.npy", "arrays.npz")]
+    numpy.save(paths[0], structured)
+    numpy.save(paths[1], numpy.column_stack([timestamps, values]))
+    numpy.savez(paths[2], timestamp=timestamps, value=values)
+
+    for path in paths:
+      counters = Counters()
+      batches = list(backfill.readNumpy(path, counters, 4))
+
+      self.assertEqual([len(t) for (t, _) in batches], [3, 2], path)
+      self.assertEqual(list(numpy.concatenate([t for (t, _) in batches])),
+                       [100, 110, 130, 140, 150], path)
+      self.assertEqual(list(numpy.concatenate([v for (_, v) in batches])),
+                       [1, 2, 4, 5, 6], path)
+      self.assertEqual((counters.read, counters.skipped), (6, 1), path)
+
+
+
+class TestBackfill(unittest.TestCase):
+  """ Test grokcli.backfill.encode() and backfill() """
+
+  def testEncode(self):
+    """ Lines are the same with or without numpy """
+    expected = "my.metric 1.5 100\nmy.metric 2.0 160\n"
+    self.assertEqual(backfill.encode("my.metric", [100, 160], [1.5, 2.0]),
+                     expected)
+    self.assertEqual(backfill.encode("my.metric", [], []), "")
+
+    numpy = backfill.numpy
+    backfill.numpy = None
+    try:
+      self.assertEqual(backfill.encode("my.metric", [100, 160], [1.5, 2.0]),
+                       expected)
+    finally:
+      backfill.numpy = numpy
+
+
+  def testBackfill(self):
+    writer = RecordingWriter()
+    progress = []
+    batches = [([100, 160], [1, 2]), ([], []), ([220], [3])]
+
+    self.assertEqual(backfill.backfill(writer, "m", iter(batches),
+                                       progress=progress.append),
+                     3)
+    self.assertEqual(writer.lines(), ["m 1.0 100", "m 2.0 160", "m 3.0 220"])
+    self.assertEqual([count for (_, count) in writer.data], [2, 1])
+    self.assertEqual(progress, [2, 3])
+
+
+  def testRate(self):
+    """ Samples beyond the first second's worth are sent at `rate` """
+    batches = [(range(100), [1.0] * 100) for _ in xrange(15)]
+
+    start = time.time()
+    backfill.backfill(RecordingWriter(), "m", iter(batches), rate=1000)
+    self.assertGreaterEqual(time.time() - start, 0.4)
+
+
+
+class TestBackfillCommand(unittest.TestCase):
+  """ Test `grok custom metrics backfill` """
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.server = LineServer()
+    self.grok = GrokSession(server="http://127.0.0.1", apikey="key")
+    self.grok.customMetricPort = self.server.port
+    self.stderr = sys.stderr
+    sys.stderr = StringIO()
+
+
+  def tearDown(self):
+    sys.stderr = self.stderr
+    self.server.close()
+    shutil.rmtree(self.tempdir)
+
+
+  def testBackfillCSV(self):
+    """ Samples from a CSV file are sent, and unparseable rows reported """
+    path = os.path.join(self.tempdir, "samples.csv")
+    with open(path, "w") as fp:
+      fp.write("timestamp,value\n1400000000,1.5\nbad,row\n1400000060,2\n")
+
+    custom = loadCommand("custom")
+    custom.handleBackfillRequest(self.grok, [path], "my.metric", None, 100,
+                                 None)
+
+    self.assertEqual(self.server.lines(),
+                     ["my.metric 1.5 1400000000", "my.metric 2.0 1400000060"])
+    output = sys.stderr.getvalue()
+    self.assertIn("Backfilled 2 samples of my.metric", output)
+    self.assertIn("Skipped 1 of 3 records", output)
+
+
+  def testUnreachable(self):
+    """ Without a spool, an unreachable endpoint is reported as an error """
+    path = os.path.join(self.tempdir, "samples.csv")
+    with open(path, "w") as fp:
+      fp.write("1400000000,1.5\n")
+
+    # Nothing is listening on a port that was just released
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    self.grok.customMetricPort = listener.getsockname()[1]
+    listener.close()
+
+    custom = loadCommand("custom")
+    with self.assertRaises(GrokCLIError):
+      custom.handleBackfillRequest(self.grok, [path], "my.metric", None, 100,
+                                   None)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,199 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.bulk unit tests.
+"""
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.bulk import BulkImporter, chunked, isRejection
+from grokcli.exceptions import GrokCLIError
+
+
+
+class FakeResponse(object):
+
+  def __init__(self, status_code, content=""):
+    self.status_code = status_code
+    self.content = content
+
+
+
+def httpError(status, content=""):
+  error = GrokCLIError("HTTP %d" % status)
+  error.response = FakeResponse(status, content)
+  return error
+
+
+
+def spec(instance, **kwargs):
+  model = {"datasource": "cloudwatch",
+           "metricSpec": {"dimensions": {"InstanceId": instance}}}
+  model.update(kwargs)
+  return model
+
+
+
+class FakeGrokSession(object):
+  """ Creates models, failing as each definition's "fail" key says: "reject"
+      with a 400 response, "lost" with a timeout after which nothing was
+      created, or "created" with a timeout after the model was created.
+      Chunks fail with their first failing model's failure.
+  """
+
+  def __init__(self):
+    self.models = []
+    self.chunkRequests = 0
+    self.modelRequests = 0
+    self.exports = 0
+
+
+  def mount(self, prefix, adapter):
+    pass
+
+
+  def _create(self, models):
+    failures = [model["fail"] for model in models if "fail" in model]
+    if failures and failures[0] == "reject":
+      raise httpError(400, '{"result": "Invalid"}')
+    if failures and failures[0] == "created":
+      self.models.extend(models)
+    if failures:
+      raise GrokCLIError("Timed out")
+
+    self.models.extend(models)
+    return [{"uid": str(id(model))} for model in models]
+
+
+  def createModels(self, models):
+    self.chunkRequests += 1
+    return self._create(models)
+
+
+  def createModel(self, model):
+    self.modelRequests += 1
+    return self._create([model])
+
+
+  def exportModels(self, stream=False):
+    self.exports += 1
+    return iter(self.models)
+
+
+
+class TestIsRejection(unittest.TestCase):
+  """ Test grokcli.bulk.isRejection() """
+
+  def testIsRejection(self):
+    self.assertTrue(isRejection(httpError(400)))
+    self.assertTrue(isRejection(httpError(404)))
+    self.assertTrue(isRejection(httpError(500, '{"result": "Failed"}')))
+
+    # Nothing said about whether the request took effect
+    self.assertFalse(isRejection(httpError(502)))
+    self.assertFalse(isRejection(GrokCLIError("Timed out")))
+    self.assertFalse(isRejection(ValueError()))
+
+
+
+class TestBulkImporter(unittest.TestCase):
+  """ Test grokcli.bulk.BulkImporter """
+
+  def setUp(self):
+    self.grok = FakeGrokSession()
+    self.importer = BulkImporter(self.grok, chunkSize=3, concurrency=2,
+                                 retries=2, backoff=0)
+
+
+  def importModels(self, models):
+    results = list(self.importer.run(models))
+    # Results arrive as chunks complete
+    order = dict((id(model), i) for (i, model) in enumerate(models))
+    return sorted(results, key=lambda result: order[id(result[0])])
+
+
+  def testChunks(self):
+    models = [spec("i-%d" % i) for i in xrange(7)]
+    results = self.importModels(models)
+
+    self.assertEqual([model for (model, _, _) in results], models)
+    self.assertTrue(all(error is None and result is not None
+                        for (_, result, error) in results))
+    self.assertEqual(self.grok.chunkRequests, 3)
+    self.assertEqual(self.grok.modelRequests, 0)
+    self.assertEqual(list(chunked(xrange(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+
+
+  def testRejectedChunk(self):
+    """ The other models of a rejected chunk are created one at a time, and
+        the rejected model retried, without exporting the server's models
+    """
+    models = [spec("i-1"), spec("i-2", fail="reject"), spec("i-3")]
+    results = self.importModels(models)
+
+    self.assertEqual([error is None for (_, _, error) in results],
+                     [True, False, True])
+    self.assertEqual(results[1][2].response.status_code, 400)
+    self.assertEqual(self.grok.modelRequests, 2 + 3)
+    self.assertEqual(self.grok.exports, 0)
+    self.assertEqual(len(self.grok.models), 2)
+
+
+  def testCreatedDespiteFailure(self):
+    """ Models created by a request that timed out aren't created again """
+    models = [spec("i-1", fail="created"), spec("i-2"), spec("i-3")]
+    results = self.importModels(models)
+
+    self.assertTrue(all(error is None for (_, _, error) in results))
+    self.assertEqual(self.grok.modelRequests, 0)
+    self.assertEqual(self.grok.exports, 1)
+    self.assertEqual(len(self.grok.models), 3)
+
+
+  def testOneExportPerRound(self):
+    """ However many models fail, the server's models are exported once
+        before each round of retries
+    """
+    models = [spec("i-1", fail="lost"), spec("i-2", fail="lost"),
+              spec("i-3", fail="lost")]
+    results = self.importModels(models)
+
+    self.assertTrue(all(isinstance(error, GrokCLIError)
+                        for (_, _, error) in results))
+    self.assertEqual(self.grok.modelRequests, 3 * 3)
+    self.assertEqual(self.grok.exports, 3)
+
+
+  def testExportFailure(self):
+    """ If the server's models can't be exported, models that may have been
+        created aren't retried
+    """
+    def exportModels(stream=False):
+      raise GrokCLIError("Unavailable")
+    self.grok.exportModels = exportModels
+
+    models = [spec("i-1", fail="lost"), spec("i-2")]
+    results = self.importModels(models)
+
+    self.assertEqual([str(error) for (_, _, error) in results],
+                     ["Timed out", "Timed out"])
+    self.assertEqual(self.grok.modelRequests, 0)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,202 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.cache unit tests.
+"""
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+from grokcli.cache import ResponseCache
+
+
+
+SERVER = "https://grok"
+
+
+
+class FakeSession(object):
+  """ Records requests, answering each from `responses`, a list of (status,
+      content, headers) tuples, in turn
+  """
+
+  def __init__(self, apikey="key"):
+    self.server = SERVER
+    self.apikey = apikey
+    self.requests = []
+    self.responses = []
+
+
+  def request(self, method, url, **kwargs):
+    self.requests.append((method, url, kwargs.get("headers") or {}))
+    (status, content, headers) = self.responses.pop(0)
+
+    response = Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response.encoding = "utf-8"
+    response.url = url
+    response.raw = StringIO(content)
+    return response
+
+
+
+class TestResponseCache(unittest.TestCase):
+  """ Test grokcli.cache.ResponseCache """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.cache = ResponseCache(self.directory)
+    self.session = FakeSession()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def get(self, path, session=None, **kwargs):
+    return self.cache.request(session or self.session, "GET", SERVER + path,
+                              **kwargs)
+
+
+  def testFresh(self):
+    """ A fresh entry is served without a request """
+    self.session.responses.append((200, "[1]", {}))
+    self.assertEqual(self.get("/_models").content, "[1]")
+    self.assertEqual(self.get("/_models").content, "[1]")
+    self.assertEqual(len(self.session.requests), 1)
+
+
+  def testUncached(self):
+    """ Paths without a TTL aren't cached, and failures aren't cached """
+    self.session.responses.extend([(200, "{}", {}), (200, "{}", {}),
+                                   (500, "", {}), (200, "[]", {})])
+    self.get("/_settings")
+    self.get("/_settings")
+    self.assertEqual(self.get("/_models").status_code, 500)
+    self.assertEqual(self.get("/_models").content, "[]")
+    self.assertEqual(len(self.session.requests), 4)
+
+
+  def testRevalidation(self):
+    """ An expired entry is revalidated with its ETag, and a 304 response
+        serves the cached content for another TTL
+    """
+    self.cache.ttls = (("/_models", -1),)
+    self.session.responses.extend([(200, "[1]", {"ETag": '"v1"'}),
+                                   (304, "", {})])
+    self.get("/_models")
+
+    response = self.get("/_models")
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.content, "[1]")
+    self.assertEqual(self.session.requests[1][2]["If-None-Match"], '"v1"')
+
+    self.cache.ttls = ResponseCache.ttls
+    self.session.responses.append((304, "", {}))
+    self.get("/_models")
+    self.assertEqual(self.get("/_models").content, "[1]")
+    self.assertEqual(len(self.session.requests), 3)
+
+
+  def testChanged(self):
+    """ A 200 response to revalidation replaces the entry """
+    self.cache.ttls = (("/_models", -1),)
+    self.session.responses.extend([(200, "[1]", {"ETag": '"v1"'}),
+                                   (200, "[2]", {"ETag": '"v2"'}),
+                                   (304, "", {})])
+    self.get("/_models")
+    self.assertEqual(self.get("/_models").content, "[2]")
+    self.assertEqual(self.get("/_models").content, "[2]")
+    self.assertEqual(self.session.requests[2][2]["If-None-Match"], '"v2"')
+
+
+  def testInvalidation(self):
+    """ A successful POST discards the entries it may have changed, for the
+        same server and API key only
+    """
+    other = FakeSession(apikey="other")
+    self.session.responses.extend([(200, "[1]", {}), (200, "[1]", {}),
+                                   (200, "[1]", {})])
+    other.responses.append((200, "[1]", {}))
+    self.get("/_models")
+    self.get("/_instances")
+    self.get("/_metrics/cloudwatch")
+    self.get("/_models", session=other)
+
+    self.session.responses.extend([(400, "", {}), (201, "{}", {})])
+    self.cache.request(self.session, "POST", SERVER + "/_models")
+    self.get("/_models")
+    self.assertEqual(len(self.session.requests), 4)
+
+    self.cache.request(self.session, "POST", SERVER + "/_models")
+    self.session.responses.extend([(200, "[2]", {}), (200, "[2]", {})])
+    self.assertEqual(self.get("/_models").content, "[2]")
+    self.assertEqual(self.get("/_instances").content, "[2]")
+    self.assertEqual(self.get("/_metrics/cloudwatch").content, "[1]")
+    self.assertEqual(self.get("/_models", session=other).content, "[1]")
+
+
+  def testLRU(self):
+    """ Beyond maxSize, the least recently used entries are evicted """
+    self.session.responses.extend([(200, "a" * 150, {}),
+                                   (200, "b" * 150, {})])
+    self.get("/_models/a")
+    self.get("/_models/b")
+
+    # Room for two entries
+    name = os.listdir(self.directory)[0]
+    self.cache.maxSize = os.path.getsize(os.path.join(self.directory,
+                                                      name)) * 5 // 2
+
+    # Make /_models/a the most recently used
+    for name in os.listdir(self.directory):
+      os.utime(os.path.join(self.directory, name), (0, 0))
+    self.get("/_models/a")
+
+    self.session.responses.extend([(200, "c" * 150, {}),
+                                   (200, "b" * 150, {})])
+    self.get("/_models/c")
+    self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    self.get("/_models/a")
+    self.get("/_models/c")
+    self.get("/_models/b")
+    self.assertEqual(len(self.session.requests), 4)
+
+
+  def testStreamed(self):
+    """ A streamed response is cached once its body has been read """
+    self.session.responses.append((200, "[1, 2]", {}))
+    response = self.get("/_models", stream=True)
+    self.assertFalse([name for name in os.listdir(self.directory)
+                      if not name.startswith(".")])
+
+    self.assertEqual("".join(response.iter_content(2)), "[1, 2]")
+    self.assertEqual(self.get("/_models").content, "[1, 2]")
+    self.assertEqual(len(self.session.requests), 1)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,164 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.compression unit tests.
+"""
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli import compression
+from grokcli.compression import (CompressedReader, CompressedWriter,
+                                 detectCompression, openInput, openOutput,
+                                 recoverOutput)
+from grokcli.exceptions import GrokCLIError
+
+
+
+LINES = ['{"uid": "model-%d", "datasource": "custom"}\n' % i
+         for i in xrange(2000)]
+
+
+def compress(data, name):
+  fp = StringIO()
+  writer = CompressedWriter(fp, name, closeFile=False)
+  writer.write(data)
+  writer.close()
+  return fp.getvalue()
+
+
+def decompress(data, name, **kwargs):
+  return CompressedReader(StringIO(data), name, **kwargs).read()
+
+
+
+class CompressionTestMixin(object):
+  """ Tests run for each compression """
+
+  compression = None
+
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def testRoundTrip(self):
+    data = "".join(LINES)
+    compressed = compress(data, self.compression)
+    self.assertLess(len(compressed), len(data))
+    self.assertEqual(decompress(compressed, self.compression), data)
+
+
+  def testLinesAcrossChunks(self):
+    """ readline() and iteration reassemble lines split across chunks """
+    reader = CompressedReader(StringIO(compress("".join(LINES),
+                                                self.compression)),
+                              self.compression)
+    reader.chunkSize = 7
+    self.assertEqual(list(reader), LINES)
+
+
+  def testConcatenatedStreams(self):
+    """ Streams appended to one another are read in turn """
+    data = (compress("".join(LINES[:10]), self.compression) +
+            compress("".join(LINES[10:20]), self.compression))
+    self.assertEqual(decompress(data, self.compression), "".join(LINES[:20]))
+
+
+  def testTruncated(self):
+    """ Input cut off part way through a stream raises GrokCLIError """
+    compressed = compress("".join(LINES), self.compression)
+
+    with self.assertRaises(GrokCLIError):
+      decompress(compressed[:len(compressed) // 2], self.compression)
+
+    # Likewise if it is cut off in a later stream
+    with self.assertRaises(GrokCLIError):
+      decompress(compressed + compressed[:len(compressed) // 2],
+                 self.compression)
+
+    partial = decompress(compressed[:len(compressed) // 2], self.compression,
+                         strict=False)
+    self.assertTrue("".join(LINES).startswith(partial))
+
+
+  def testFlushedOutputReadable(self):
+    """ Everything written before flush() can be read back, even if the stream
+        is never closed
+    """
+    fp = StringIO()
+    writer = CompressedWriter(fp, self.compression, closeFile=False)
+    writer.write("".join(LINES[:10]))
+    writer.flush()
+
+    reader = CompressedReader(StringIO(fp.getvalue()), self.compression,
+                              strict=False)
+    self.assertEqual(list(reader), LINES[:10])
+
+
+  def testRecoverAndAppend(self):
+    """ recoverOutput() makes the output of a killed export appendable """
+    path = os.path.join(self.directory, "models.ndjson")
+
+    outp = openOutput(path, self.compression)
+    outp.write("".join(LINES[:10]))
+    outp.flush()
+    outp.write(LINES[10][:5]) # Killed part way through a line
+    outp.flush()
+    outp.fp.close()
+
+    self.assertEqual(recoverOutput(path, self.compression), 5)
+
+    with openOutput(path, self.compression, append=True) as outp:
+      outp.write("".join(LINES[10:20]))
+
+    with openInput(path, self.compression) as inp:
+      self.assertEqual(list(inp), LINES[:20])
+
+
+
+class TestGzip(CompressionTestMixin, unittest.TestCase):
+  """ Test gzip compression """
+
+  compression = "gzip"
+
+
+  def testDetectCompression(self):
+    self.assertEqual(detectCompression("models.json.gz"), "gzip")
+    self.assertEqual(detectCompression("models.zst"), "zstd")
+    self.assertIsNone(detectCompression("models.json"))
+    self.assertIsNone(detectCompression(None))
+
+
+
+@unittest.skipIf(compression.zstandard is None, "zstandard not installed")
+class TestZstd(CompressionTestMixin, unittest.TestCase):
+  """ Test zstd compression """
+
+  compression = "zstd"
+
+
+
+if __name__ == "__main__":
+  unittest.main()
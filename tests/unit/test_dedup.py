@@ -0,0 +1,109 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.dedup unit tests.
+"""
+import os
+import shutil
+import tempfile
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.dedup import Deduplicator
+
+
+
+class RecordingWriter(object):
+  """ Downstream writer recording the samples written to it """
+
+  def __init__(self):
+    self.samples = []
+
+
+  def write(self, name, value, timestamp):
+    self.samples.append((name, value, timestamp))
+
+
+  def close(self):
+    pass
+
+
+  def stats(self):
+    return {}
+
+
+
+class TestDeduplicator(unittest.TestCase):
+  """ Test grokcli.dedup.Deduplicator """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.stateFile = os.path.join(self.directory, "dedup.state")
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def testDropsDuplicateAndOlderSamples(self):
+    downstream = RecordingWriter()
+    with Deduplicator(downstream) as writer:
+      writer.write("a", 1, 100)
+      writer.write("a", 2, 100)
+      writer.write("a", 3, 90)
+      writer.write("b", 4, 90)
+      writer.write("a", 5, 110)
+
+    self.assertEqual(downstream.samples,
+                     [("a", 1, 100), ("b", 4, 90), ("a", 5, 110)])
+    self.assertEqual(writer.stats(), {"duplicates": 1, "outOfOrder": 1})
+
+
+  def testStatePersistsAcrossRuns(self):
+    """ Samples already sent by a previous run are dropped """
+    with Deduplicator(RecordingWriter(), self.stateFile) as writer:
+      writer.write("a.metric", 1, 100)
+      writer.write("name with spaces", 1, 200)
+
+    downstream = RecordingWriter()
+    with Deduplicator(downstream, self.stateFile) as writer:
+      writer.write("a.metric", 1, 100)
+      writer.write("name with spaces", 1, 150)
+      writer.write("a.metric", 2, 101)
+
+    self.assertEqual(downstream.samples, [("a.metric", 2, 101)])
+    self.assertEqual(writer.duplicates, 1)
+    self.assertEqual(writer.outOfOrder, 1)
+
+    # The second run's state was saved in turn
+    with open(self.stateFile, "r") as fp:
+      self.assertEqual(sorted(fp), ["a.metric 101\n",
+                                    "name with spaces 200\n"])
+
+
+  def testMissingStateFile(self):
+    downstream = RecordingWriter()
+    with Deduplicator(downstream, self.stateFile) as writer:
+      writer.write("a", 1, 100)
+
+    self.assertEqual(downstream.samples, [("a", 1, 100)])
+    self.assertTrue(os.path.exists(self.stateFile))
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,130 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grok export unit tests.
+"""
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.commands import loadCommand
+from grokcli.exceptions import GrokCLIError
+
+
+
+class FakeGrokSession(object):
+  """ Exports models by uid, failing for the uids in `failing` """
+
+  def __init__(self, uids, failing=()):
+    self.uids = uids
+    self.failing = set(failing)
+    self.exported = []
+
+
+  def mount(self, prefix, adapter):
+    pass
+
+
+  def listModels(self, stream=False):
+    return iter([{"uid": uid} for uid in self.uids])
+
+
+  def exportModel(self, uid):
+    if uid in self.failing:
+      raise GrokCLIError("Unable to export model.")
+    self.exported.append(uid)
+    return [{"uid": uid, "datasource": "custom"}]
+
+
+
+class TestNDJSONExport(unittest.TestCase):
+  """ Test `grok export --ndjson` """
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.export = loadCommand("export")
+    self.stderr = sys.stderr
+    sys.stderr = StringIO()
+
+
+  def tearDown(self):
+    sys.stderr = self.stderr
+    shutil.rmtree(self.tempdir)
+
+
+  def exportedUids(self, fp):
+    return sorted(json.loads(line)["uid"] for line in fp)
+
+
+  def testResume(self):
+    """ A failed export records the models it exported in FILE.done, and
+        running it again exports only the rest, then removes FILE.done
+    """
+    output = os.path.join(self.tempdir, "models.ndjson")
+
+    grok = FakeGrokSession(["a", "b", "c"], failing=["b"])
+    with self.assertRaises(GrokCLIError):
+      self.export.handleNDJSONRequest(grok, output, 2)
+
+    with open(output + ".done") as fp:
+      self.assertEqual(sorted(fp.read().split()), ["a", "c"])
+
+    grok = FakeGrokSession(["a", "b", "c"])
+    self.export.handleNDJSONRequest(grok, output, 2)
+
+    self.assertEqual(grok.exported, ["b"])
+    self.assertFalse(os.path.exists(output + ".done"))
+    with open(output) as fp:
+      self.assertEqual(self.exportedUids(fp), ["a", "b", "c"])
+    self.assertIn("Exported 1 model(s), 2 already exported",
+                  sys.stderr.getvalue())
+
+
+  def testResumeCompressed(self):
+    """ A resumed compressed export appends a stream that reads as one """
+    output = os.path.join(self.tempdir, "models.ndjson.gz")
+
+    with self.assertRaises(GrokCLIError):
+      self.export.handleNDJSONRequest(
+        FakeGrokSession(["a", "b"], failing=["b"]), output, 2)
+    self.export.handleNDJSONRequest(FakeGrokSession(["a", "b"]), output, 2)
+
+    with gzip.open(output) as fp:
+      self.assertEqual(self.exportedUids(fp), ["a", "b"])
+
+
+  def testFresh(self):
+    """ Without FILE.done, an existing FILE is overwritten """
+    output = os.path.join(self.tempdir, "models.ndjson")
+    with open(output, "w") as fp:
+      fp.write('{"uid": "old"}\n')
+
+    self.export.handleNDJSONRequest(FakeGrokSession(["a"]), output, 2)
+
+    with open(output) as fp:
+      self.assertEqual(self.exportedUids(fp), ["a"])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
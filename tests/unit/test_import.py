@@ -0,0 +1,125 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" `grok import` unit tests.
+"""
+import json
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.commands import loadCommand
+from grokcli.exceptions import GrokCLIError
+from grokcli.serialization import dumpYAML, importYAML
+
+
+
+def spec(instance, maxValue=100):
+  return {
+    "datasource": "cloudwatch",
+    "metricSpec": {
+      "region": "us-west-2",
+      "namespace": "AWS/EC2",
+      "metric": "CPUUtilization",
+      "dimensions": {"InstanceId": instance}},
+    "modelParams": {"min": 0, "max": maxValue}}
+
+
+
+class FakeGrokSession(object):
+  """ Serves a fixed export of the server's models """
+
+  def __init__(self, models):
+    self.models = models
+
+
+  def exportModels(self, stream=False):
+    return iter(self.models)
+
+
+
+class TestPlanSync(unittest.TestCase):
+  """ Test `grok import --sync` planning """
+
+  def setUp(self):
+    self.planSync = loadCommand("import").planSync
+
+
+  def testClassification(self):
+    grok = FakeGrokSession([spec("i-1"), spec("i-2")])
+    models = [
+      spec("i-1"),               # Same definition on the server
+      spec("i-2", maxValue=200), # Same metric, different definition
+      spec("i-3"),               # Not on the server
+      spec("i-3")]               # Repeated in the input
+
+    self.assertEqual([action for (action, _) in self.planSync(grok, models)],
+                     ["skip", "conflict", "create", "skip"])
+
+
+  def testModelsYieldedWithActions(self):
+    models = [spec("i-1"), spec("i-2")]
+    plan = list(self.planSync(FakeGrokSession([]), iter(models)))
+    self.assertEqual(plan, [("create", models[0]), ("create", models[1])])
+
+
+
+class TestIterModels(unittest.TestCase):
+  """ Test `grok import` input decoding """
+
+  def setUp(self):
+    self.iterModels = loadCommand("import").iterModels
+    self.models = [spec("i-1"), spec("i-2"), spec("i-3")]
+
+
+  def decode(self, text):
+    # Small chunks, so that values span several of them
+    return list(self.iterModels(StringIO(text), chunkSize=7))
+
+
+  def testJSONArray(self):
+    self.assertEqual(self.decode("\n  " + json.dumps(self.models)),
+                     self.models)
+
+
+  def testNDJSON(self):
+    """ One object per line, as written by `grok export --ndjson`, and lists
+        of objects, which are flattened
+    """
+    text = "".join(json.dumps(model) + "\n" for model in self.models[:2])
+    text += json.dumps(self.models[2:])
+    self.assertEqual(self.decode(text), self.models)
+
+
+  @unittest.skipIf(importYAML() is None, "PyYAML not installed")
+  def testYAML(self):
+    text = dumpYAML(self.models[:2]) + "---\n" + dumpYAML(self.models[2])
+    self.assertEqual(self.decode(text), self.models)
+
+
+  def testEmpty(self):
+    self.assertEqual(self.decode(" \n"), [])
+
+
+  def testInvalid(self):
+    with self.assertRaises(GrokCLIError):
+      self.decode(json.dumps(self.models)[:-10])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,230 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.index unit tests.
+"""
+import json
+import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import time
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from requests.models import Response
+
+from grokcli.api import GrokSession
+from grokcli.index import ModelIndex
+
+
+
+def model(uid, name="AWS/EC2/CPUUtilization", server=None):
+  return {"uid": uid,
+          "datasource": "cloudwatch",
+          "name": name,
+          "server": server or "us-west-2/AWS/EC2/i-" + uid}
+
+
+
+class FakeServerSession(GrokSession):
+  """ GrokSession answering model list and delete requests from `models` """
+
+  def __init__(self, models):
+    super(FakeServerSession, self).__init__(server="https://grok",
+                                            apikey="key")
+    self.models = dict((model["uid"], model) for model in models)
+    self.listed = 0
+
+
+  def request(self, method, url, **kwargs):
+    response = Response()
+    response.encoding = "utf-8"
+    response.url = url
+    path = url[len(self.server):]
+
+    if method == "GET" and path == "/_models":
+      self.listed += 1
+      response.status_code = 200
+      body = json.dumps(self.models.values())
+    elif method == "DELETE" and path.startswith("/_models/"):
+      uid = path.rpartition("/")[2]
+      response.status_code = 200 if self.models.pop(uid, None) else 404
+      body = "{}"
+    else:
+      response.status_code = 400
+      body = ""
+
+    response.raw = StringIO(body)
+    return response
+
+
+
+class TestModelIndex(unittest.TestCase):
+  """ Test grokcli.index.ModelIndex """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "models")
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def testFind(self):
+    index = ModelIndex([model("a"), model("b"), model("c", name="Other")])
+
+    self.assertEqual(len(index), 3)
+    self.assertEqual([m["uid"] for m in index.find("cloudwatch",
+                                                   name="Other")],
+                     ["c"])
+    self.assertEqual(index.find("cloudwatch", server=model("a")["server"]),
+                     [model("a")])
+    self.assertEqual(index.find("cloudwatch", name="Other",
+                                server=model("a")["server"]),
+                     [])
+    self.assertEqual(index.find("custom", name="Other"), [])
+
+    index.remove("c")
+    self.assertEqual(index.find("cloudwatch", name="Other"), [])
+    self.assertNotIn("c", index)
+
+
+  def testJournal(self):
+    """ Changes after a snapshot are journaled, and replayed on load """
+    index = ModelIndex([model("a"), model("b")], self.path, "owner")
+    index.save()
+    index.add(model("c"))
+    index.remove("a")
+
+    loaded = ModelIndex.load(self.path, "owner")
+    self.assertFalse(loaded.fresh)
+    self.assertEqual(sorted(m["uid"] for m in loaded), ["b", "c"])
+
+    ModelIndex.recordRemoval(self.path, "b")
+    loaded = ModelIndex.load(self.path, "owner")
+    self.assertEqual([m["uid"] for m in loaded], ["c"])
+
+
+  def testJournalCompaction(self):
+    """ A long journal is folded into a new snapshot """
+    index = ModelIndex([], self.path, "owner")
+    index.maxJournal = 2
+    index.save()
+
+    for uid in "abc":
+      index.add(model(uid))
+    self.assertTrue(os.path.exists(self.path + ".journal"))
+
+    # Longer than both maxJournal and the index
+    index.remove("a")
+    self.assertFalse(os.path.exists(self.path + ".journal"))
+    self.assertEqual(len(ModelIndex.load(self.path, "owner")), 2)
+
+
+  def testNotLoaded(self):
+    """ An index isn't loaded for another owner, once older than maxAge, or
+        with a truncated journal
+    """
+    ModelIndex([model("a")], self.path, "owner").save()
+    self.assertIsNone(ModelIndex.load(self.path, "other"))
+
+    ModelIndex([model("a")], self.path, "owner",
+               built=time.time() - ModelIndex.maxAge - 1).save()
+    self.assertIsNone(ModelIndex.load(self.path, "owner"))
+
+    index = ModelIndex([model("a")], self.path, "owner")
+    index.save()
+    with open(self.path + ".journal", "a") as fp:
+      fp.write('["+", {"uid": ')
+    self.assertIsNone(ModelIndex.load(self.path, "owner"))
+    self.assertIsNone(ModelIndex.load(os.path.join(self.directory, "none"),
+                                      "owner"))
+
+
+
+class TestSessionModelIndex(unittest.TestCase):
+  """ Test GrokSession's use of a persisted ModelIndex """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "models")
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def session(self, models):
+    grok = FakeServerSession(models)
+    grok.modelIndexPath = self.path
+    return grok
+
+
+  def testPersisted(self):
+    """ A later session finds models without listing them """
+    self.session([model("a")]).modelIndex
+
+    grok = self.session([model("a")])
+    self.assertEqual(grok.findModels("cloudwatch", name=model("a")["name"]),
+                     [model("a")])
+    self.assertEqual(grok.listed, 0)
+
+
+  def testRebuiltWhenNotFound(self):
+    """ A model created by another client is found by rebuilding """
+    self.session([model("a")]).modelIndex
+
+    grok = self.session([model("a"), model("b", name="New")])
+    self.assertEqual(grok.findModels("cloudwatch", name="New"),
+                     [model("b", name="New")])
+    self.assertEqual(grok.listed, 1)
+    self.assertTrue(grok.modelIndex.fresh)
+
+
+  def testDeleteFoundModel(self):
+    """ A model that another client deleted is dropped from the index, and
+        the lookup retried against the server's current models
+    """
+    self.session([model("a"), model("b")]).modelIndex
+
+    grok = self.session([model("b")])
+    self.assertEqual(grok.deleteFoundModel("cloudwatch",
+                                           name=model("a")["name"]),
+                     model("b"))
+    self.assertEqual(grok.models, {})
+    self.assertEqual(grok.listed, 1)
+
+    self.assertIsNone(grok.deleteFoundModel("cloudwatch",
+                                            name=model("a")["name"]))
+
+
+  def testDeleteModelJournaled(self):
+    """ Deleting a model without loading the index journals its removal """
+    self.session([model("a"), model("b")]).modelIndex
+
+    self.session([model("a"), model("b")]).deleteModel("a")
+
+    grok = self.session([model("b")])
+    self.assertEqual([m["uid"] for m in grok.modelIndex], ["b"])
+    self.assertEqual(grok.listed, 0)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
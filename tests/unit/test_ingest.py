@@ -0,0 +1,111 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.ingest unit tests.
+"""
+import socket
+import threading
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli import ingest
+
+
+
+class RecordingWriter(object):
+  """ Writer recording the samples written to it, or failing after `limit` """
+
+  def __init__(self, limit=None):
+    self.samples = []
+    self.limit = limit
+
+
+  def write(self, name, value, timestamp):
+    if self.limit is not None and len(self.samples) >= self.limit:
+      raise socket.error("Connection refused")
+    self.samples.append((name, value, timestamp))
+
+
+
+def readers():
+  return [thread for thread in threading.enumerate()
+          if thread.name == "ingest reader"]
+
+
+
+class TestParsers(unittest.TestCase):
+  """ Test the grokcli.ingest input parsers """
+
+  def testFormats(self):
+    """ Each format yields the same samples, skipping invalid records """
+    inputs = {
+      "line": "a 1 100\n\nb 2.5 200\nbad\n",
+      "csv": "name,value,timestamp\na,1,100\nb,2.5,200\nbad\n",
+      "ndjson": ('{"name": "a", "value": 1, "timestamp": 100}\n'
+                 '{"name": "b", "value": 2.5, "timestamp": 200}\n'
+                 '{"name": "bad"}\n')}
+
+    for (fmt, text) in inputs.items():
+      counters = ingest.Counters()
+      samples = list(ingest.PARSERS[fmt](StringIO(text), counters))
+
+      self.assertEqual(samples, [("a", 1.0, 100), ("b", 2.5, 200)], fmt)
+      self.assertEqual((counters.read, counters.skipped), (3, 1), fmt)
+
+
+
+class TestPump(unittest.TestCase):
+  """ Test grokcli.ingest.pump() """
+
+  def testPump(self):
+    samples = [("m", i, i) for i in xrange(2500)]
+    writer = RecordingWriter()
+
+    self.assertEqual(ingest.pump(iter(samples), writer, queueSize=1000,
+                                 batchSize=100),
+                     2500)
+    self.assertEqual(writer.samples, samples)
+    self.assertEqual(readers(), [])
+
+
+  def testReaderError(self):
+    """ An exception reading input is raised by pump() """
+    def samples():
+      yield ("m", 1, 1)
+      raise IOError("Read failed")
+
+    with self.assertRaises(IOError):
+      ingest.pump(samples(), RecordingWriter(), batchSize=1)
+
+
+  def testWriterErrorStopsReader(self):
+    """ The reader is stopped, not left blocked on a full queue, if writing
+        fails
+    """
+    samples = (("m", i, i) for i in xrange(10 ** 6))
+
+    with self.assertRaises(socket.error):
+      ingest.pump(samples, RecordingWriter(limit=50), queueSize=100,
+                  batchSize=10)
+
+    self.assertEqual(readers(), [])
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,122 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.jsonstream unit tests.
+"""
+import json
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.jsonstream import iterJSONArray, iterJSONValues, writeJSONArray
+
+
+
+MODELS = [
+  {"uid": "abc", "name": u"caf\xe9 \u2603", "value": 12.5},
+  {"uid": "def", "tags": [], "min": -1e-11},
+  12345,
+  u"\xfcber",
+  None,
+  [1, [2, {"three": True}]]]
+
+
+def splits(text):
+  """ Yield text split into two chunks at every position, and into chunks of
+      every size up to 7 bytes
+  """
+  for position in xrange(len(text) + 1):
+    yield [text[:position], text[position:]]
+
+  for size in xrange(1, 8):
+    yield [text[i:i + size] for i in xrange(0, len(text), size)]
+
+
+
+class TestIterJSONArray(unittest.TestCase):
+  """ Test grokcli.jsonstream.iterJSONArray() """
+
+  def testChunkBoundaries(self):
+    """ Elements decode the same wherever the input is split, including
+        inside numbers and multi-byte UTF-8 characters
+    """
+    text = json.dumps(MODELS, ensure_ascii=False, indent=2).encode("utf-8")
+
+    for chunks in splits(text):
+      self.assertEqual(list(iterJSONArray(chunks)), MODELS, chunks)
+
+
+  def testNumberAtChunkEnd(self):
+    """ A number isn't yielded until it can't continue in the next chunk """
+    self.assertEqual(list(iterJSONArray(["[1", "23", ", 4", "5]"])),
+                     [123, 45])
+
+
+  def testEmpty(self):
+    self.assertEqual(list(iterJSONArray(["  [ ", " ]  "])), [])
+
+
+  def testInvalid(self):
+    for chunks in (["{}"], ["[1, 2"], ["[1 2]"], ["[1] 2"], [""]):
+      with self.assertRaises(ValueError):
+        list(iterJSONArray(chunks))
+
+
+
+class TestIterJSONValues(unittest.TestCase):
+  """ Test grokcli.jsonstream.iterJSONValues() """
+
+  def testChunkBoundaries(self):
+    """ NDJSON values decode the same wherever the input is split """
+    text = "".join(json.dumps(model, ensure_ascii=False).encode("utf-8") + "\n"
+                   for model in MODELS)
+
+    for chunks in splits(text):
+      self.assertEqual(list(iterJSONValues(chunks)), MODELS, chunks)
+
+
+  def testTrailingNumber(self):
+    """ A number ending the input is complete """
+    self.assertEqual(list(iterJSONValues(["1 2", "3"])), [1, 23])
+
+
+  def testTruncated(self):
+    with self.assertRaises(ValueError):
+      list(iterJSONValues(['{"uid": "abc"}\n{"uid": ']))
+
+
+
+class TestWriteJSONArray(unittest.TestCase):
+  """ Test grokcli.jsonstream.writeJSONArray() """
+
+  def testRoundTrip(self):
+    for indent in (None, 2):
+      fp = StringIO()
+      self.assertEqual(writeJSONArray(fp, iter(MODELS), indent=indent),
+                       len(MODELS))
+      self.assertEqual(json.loads(fp.getvalue()), MODELS)
+
+
+  def testEmpty(self):
+    fp = StringIO()
+    self.assertEqual(writeJSONArray(fp, iter([]), indent=2), 0)
+    self.assertEqual(fp.getvalue(), "[]")
+
+
+
+if __name__ == "__main__":
+  unittest.main()
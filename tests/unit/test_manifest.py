@@ -0,0 +1,121 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.manifest unit tests.
+"""
+import os
+import shutil
+import tempfile
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.manifest import (contentHash, definitionHash, ExportManifest,
+                              modelIdentity)
+
+
+
+MODEL = {
+  "uid": "abc",
+  "datasource": "cloudwatch",
+  "name": "AWS/EC2/CPUUtilization",
+  "server": "us-west-2/AWS/EC2/i-12345678",
+  "parameters": {"min": 0, "max": 100},
+  "status": 1,
+  "last_timestamp": "2014-01-01 00:00:00"}
+
+SPEC = {
+  "datasource": "cloudwatch",
+  "metricSpec": {
+    "region": "us-west-2",
+    "namespace": "AWS/EC2",
+    "metric": "CPUUtilization",
+    "dimensions": {"InstanceId": "i-12345678"}},
+  "modelParams": {"min": 0, "max": 100}}
+
+
+
+class TestHashes(unittest.TestCase):
+  """ Test grokcli.manifest's hash functions """
+
+  def testContentHashIgnoresKeyOrder(self):
+    reordered = dict(reversed(list(MODEL.items())))
+    reordered["parameters"] = {"max": 100, "min": 0}
+    self.assertEqual(contentHash(reordered), contentHash(MODEL))
+
+
+  def testContentHashDetectsChanges(self):
+    changed = dict(MODEL, parameters={"min": 0, "max": 101})
+    self.assertNotEqual(contentHash(changed), contentHash(MODEL))
+    self.assertNotEqual(contentHash(1), contentHash(1.5))
+
+
+  def testDefinitionHashIgnoresVolatileFields(self):
+    running = dict(MODEL, status=2, last_timestamp="2014-01-02 00:00:00",
+                   last_rowid=42, message="Running")
+    self.assertEqual(definitionHash(running), definitionHash(MODEL))
+    self.assertNotEqual(definitionHash(dict(MODEL, name="other")),
+                        definitionHash(MODEL))
+
+
+  def testModelIdentity(self):
+    """ Definitions of the same metric have the same identity, whatever their
+        model parameters
+    """
+    tuned = dict(SPEC, modelParams={"min": 0, "max": 200})
+    self.assertEqual(modelIdentity(tuned), modelIdentity(SPEC))
+
+    other = dict(SPEC, metricSpec=dict(SPEC["metricSpec"],
+                                       metric="NetworkIn"))
+    self.assertNotEqual(modelIdentity(other), modelIdentity(SPEC))
+
+
+
+class TestExportManifest(unittest.TestCase):
+  """ Test grokcli.manifest.ExportManifest """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "manifest.json")
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def testRoundTrip(self):
+    models = {"abc": {"definition": definitionHash(MODEL),
+                      "content": contentHash(SPEC)}}
+    ExportManifest(models).save(self.path)
+    self.assertEqual(ExportManifest.load(self.path).models, models)
+    self.assertEqual(os.listdir(self.directory), ["manifest.json"])
+
+
+  def testMissing(self):
+    self.assertEqual(ExportManifest.load(self.path).models, {})
+
+
+  def testUnsupportedVersion(self):
+    with open(self.path, "w") as fp:
+      fp.write('{"version": 99, "models": {}}')
+
+    with self.assertRaises(ValueError):
+      ExportManifest.load(self.path)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
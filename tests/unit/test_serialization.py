@@ -0,0 +1,145 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.serialization unit tests.
+"""
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli import serialization
+
+
+
+MODEL = {"uid": "abc",
+         "name": u"caf\xe9",
+         "min": -1e-11,
+         "max": 12345678901.25,
+         "tags": ["a", "b"],
+         "enabled": True,
+         "stackSpec": None}
+
+
+
+class TestJSONBackends(unittest.TestCase):
+  """ Test JSON backend selection """
+
+  def setUp(self):
+    self.backend = serialization.jsonBackend
+
+
+  def tearDown(self):
+    serialization.setJSONBackend(self.backend)
+
+
+  def testBackends(self):
+    """ Every installed backend round-trips values, floats exactly """
+    available = serialization.availableJSONBackends()
+    self.assertIn("json", available)
+    self.assertEqual(serialization.jsonBackend, available[0])
+
+    for name in available:
+      serialization.setJSONBackend(name)
+      self.assertEqual(serialization.jsonBackend, name)
+
+      text = serialization.dumpJSON(MODEL)
+      self.assertEqual(serialization.loadJSON(text), MODEL, name)
+      self.assertEqual(serialization.loadJSON(serialization.dumpJSON(
+                         MODEL, indent=2)), MODEL, name)
+
+
+  def testUnknownBackend(self):
+    with self.assertRaises(ValueError):
+      serialization.setJSONBackend("marshal")
+    self.assertEqual(serialization.jsonBackend, self.backend)
+
+
+
+@unittest.skipIf(serialization.importYAML() is None, "PyYAML not installed")
+class TestYAML(unittest.TestCase):
+  """ Test YAML encoding and decoding """
+
+  def testRoundTrip(self):
+    text = serialization.dumpYAML([MODEL])
+    self.assertTrue(text.startswith("- "))
+    self.assertEqual(serialization.loadYAML(text), [MODEL])
+
+
+  def testLoad(self):
+    """ load() decodes JSON documents and YAML, including flow collections
+    """
+    self.assertEqual(serialization.load(serialization.dumpJSON(MODEL)),
+                     MODEL)
+    self.assertEqual(serialization.load("- uid: abc\n"), [{"uid": "abc"}])
+    self.assertEqual(serialization.load("[a, b]"), ["a", "b"])
+    self.assertEqual(serialization.load(serialization.dump([MODEL])),
+                     [MODEL])
+
+
+
+@unittest.skipIf(serialization.importYAML() is None, "PyYAML not installed")
+class TestIterYAMLItems(unittest.TestCase):
+  """ Test grokcli.serialization.iterYAMLItems() """
+
+  text = ("- uid: a\n"
+          "  tags: &tags [x, y]\n"
+          "- uid: b\n"
+          "  tags: *tags\n"
+          "---\n"
+          "uid: c\n"
+          "---\n"
+          "[]\n"
+          "---\n"
+          "- uid: d\n")
+
+  expected = [{"uid": "a", "tags": ["x", "y"]},
+              {"uid": "b", "tags": ["x", "y"]},
+              {"uid": "c"},
+              {"uid": "d"}]
+
+
+  def testItems(self):
+    """ Sequence items are yielded one at a time, other documents whole, and
+        aliases resolved within a document
+    """
+    self.assertEqual(list(serialization.iterYAMLItems(StringIO(self.text))),
+                     self.expected)
+
+
+  def testPurePythonLoader(self):
+    """ The pure Python loader, used without libyaml, gives the same items """
+    itemLoader = serialization._ItemLoader
+    serialization._ItemLoader = serialization.yaml.SafeLoader
+    try:
+      self.assertEqual(
+        list(serialization.iterYAMLItems(StringIO(self.text))),
+        self.expected)
+    finally:
+      serialization._ItemLoader = itemLoader
+
+
+  def testIncremental(self):
+    """ Items are yielded before the rest of the stream has been parsed """
+    items = serialization.iterYAMLItems(StringIO("- uid: a\n- uid: [b\n"))
+    self.assertEqual(next(items), {"uid": "a"})
+    with self.assertRaises(serialization.yaml.YAMLError):
+      next(items)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
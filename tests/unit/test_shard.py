@@ -0,0 +1,92 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.shard unit tests.
+"""
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.shard import ConsistentHashRing
+
+
+
+KEYS = ["metric.%d" % i for i in xrange(5000)]
+
+
+
+class TestConsistentHashRing(unittest.TestCase):
+  """ Test grokcli.shard.ConsistentHashRing """
+
+  def _assignments(self, ring):
+    return dict((key, ring.get(key)) for key in KEYS)
+
+
+  def testSpread(self):
+    """ Every node gets a share of the keys """
+    ring = ConsistentHashRing(["a", "b", "c", "d"])
+    counts = {}
+    for node in self._assignments(ring).values():
+      counts[node] = counts.get(node, 0) + 1
+
+    self.assertEqual(sorted(counts), ["a", "b", "c", "d"])
+    for count in counts.values():
+      self.assertGreater(count, len(KEYS) / 4 / 2)
+
+
+  def testAddMovesKeysOnlyToNewNode(self):
+    """ Adding a node only moves keys to that node, about 1/N of them """
+    ring = ConsistentHashRing(["a", "b", "c"])
+    before = self._assignments(ring)
+    ring.add("d")
+    after = self._assignments(ring)
+
+    moved = [key for key in KEYS if before[key] != after[key]]
+    self.assertTrue(all(after[key] == "d" for key in moved))
+    self.assertGreater(len(moved), len(KEYS) / 4 / 2)
+    self.assertLess(len(moved), len(KEYS) / 4 * 2)
+
+
+  def testRemoveMovesOnlyRemovedNodesKeys(self):
+    """ Removing a node only moves the keys it had """
+    ring = ConsistentHashRing(["a", "b", "c", "d"])
+    before = self._assignments(ring)
+    ring.remove("b")
+    after = self._assignments(ring)
+
+    for key in KEYS:
+      if before[key] == "b":
+        self.assertNotEqual(after[key], "b")
+      else:
+        self.assertEqual(after[key], before[key])
+
+
+  def testAddThenRemoveRestoresAssignments(self):
+    ring = ConsistentHashRing(["a", "b"])
+    before = self._assignments(ring)
+    ring.add("c")
+    ring.remove("c")
+    self.assertEqual(self._assignments(ring), before)
+
+
+  def testEmpty(self):
+    with self.assertRaises(LookupError):
+      ConsistentHashRing().get("metric")
+
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,132 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grok shell and grok run unit tests.
+"""
+import os
+from optparse import OptionParser
+import sys
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.api import GrokSession
+from grokcli.commands import loadCommand, shell
+from grokcli.exceptions import GrokCLIError
+
+
+
+class FakeCommand(object):
+  """ Command module recording its calls, failing as its first argument says
+  """
+
+  def __init__(self):
+    self.parser = OptionParser()
+    self.calls = []
+
+
+  def handle(self, options, args):
+    self.calls.append((args, os.environ.get("GROK_SERVER_URL")))
+    if args and args[0] == "raise":
+      raise ValueError("Unexpected")
+    if args and args[0] == "fail":
+      raise GrokCLIError("Failed")
+    if args and args[0] == "exit":
+      sys.exit(3)
+
+
+
+class ShellTestCase(unittest.TestCase):
+  """ Runs commands with FakeCommand in place of every command module """
+
+  def setUp(self):
+    self.command = FakeCommand()
+    self.loadCommand = shell.loadCommand
+    shell.loadCommand = lambda name: self.command
+
+    self.environ = dict(os.environ)
+    self.adapter = GrokSession.adapter
+    self.stderr = sys.stderr
+    sys.stderr = StringIO()
+
+
+  def tearDown(self):
+    sys.stderr = self.stderr
+    shell.loadCommand = self.loadCommand
+    os.environ.clear()
+    os.environ.update(self.environ)
+    GrokSession.adapter = self.adapter
+
+
+
+class TestExecute(ShellTestCase):
+  """ Test grokcli.commands.shell.execute() """
+
+  def testStatus(self):
+    self.assertEqual(shell.execute("metrics list  # comment"), 0)
+    self.assertEqual(self.command.calls[-1][0], ["list"])
+    self.assertEqual(shell.execute(""), 0)
+    self.assertEqual(shell.execute("metrics fail"), 1)
+    self.assertEqual(shell.execute("metrics exit"), 3)
+
+
+  def testErrors(self):
+    """ Errors are printed and fail the command, but aren't raised """
+    self.assertEqual(shell.execute("metrics raise"), 1)
+    self.assertEqual(shell.execute('metrics "unclosed'), 1)
+    self.assertEqual(shell.execute("nonexistent"), 1)
+    self.assertEqual(shell.execute("shell"), 1)
+
+    self.assertEqual(sys.stderr.getvalue().splitlines(),
+                     ["ERROR: Unexpected",
+                      "ERROR: No closing quotation",
+                      "ERROR: Unknown command: nonexistent",
+                      "ERROR: Unknown command: shell"])
+
+
+  def testRelativePath(self):
+    """ HTTP commands resolve a path against the session's server """
+    shell.startSession(["http://grok", "key"])
+    shell.execute("GET /_models")
+
+    self.assertEqual(self.command.calls[-1], ([], "http://grok/_models"))
+    self.assertEqual(os.environ["GROK_SERVER_URL"], "http://grok")
+
+
+
+class TestRunScript(ShellTestCase):
+  """ Test `grok run` """
+
+  script = "metrics list\n\n# comment\nmetrics raise\nmetrics exit\n"
+
+
+  def testStopsOnError(self):
+    run = loadCommand("run")
+    self.assertEqual(run.runScript(StringIO(self.script)), 1)
+    self.assertEqual(len(self.command.calls), 2)
+
+
+  def testKeepGoing(self):
+    """ With -k, every command runs, and the last failure is the status """
+    run = loadCommand("run")
+    self.assertEqual(run.runScript(StringIO(self.script), keepGoing=True), 3)
+    self.assertEqual(len(self.command.calls), 3)
+
+
+
+if __name__ == "__main__":
+  unittest.main()
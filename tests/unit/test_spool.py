@@ -0,0 +1,130 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.spool unit tests.
+"""
+import os
+import shutil
+import tempfile
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.spool import Spool
+
+
+
+class TestSpool(unittest.TestCase):
+  """ Test grokcli.spool.Spool """
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+
+  def _drain(self, spool, batchSize=None):
+    sent = []
+    spool.drain(sent.append, batchSize)
+    return "".join(sent)
+
+
+  def _segments(self):
+    return sorted(name for name in os.listdir(self.directory)
+                  if name.endswith(".spool"))
+
+
+  def testDrainInOrder(self):
+    """ Lines are drained in the order they were appended, then removed """
+    spool = Spool(self.directory, segmentSize=20)
+    for i in xrange(10):
+      spool.append("metric %d 1\n" % i)
+
+    self.assertGreater(len(self._segments()), 1)
+    self.assertEqual(self._drain(spool),
+                     "".join("metric %d 1\n" % i for i in xrange(10)))
+    self.assertEqual(spool.size(), 0)
+    self.assertEqual(self._segments(), [])
+
+
+  def testTornFinalLine(self):
+    """ A partial line left by a crash mid-append is discarded """
+    spool = Spool(self.directory)
+    spool.append("a 1 1\nb 2 2\n")
+
+    with open(os.path.join(self.directory, self._segments()[0]), "ab") as fp:
+      fp.write("c 3")
+
+    # Not drained...
+    self.assertEqual(self._drain(Spool(self.directory)), "a 1 1\nb 2 2\n")
+
+    # ...nor prepended to the next append
+    spool.append("a 1 1\nb 2 2\n")
+    with open(os.path.join(self.directory, self._segments()[0]), "ab") as fp:
+      fp.write("c 3")
+    spool.append("d 4 4\n")
+    self.assertEqual(self._drain(spool), "a 1 1\nb 2 2\nd 4 4\n")
+
+
+  def testOffsetCheckpointRecovery(self):
+    """ A drain interrupted by a failed send resumes after the last batch sent
+    """
+    spool = Spool(self.directory)
+    lines = ["metric %d 1\n" % i for i in xrange(5)]
+    spool.append("".join(lines))
+
+    sent = []
+    def send(data):
+      if sent:
+        raise IOError("Connection lost")
+      sent.append(data)
+
+    batchSize = len(lines[0]) * 2
+    with self.assertRaises(IOError):
+      spool.drain(send, batchSize)
+    self.assertEqual(sent, ["".join(lines[:2])])
+
+    # A new process picks up from the checkpoint
+    self.assertEqual(self._drain(Spool(self.directory), batchSize),
+                     "".join(lines[2:]))
+
+
+  def testSizeCapEvictsOldestSegments(self):
+    """ Appends beyond maxSize drop the oldest segments and count the loss """
+    line = "metric 1 1\n"
+    spool = Spool(self.directory, segmentSize=len(line) * 2,
+                  maxSize=len(line) * 4)
+    for i in xrange(6):
+      spool.append("metric %d 1\n" % i)
+
+    self.assertEqual(spool.droppedBytes, len(line) * 2)
+    self.assertEqual(self._drain(spool),
+                     "".join("metric %d 1\n" % i for i in xrange(2, 6)))
+
+
+  def testOversizedAppendDropped(self):
+    """ Data that can't fit in maxSize on its own is dropped """
+    spool = Spool(self.directory, maxSize=10)
+    self.assertFalse(spool.append("metric 1 1\nmetric 2 2\n"))
+    self.assertEqual(spool.droppedBytes, 22)
+    self.assertEqual(self._drain(spool), "")
+
+
+
+if __name__ == "__main__":
+  unittest.main()
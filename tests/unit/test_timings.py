@@ -0,0 +1,176 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.timings unit tests.
+"""
+from datetime import timedelta
+from StringIO import StringIO
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from requests.models import Request, Response
+
+from grokcli.timings import endpointTemplate, Histogram, Timings
+
+
+
+def fakeResponse(method, url, content, status=200):
+  response = Response()
+  response.status_code = status
+  response.url = url
+  response.request = Request(method, url)
+  response.elapsed = timedelta(milliseconds=5)
+  response.raw = StringIO(content)
+  return response
+
+
+
+class TestHistogram(unittest.TestCase):
+  """ Test grokcli.timings.Histogram """
+
+  def testEmpty(self):
+    histogram = Histogram()
+    self.assertEqual(histogram.count, 0)
+    self.assertIsNone(histogram.mean)
+    self.assertIsNone(histogram.percentile(50))
+
+
+  def testPercentiles(self):
+    """ Percentiles are within `growth` of the exact values """
+    histogram = Histogram()
+    values = [i / 1000.0 for i in xrange(1, 1001)]
+    for value in reversed(values):
+      histogram.add(value)
+
+    self.assertEqual(histogram.count, 1000)
+    self.assertEqual((histogram.min, histogram.max), (0.001, 1.0))
+    self.assertAlmostEqual(histogram.mean, 0.5005)
+
+    for percent in (1, 50, 90, 99):
+      exact = values[percent * 10 - 1]
+      self.assertLessEqual(histogram.percentile(percent),
+                           exact * histogram.growth)
+      self.assertGreaterEqual(histogram.percentile(percent),
+                              exact / histogram.growth)
+
+    self.assertEqual(histogram.percentile(100), 1.0)
+
+
+  def testZero(self):
+    """ Values below the resolution, including 0, share the lowest bucket """
+    histogram = Histogram()
+    for value in (0, 0, 0, 5):
+      histogram.add(value)
+
+    self.assertLessEqual(histogram.percentile(50), histogram.resolution)
+    self.assertEqual(histogram.percentile(100), 5)
+    self.assertEqual(histogram.summary()["p99"], 5)
+
+
+  def testMerge(self):
+    merged = Histogram()
+    merged.merge(Histogram())
+    self.assertEqual(merged.count, 0)
+
+    (low, high) = (Histogram(), Histogram())
+    for value in (0.001, 0.002):
+      low.add(value)
+    high.add(1.0)
+    merged.merge(low)
+    merged.merge(high)
+
+    self.assertEqual(merged.count, 3)
+    self.assertEqual((merged.min, merged.max), (0.001, 1.0))
+    self.assertAlmostEqual(merged.mean, 1.003 / 3)
+    self.assertLessEqual(merged.percentile(50), 0.002 * merged.growth)
+    self.assertEqual(merged.percentile(100), 1.0)
+
+
+
+class TestTimings(unittest.TestCase):
+  """ Test grokcli.timings.Timings """
+
+  def testEndpointTemplate(self):
+    self.assertEqual(
+      endpointTemplate("GET", "https://host/_models/abc123/export"),
+      "GET /_models/*/export")
+    self.assertEqual(
+      endpointTemplate("POST", "https://host/_metrics/cloudwatch/us-east-1/"
+                               "AWS/EC2?tags=1"),
+      "POST /_metrics/cloudwatch/*/*/*")
+
+
+  def testTimeRequest(self):
+    timings = Timings()
+    samples = []
+    timings.addObserver(lambda endpoint, sample: samples.append(endpoint))
+
+    def send(method, url, **kwargs):
+      return fakeResponse(method, url, "[1, 2, 3]")
+
+    response = timings.timeRequest(send, "GET", "https://host/_models/abc")
+    self.assertEqual(response.content, "[1, 2, 3]")
+    timings.timeRequest(send, "GET", "https://host/_models/def")
+
+    summary = timings.summary()["GET /_models/*"]
+    self.assertEqual(summary["requests"], 2)
+    self.assertEqual(summary["bytes"], 18)
+    self.assertEqual(summary["statuses"], {200: 2})
+    self.assertEqual(sorted(summary["phases"]),
+                     ["connect", "total", "transfer", "ttfb"])
+    self.assertEqual(samples, ["GET /_models/*"] * 2)
+
+
+  def testStreamed(self):
+    """ A streamed body is timed once it has been read, and decoding timed
+        separately
+    """
+    timings = Timings()
+
+    def send(method, url, **kwargs):
+      return fakeResponse(method, url, "[1, 2, 3]")
+
+    response = timings.timeRequest(send, "GET", "https://host/_models",
+                                   stream=True)
+    stats = timings.endpoints["GET /_models"]
+    self.assertEqual(stats.requests, 1)
+    self.assertEqual(stats.bytes, 0)
+    self.assertEqual(stats.phases["total"].count, 0)
+
+    chunks = response.iter_content(2)
+    items = timings.timeStreamDecode(response, iter(list(chunks)))
+    self.assertEqual("".join(items), "[1, 2, 3]")
+
+    self.assertEqual(stats.requests, 1)
+    self.assertEqual(stats.bytes, 9)
+    for phase in ("ttfb", "transfer", "decode", "total"):
+      self.assertEqual(stats.phases[phase].count, 1, phase)
+
+
+  def testReport(self):
+    timings = Timings()
+    timings.record("GET /_models", {"status": 200, "ttfb": 0.01,
+                                    "total": 0.02, "bytes": 100})
+    fp = StringIO()
+    timings.report(fp)
+    self.assertIn("GET /_models", fp.getvalue())
+    self.assertIn("200:1", fp.getvalue())
+
+
+
+if __name__ == "__main__":
+  unittest.main()
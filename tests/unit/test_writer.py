@@ -0,0 +1,212 @@
+#------------------------------------------------------------------------------
+# Copyright 2013-2014 Avik Partners, LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#------------------------------------------------------------------------------
+""" grokcli.writer unit tests.
+"""
+import shutil
+import socket
+import tempfile
+import threading
+import time
+try:
+  import unittest2 as unittest
+except ImportError:
+  import unittest # Python 2.7's unittest has unittest2's features
+
+from grokcli.spool import Spool
+from grokcli.writer import CustomMetricWriter
+
+
+
+class LineServer(object):
+  """ Custom Metric endpoint on localhost recording the data it receives """
+
+  def __init__(self):
+    self.data = []
+    self._listener = socket.socket()
+    self._listener.bind(("127.0.0.1", 0))
+    self._listener.listen(5)
+    self.port = self._listener.getsockname()[1]
+    self._thread = threading.Thread(target=self._serve)
+    self._thread.daemon = True
+    self._thread.start()
+
+
+  def _serve(self):
+    while True:
+      try:
+        (conn, _) = self._listener.accept()
+      except socket.error:
+        return
+
+      while True:
+        data = conn.recv(65536)
+        if not data:
+          break
+        self.data.append(data)
+      conn.close()
+
+
+  def close(self):
+    self._listener.close()
+
+
+  def lines(self):
+    return "".join(self.data).splitlines()
+
+
+
+def unusedPort():
+  """ Return a port that nothing is listening on """
+  listener = socket.socket()
+  listener.bind(("127.0.0.1", 0))
+  port = listener.getsockname()[1]
+  listener.close()
+  return port
+
+
+
+class TestCustomMetricWriter(unittest.TestCase):
+  """ Test grokcli.writer.CustomMetricWriter """
+
+  def setUp(self):
+    self.server = LineServer()
+
+
+  def tearDown(self):
+    self.server.close()
+
+
+  def writer(self, port=None, **kwargs):
+    kwargs.setdefault("flushInterval", 0)
+    return CustomMetricWriter("127.0.0.1", port or self.server.port,
+                              **kwargs)
+
+
+  def testBuffering(self):
+    """ Lines are sent once bufferSize bytes are pending, and on close """
+    writer = self.writer(bufferSize=40)
+    writer.write("a", 1, 100)
+    writer.write("b", 2, 200)
+    self.assertEqual(writer.flushes, 0)
+
+    # 40 bytes pending
+    for i in xrange(3):
+      writer.write("c", i, 300)
+    self.assertEqual(writer.flushes, 1)
+    self.assertEqual(writer.linesSent, 5)
+    writer.write("c", 3, 300)
+    self.assertEqual(writer.linesSent, 5)
+
+    writer.close()
+    self.assertEqual(self.server.lines(),
+                     ["a 1 100", "b 2 200"] +
+                     ["c %d 300" % i for i in xrange(4)])
+    self.assertEqual(writer.stats()["linesSent"], 6)
+    self.assertEqual(writer.stats()["flushLatency"]["count"], 2)
+
+
+  def testPeriodicFlush(self):
+    writer = self.writer(flushInterval=0.05)
+    writer.write("a", 1, 100)
+
+    deadline = time.time() + 5
+    while not self.server.data and time.time() < deadline:
+      time.sleep(0.01)
+
+    self.assertEqual(self.server.lines(), ["a 1 100"])
+    writer.close()
+
+
+  def testUnreachable(self):
+    """ Without a spool, unsent lines stay buffered, up to maxBufferSize """
+    writer = self.writer(port=unusedPort(), bufferSize=8, maxBufferSize=40)
+    writer.retryInterval = 60
+
+    with self.assertRaises(socket.error):
+      writer.write("a", 1, 100)
+
+    # Not retried until retryInterval has passed; the oldest lines are dropped
+    for i in xrange(10):
+      writer.write("b", i, 200)
+    self.assertEqual(writer.linesSent, 0)
+    self.assertEqual(writer.linesDropped, 6)
+
+    with self.assertRaises(socket.error):
+      writer.flush()
+
+    # Sent once the endpoint is reachable
+    writer.port = self.server.port
+    writer.close()
+    self.assertEqual(self.server.lines(),
+                     ["b %d 200" % i for i in xrange(5, 10)])
+
+
+  def testSpool(self):
+    """ With a spool, unsent lines are spooled, and replayed in order ahead of
+        new lines once the endpoint is reachable
+    """
+    directory = tempfile.mkdtemp()
+    try:
+      writer = self.writer(port=unusedPort(), bufferSize=8,
+                           spool=Spool(directory))
+      for i in xrange(3):
+        writer.write("a", i, 100)
+      self.assertEqual(writer.linesSpooled, 3)
+      self.assertEqual(writer.linesSent, 0)
+
+      writer.port = self.server.port
+      writer.retryInterval = 0
+      writer._retryAfter = 0
+      writer.write("b", 1, 200)
+      writer.close()
+
+      self.assertEqual(self.server.lines(),
+                       ["a 0 100", "a 1 100", "a 2 100", "b 1 200"])
+      self.assertEqual(writer.linesReplayed, 3)
+      self.assertEqual(writer.linesSent, 1)
+    finally:
+      shutil.rmtree(directory)
+
+
+  def testWriteDoesNotWaitForSend(self):
+    """ A write doesn't block on a send in progress in another thread """
+    writer = self.writer(bufferSize=8)
+    sending = threading.Event()
+    done = threading.Event()
+
+    def send():
+      with writer._sendLock:
+        sending.set()
+        done.wait(5)
+
+    thread = threading.Thread(target=send)
+    thread.start()
+    sending.wait(5)
+    try:
+      for i in xrange(3):
+        writer.write("a", i, 100)
+      self.assertEqual(writer.flushes, 0)
+    finally:
+      done.set()
+      thread.join()
+
+    writer.close()
+    self.assertEqual(len(self.server.lines()), 3)
+
+
+
+if __name__ == "__main__":
+  unittest.main()